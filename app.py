@@ -1,9 +1,40 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+import time
+_BOOT_STARTED = time.perf_counter()  # first line so boot time includes every import
+
+from flask import Flask, Response, abort, g, render_template, request, jsonify, send_from_directory, session, redirect, url_for
 import json
 import os
+from functools import wraps
 from datetime import datetime, timedelta
+import gc
 import hashlib
 import secrets
+import threading
+from urllib.parse import urlencode
+
+import click
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from badges import BADGE_ENGINE
+from broadcast import LeaderboardBroadcaster, public_rows
+from invalidation import ALL_KEYS, InvalidationBus, KeyedCache
+from fragment_cache import FragmentCache, FragmentCacheExtension
+from sharding import ShardRouter, merge_top, parse_nodes, rebalance
+from snapshots import SnapshotReader, SnapshotWriter
+from ratelimit import WriteAdmission, retry_after_header
+from stale import StaleWhileRevalidate
+from jobs import JobQueue
+from outbox import EmailOutbox, FileTransport, SMTPTransport, SendGridTransport
+from reset_tokens import ResetTokenStore
+from locking import StoreLock
+from metrics import BYTE_BUCKETS, Metrics
+from preload import PreloadedStore
+from search import UserSearchIndex, merge_pages
+from passwords import PasswordHasher
+from user_session import AvatarStore, UserVersions
+from email_index import EmailIndex, normalize_email
+from profiling import RequestProfiler
 
 app = Flask(__name__)
 app.secret_key = 'brain-games-secret-key-2025'
@@ -12,6 +43,29 @@ app.config['SESSION_COOKIE_SECURE'] = False
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
+class PublicAwareSessionInterface(SecureCookieSessionInterface):
+    """The signed cookie session, minus the cookie on responses that set g.public_response.
+
+    Permanent sessions re-send the cookie (with a new timestamp) and add
+    Vary: Cookie on every response, which stops browsers and CDNs from
+    reusing long-lived responses that hold nothing per user.
+    """
+
+    def save_session(self, app, session, response):
+        if g.get('public_response'):
+            return
+        super().save_session(app, session, response)
+
+app.session_interface = PublicAwareSessionInterface()
+
+# Behind Render's or Fly's proxy every request comes from the proxy; with
+# TRUSTED_PROXIES=<hops> the client address (per-IP limits) and scheme come
+# from X-Forwarded-For/-Proto instead. Unset, those headers are ignored, as
+# anyone can send them.
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
 """ Commented out for now since we're running locally without Docker. If we switch to Docker, we can uncomment these and update the file paths.
 USERS_FILE = '/data/users.json'
 SCORES_FILE = '/data/scores.json'
@@ -22,222 +76,511 @@ DATA_DIR = os.getenv('DATA_DIR', '.')  # Default to current dir locally, /data o
 USERS_FILE = os.path.join(DATA_DIR, 'users.json')
 SCORES_FILE = os.path.join(DATA_DIR, 'scores.json')
 RESET_TOKENS_FILE = os.path.join(DATA_DIR, 'reset_tokens.json')
+AGGREGATES_FILE = os.path.join(DATA_DIR, 'aggregates.json')
+BADGES_FILE = os.path.join(DATA_DIR, 'badges.json')
+JOBS_DB = os.path.join(DATA_DIR, 'jobs.sqlite3')
+RESET_TOKENS_DB = os.path.join(DATA_DIR, 'reset_tokens.sqlite3')
+OUTBOX_DB = os.path.join(DATA_DIR, 'outbox.sqlite3')
+USER_VERSIONS_DB = os.path.join(DATA_DIR, 'user_versions.sqlite3')
+EMAIL_INDEX_DB = os.path.join(DATA_DIR, 'email_index.sqlite3')
+AVATARS_DIR = os.path.join(DATA_DIR, 'avatars')
+BUS_DB = os.path.join(DATA_DIR, 'invalidation.sqlite3')
+LEADERBOARD_SNAPSHOT_FILE = os.path.join(DATA_DIR, 'leaderboards.snapshot')
+PROFILES_DIR = os.path.join(DATA_DIR, 'profiles')
+# Shared-memory map for write rate limits; /dev/shm keeps it off the data volume
+RATE_LIMIT_FILE = os.getenv('RATE_LIMIT_FILE', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else DATA_DIR,
+    'brain-games-ratelimit-' + hashlib.md5(os.path.abspath(DATA_DIR).encode()).hexdigest()[:8]))
+
+GAME_TYPES = ['memory', 'problem_solving', 'tbi_memory', 'stroop_test']
+
+# Sharding is off unless SHARD_NODES lists more than one node, e.g.
+#   SHARD_NODES=a=http://10.0.0.1:8080,b=http://10.0.0.2:8080 SHARD_SELF=a
+# Each node keeps only the users the hash ring assigns to it in its DATA_DIR.
+# SHARD_SECRET (shared by all nodes) is required once sharding is on.
+shard_router = ShardRouter(
+    os.getenv('SHARD_SELF'),
+    parse_nodes(os.getenv('SHARD_NODES', '')),
+    os.getenv('SHARD_SECRET'),
+    vnodes=int(os.getenv('SHARD_VNODES', '64'))
+)
+
+# ============================================================================
+# STORAGE LOCKS
+# ============================================================================
+
+# Every JSON store is read whole and rewritten whole, so each load-modify-save
+# holds its store's write lock and loads hold the read lock. The locks work
+# across threads (gthread), greenlets (gevent) and worker processes. Nest
+# them only in this order: users, scores, aggregates, badges.
+users_lock = StoreLock(USERS_FILE)
+scores_lock = StoreLock(SCORES_FILE)
+aggregates_lock = StoreLock(AGGREGATES_FILE)
+badges_lock = StoreLock(BADGES_FILE)
+
+def _write_json(path, data, indent=None):
+    """Write JSON via a temp file and rename so readers never see a partial file"""
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+# Exposed at /metrics. With several gunicorn workers, METRICS_DIR must point
+# at a directory they share (gunicorn.conf.py sets one) so a scrape of any
+# worker reports the totals of all of them.
+metrics = Metrics(os.getenv('METRICS_DIR') or None)
+REQUEST_LATENCY = metrics.histogram('brain_games_request_duration_seconds', 'Request latency by route', ('route', 'method'))
+REQUESTS = metrics.counter('brain_games_requests_total', 'Requests by route and status', ('route', 'method', 'status'))
+REQUESTS_IN_FLIGHT = metrics.gauge('brain_games_requests_in_flight', 'Requests currently being handled')
+STORAGE_LATENCY = metrics.histogram('brain_games_storage_duration_seconds', 'JSON file load/save time', ('file', 'op'))
+STORAGE_BYTES = metrics.histogram('brain_games_storage_bytes', 'JSON file size at load/save', ('file', 'op'), buckets=BYTE_BUCKETS)
+SCORES_SUBMITTED = metrics.counter('brain_games_scores_submitted_total', 'Scores saved per game', ('game',))
+
+def timed_storage(name, op, path):
+    """Decorator recording the duration and file size of a JSON load/save"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = 0
+                STORAGE_LATENCY.observe(duration, name, op)
+                STORAGE_BYTES.observe(size, name, op)
+                request_profiler.record_storage(name, op, duration, size)
+        return decorated_function
+    return decorator
+
+# ============================================================================
+# PROFILING
+# ============================================================================
+
+# Off by default. PROFILE_SAMPLE_RATE runs that fraction of requests under
+# cProfile; PROFILE_SLOW_MS stack-samples any request still running after
+# that many milliseconds. Both record the request's storage calls and are
+# kept (newest PROFILE_KEEP) in DATA_DIR/profiles, viewable at /admin/profiles
+# by the users listed in ADMIN_EMAILS.
+request_profiler = RequestProfiler(
+    os.getenv('PROFILE_DIR', PROFILES_DIR),
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+    slow_ms=float(os.getenv('PROFILE_SLOW_MS', '0')),
+    keep=int(os.getenv('PROFILE_KEEP', '200'))
+)
+ADMIN_EMAILS = {e.strip() for e in os.getenv('ADMIN_EMAILS', '').split(',') if e.strip()}
+
+# Registered before every other hook so forwarded and rejected requests count too
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+    request_profiler.begin(request.method, request.url_rule.rule if request.url_rule else 'unmatched')
+
+@app.after_request
+def record_request(response):
+    if 'request_started' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - g.request_started, route, request.method)
+        REQUESTS.inc(route, request.method, str(response.status_code))
+        request_profiler.end(response.status_code, session.get('user_id'))
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    if g.pop('request_started', None) is not None:
+        REQUESTS_IN_FLIGHT.dec()
+        # No-op unless the request failed before after_request ran
+        request_profiler.end(500, session.get('user_id'))
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+def has_metrics_token():
+    token = os.getenv('METRICS_TOKEN')
+    return bool(token) and secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+def operator_required(f):
+    """Decorator for operational JSON endpoints: admins or a METRICS_TOKEN bearer; anyone else gets a 404"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('user_id') not in ADMIN_EMAILS and not has_metrics_token():
+            abort(404)
+        return f(*args, **kwargs)
+    return decorated_function
+
+def admin_required(f):
+    """Decorator for admin-only pages; anyone else gets a 404"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('user_id') not in ADMIN_EMAILS:
+            abort(404)
+        return f(*args, **kwargs)
+    return decorated_function
+
+# ============================================================================
+# PASSWORDS
+# ============================================================================
+
+# Salted scrypt. SCRYPT_N/R/P set the cost; stored hashes made with other
+# parameters (or the old unsalted SHA-256) are upgraded at the next login.
+# Hashing runs on PASSWORD_HASH_WORKERS low-priority processes per worker
+# (threads under gevent; 0 hashes inline), so a burst of logins doesn't
+# starve the game routes.
+password_hasher = PasswordHasher(
+    n=int(os.getenv('SCRYPT_N', str(2 ** 14))),
+    r=int(os.getenv('SCRYPT_R', '8')),
+    p=int(os.getenv('SCRYPT_P', '1')),
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', '1'))
+)
+PASSWORD_HASH_SECONDS = metrics.histogram('brain_games_password_hash_seconds', 'Password hash/verify time, pool wait included', ('op',))
+
+def hash_password(password, offload=True):
+    start = time.perf_counter()
+    try:
+        return password_hasher.hash(password, offload)
+    finally:
+        PASSWORD_HASH_SECONDS.observe(time.perf_counter() - start, 'hash')
+
+def check_password(password, stored):
+    """Return (matches, needs_rehash) for a stored hash"""
+    start = time.perf_counter()
+    try:
+        return password_hasher.verify(password, stored)
+    finally:
+        PASSWORD_HASH_SECONDS.observe(time.perf_counter() - start, 'verify')
 
 # Initialize default users
 def init_default_users():
+    """Add any missing default accounts to users.json; returns how many were added.
+
+    Idempotent: the file is only rewritten (atomically) when an account is
+    actually missing, so repeated boots and concurrent workers don't write.
+    """
     default_users = {
         "demo@inference.app": {
-            "password": hash_password("demo123"),
+            "password": "demo123",
             "display_name": "Demo User",
             "created_at": "2025-12-16 12:00:00",
             "avatar": None
         },
         "email@ctoddlombardo.com": {
-            "password": hash_password("123456"),
+            "password": "123456",
             "display_name": "C TODD LOMBARDO",
             "created_at": "2025-12-17 18:25:23",
             "avatar": None
         }
     }
     
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r') as f:
-                users = json.load(f)
-            # Merge default users into existing file
-            for email, data in default_users.items():
-                if email not in users:
-                    users[email] = data
-            with open(USERS_FILE, 'w') as f:
-                json.dump(users, f, indent=2)
-        except:
-            with open(USERS_FILE, 'w') as f:
-                json.dump(default_users, f, indent=2)
-    else:
-        with open(USERS_FILE, 'w') as f:
-            json.dump(default_users, f, indent=2)
-
-init_default_users()
+    with users_lock.write():
+        users = {}
+        if os.path.exists(USERS_FILE):
+            try:
+                with open(USERS_FILE, 'r') as f:
+                    users = json.load(f)
+            except Exception as e:
+                # Never replace an unreadable file; it may hold every account
+                print(f"[ERROR] Not seeding default users, failed to read {USERS_FILE}: {e}")
+                return 0
+        
+        # Hashed inline: this runs at startup, often in the gunicorn master
+        missing = {email: dict(data, password=hash_password(data['password'], offload=False))
+                   for email, data in default_users.items()
+                   if email not in users and shard_router.is_local(email)}
+        if missing:
+            users.update(missing)
+            _write_json(USERS_FILE, users, indent=2)
+            for email in missing:
+                email_index.claim(email, email)
+    return len(missing)
 
 # ============================================================================
 # USER FUNCTIONS
 # ============================================================================
 
+@timed_storage('users', 'load', USERS_FILE)
 def load_users():
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    with users_lock.read():
+        if os.path.exists(USERS_FILE):
+            try:
+                with open(USERS_FILE, 'r') as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {}
 
+@timed_storage('users', 'save', USERS_FILE)
 def save_users(users):
     try:
-        with open(USERS_FILE, 'w') as f:
-            json.dump(users, f, indent=2)
+        with users_lock.write():
+            _write_json(USERS_FILE, users, indent=2)
         return True
     except Exception as e:
         print(f"[ERROR] Failed to save users: {e}")
         return False
 
+# ============================================================================
+# EMAIL INDEX
+# ============================================================================
+
+# Users stay keyed by the email as first entered; this index maps the
+# case-normalized email to that key. It is built from users.json on first
+# boot (reporting case collisions, see `flask email-index`) and kept up to
+# date by create_user, delete_user_data and import_user_data.
+email_index = EmailIndex(EMAIL_INDEX_DB)
+
+def find_user(email):
+    """Return (user_id, record) for the account `email` refers to, ignoring case.
+
+    The index names the account first, so an unknown email costs one SQLite
+    read and a known one a single read of the user store.
+    """
+    email = (email or '').strip()
+    owner = email_index.lookup(email) if email else None
+    if owner is None:
+        return None, None
+    # An exact match wins, so both halves of an old case collision can log in
+    candidates = [email, owner] if owner != email else [owner]
+    users = fetch_users(candidates)
+    for user_id in candidates:
+        if users[user_id] is not None:
+            return user_id, users[user_id]
+    return None, None
+
+def resolve_user_id(email):
+    return find_user(email)[0]
+
+def rebuild_email_index():
+    """Rebuild the index from users.json and return the case collisions found"""
+    with users_lock.read():
+        collisions = email_index.rebuild(load_users())
+    for normalized, user_ids in collisions.items():
+        print(f"[ERROR] Accounts differing only in case: {', '.join(user_ids)} ({user_ids[0]} owns {normalized})")
+    return collisions
+
+# Display names appear on every leaderboard and ride in the session cookie
+DISPLAY_NAME_MAX_LENGTH = 40
+app.jinja_env.globals['DISPLAY_NAME_MAX_LENGTH'] = DISPLAY_NAME_MAX_LENGTH
+
+def display_name_error(display_name):
+    """Why a display name can't be used, or None if it can"""
+    if not display_name or len(display_name) < 2:
+        return 'Display name must be at least 2 characters'
+    if len(display_name) > DISPLAY_NAME_MAX_LENGTH:
+        return f'Display name must be at most {DISPLAY_NAME_MAX_LENGTH} characters'
+    return None
+
 def create_user(email, password, display_name):
-    users = load_users()
-    if email in users:
+    if resolve_user_id(email):
         return False, "Email already exists"
-    users[email] = {
-        'password': hash_password(password),
-        'display_name': display_name,
-        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'avatar': None
-    }
-    save_users(users)
+    # Hash before taking the lock so slow hashing doesn't hold up other writers
+    password_hash = hash_password(password)
+    with users_lock.write():
+        users = load_users()
+        if email in users:
+            return False, "Email already exists"
+        owner = email_index.claim(email, email)
+        if owner != email:
+            if owner in users:
+                return False, "Email already exists"
+            # Left behind by an account removed without updating the index
+            email_index.assign(email, email)
+        users[email] = {
+            'password': password_hash,
+            'display_name': display_name,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'avatar': None
+        }
+        save_users(users)
+    publish_changes(f'user:{email}')
     return True, "Account created"
 
 def verify_user(email, password):
-    users = load_users()
-    if email not in users:
+    """Return (True, user_id) if the password matches, else (False, reason)"""
+    user_id, user = find_user(email)
+    if user is None:
         return False, "User not found"
-    if users[email]['password'] != hash_password(password):
+    matches, needs_rehash = check_password(password, user['password'])
+    if not matches:
         return False, "Wrong password"
-    return True, users[email]
+    if needs_rehash:
+        rehash_password(user_id, user['password'], password)
+    return True, user_id
 
-def get_current_user():
-    if 'user_id' in session:
+def rehash_password(email, old_hash, password):
+    """Upgrade a legacy or outdated hash after a successful login"""
+    new_hash = hash_password(password)
+    with users_lock.write():
         users = load_users()
-        if session['user_id'] in users:
-            return session['user_id'], users[session['user_id']]
-    return None, None
+        # Skip if the password changed while we were hashing
+        if email not in users or users[email]['password'] != old_hash:
+            return
+        users[email]['password'] = new_hash
+        save_users(users)
+    publish_changes(f'user:{email}')
 
 # ============================================================================
-# PASSWORD RESET FUNCTIONS
+# SESSION USER
 # ============================================================================
 
-def load_reset_tokens():
-    if os.path.exists(RESET_TOKENS_FILE):
-        try:
-            with open(RESET_TOKENS_FILE, 'r') as f:
-                content = f.read().strip()
-                if content:
-                    return json.loads(content)
-                return {}
-        except Exception as e:
-            print(f"[ERROR] Failed to load reset tokens: {e}")
-            return {}
-    return {}
+# Pages only need the signed-in user's display name and avatar, so the session
+# cookie (signed by Flask) carries a snapshot of them stamped with the user's
+# version. Checking the stamp is one SQLite read; the user store is only read
+# again after something bumps the version (profile edits, avatar uploads,
+# deletion). Writers bump after publish_changes(), so a worker that sees the
+# new version can sync the invalidation bus and reload fresh data.
+user_versions = UserVersions(USER_VERSIONS_DB)
+avatar_store = AvatarStore(AVATARS_DIR)
+
+def session_user(snapshot):
+    return {
+        'display_name': snapshot['name'],
+        'avatar': url_for('avatar', name=snapshot['avatar']) if snapshot['avatar'] else None
+    }
+
+def get_current_user():
+    """Return (user_id, {'display_name', 'avatar'}) for the signed-in user, else (None, None)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None, None
+    version = user_versions.get(user_id)
+    snapshot = session.get('user_snapshot')
+    if snapshot and snapshot['id'] == user_id and snapshot['version'] == version:
+        return user_id, session_user(snapshot)
+    
+    invalidation_bus.sync()
+    user = user_directory.get(user_id)
+    if user is None:
+        return None, None
+    session['user_snapshot'] = snapshot = {
+        'id': user_id,
+        # Capped for names saved before DISPLAY_NAME_MAX_LENGTH existed
+        'name': user['display_name'][:DISPLAY_NAME_MAX_LENGTH],
+        'avatar': avatar_store.store(user.get('avatar')),
+        'version': version
+    }
+    return user_id, session_user(snapshot)
 
-def save_reset_tokens(tokens):
+def bump_user_version(user_id):
+    """Invalidate every session snapshot of this user; call after publish_changes()"""
     try:
-        with open(RESET_TOKENS_FILE, 'w') as f:
-            json.dump(tokens, f, indent=2)
-        return True
+        user_versions.bump(user_id)
     except Exception as e:
-        print(f"[ERROR] Failed to save reset tokens: {e}")
-        return False
+        print(f"[ERROR] Failed to bump version for {user_id}: {e}")
+
+# ============================================================================
+# PASSWORD RESET FUNCTIONS
+# ============================================================================
+
+# Tokens live in SQLite, one row each, so issuing or using a token writes
+# only that row. Expired tokens are rejected on lookup and purged in batches
+# by a sweeper thread in each worker (RESET_TOKEN_SWEEP_SECONDS, 0 disables).
+reset_tokens = ResetTokenStore(
+    RESET_TOKENS_DB,
+    ttl=float(os.getenv('RESET_TOKEN_TTL_HOURS', '24')) * 3600,
+    sweep_interval=float(os.getenv('RESET_TOKEN_SWEEP_SECONDS', '300')),
+    batch_size=int(os.getenv('RESET_TOKEN_SWEEP_BATCH', '500')),
+    legacy_file=RESET_TOKENS_FILE
+)
+
+metrics.callback('brain_games_reset_token_ops_total', 'Reset tokens created, consumed, revoked and swept', 'counter', ('op',),
+                 lambda: {(op,): n for op, n in reset_tokens.counters().items()})
 
 def create_reset_token(email):
     """Create a password reset token for a user"""
-    users = load_users()
-    if email not in users:
+    user_id = resolve_user_id(email)
+    if user_id is None:
         return None
-    
-    token = secrets.token_urlsafe(32)
-    tokens = load_reset_tokens()
-    
-    tokens[token] = {
-        'email': email,
-        'created_at': datetime.now().isoformat(),
-        'expires_at': (datetime.now() + timedelta(hours=24)).isoformat()
-    }
-    save_reset_tokens(tokens)
-    return token
+    return reset_tokens.create(user_id)
 
 def verify_reset_token(token):
     """Verify a password reset token and return email if valid"""
-    tokens = load_reset_tokens()
-    if token not in tokens:
-        return None
-    
-    token_data = tokens[token]
-    try:
-        expires_at = datetime.fromisoformat(token_data['expires_at'])
-    except:
-        return None
-    
-    if datetime.now() > expires_at:
-        # Token expired, delete it
-        del tokens[token]
-        save_reset_tokens(tokens)
-        return None
-    
-    return token_data['email']
+    return reset_tokens.lookup(token)
 
 def reset_password(token, new_password):
     """Reset password using a valid token"""
-    email = verify_reset_token(token)
-    if not email:
+    if not reset_tokens.lookup(token):
         return False, "Invalid or expired token"
     
-    users = load_users()
-    users[email]['password'] = hash_password(new_password)
-    save_users(users)
+    password_hash = hash_password(new_password)
+    # Consuming is a single DELETE, so of two concurrent resets only one wins
+    email = reset_tokens.consume(token)
+    if not email:
+        return False, "Invalid or expired token"
+    with users_lock.write():
+        users = load_users()
+        if email not in users:
+            return False, "Invalid or expired token"
+        users[email]['password'] = password_hash
+        save_users(users)
+    publish_changes(f'user:{email}')
     
-    # Delete the token
-    tokens = load_reset_tokens()
-    if token in tokens:
-        del tokens[token]
-        save_reset_tokens(tokens)
+    # Any other outstanding links for this account are now stale
+    reset_tokens.revoke(email)
+    send_password_changed(email, users[email])
     
     return True, "Password reset successful"
 
+def send_password_changed(email, user):
+    send_email('password_changed', email, 'Your Brain Games password was changed', 'password_changed',
+               display_name=user.get('display_name', email),
+               forgot_link=url_for('forgot_password', _external=True))
+
 # ============================================================================
 # SCORE FUNCTIONS
 # ============================================================================
 
+@timed_storage('scores', 'load', SCORES_FILE)
 def load_scores():
-    if os.path.exists(SCORES_FILE):
-        try:
-            with open(SCORES_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    with scores_lock.read():
+        if os.path.exists(SCORES_FILE):
+            try:
+                with open(SCORES_FILE, 'r') as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {}
 
+@timed_storage('scores', 'save', SCORES_FILE)
 def save_scores(scores):
-    with open(SCORES_FILE, 'w') as f:
-        json.dump(scores, f, indent=2)
+    with scores_lock.write():
+        _write_json(SCORES_FILE, scores, indent=2)
 
 def add_score(user_id, game_type, score, difficulty='medium'):
-    scores = load_scores()
-    if user_id not in scores:
-        scores[user_id] = {
-            'memory': [],
-            'problem_solving': [],
-            'tbi_memory': [],
-            'stroop_test': []
-        }
-    scores[user_id][game_type].append({
-        'score': score,
-        'difficulty': difficulty,
-        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    })
-    scores[user_id][game_type] = scores[user_id][game_type][-100:]
-    save_scores(scores)
+    with scores_lock.write():
+        scores = load_scores()
+        if user_id not in scores:
+            scores[user_id] = {
+                'memory': [],
+                'problem_solving': [],
+                'tbi_memory': [],
+                'stroop_test': []
+            }
+        played_at = datetime.now()
+        scores[user_id][game_type].append({
+            'score': score,
+            'difficulty': difficulty,
+            'date': played_at.strftime('%Y-%m-%d %H:%M:%S')
+        })
+        scores[user_id][game_type] = scores[user_id][game_type][-100:]
+        save_scores(scores)
+    keys = [f'scores:{user_id}']
+    if _leaderboard_affected(game_type, user_id, score):
+        keys.append(f'leaderboard:{game_type}')
+    publish_changes(*keys)
+    SCORES_SUBMITTED.inc(game_type)
+    # Aggregates and badges follow in the background
+    job_queue.enqueue('roll_up_score', {'user_id': user_id, 'game_type': game_type, 'score': score,
+                                        'played_at': played_at.isoformat(), 'score_id': secrets.token_hex(8)})
 
 def get_best_score(user_id, game_type):
-    scores = load_scores()
-    if user_id not in scores or not scores[user_id].get(game_type, []):
-        return 0
-    return max(s['score'] for s in scores[user_id][game_type])
+    return get_game_stats(user_id, game_type)['best']
 
-def get_game_stats(user_id, game_type):
-    scores = load_scores()
-    if user_id not in scores:
-        return {'best': 0, 'average': 0, 'total': 0}
-    game_scores = scores[user_id].get(game_type, [])
+def _game_stats(game_scores):
     if not game_scores:
         return {'best': 0, 'average': 0, 'total': 0}
     return {
@@ -246,15 +589,16 @@ def get_game_stats(user_id, game_type):
         'total': len(game_scores)
     }
 
+def get_game_stats(user_id, game_type):
+    return get_all_games_stats(user_id).get(game_type, _game_stats([]))
+
 def get_all_games_stats(user_id):
-    return {
-        'memory': get_game_stats(user_id, 'memory'),
-        'problem_solving': get_game_stats(user_id, 'problem_solving'),
-        'tbi_memory': get_game_stats(user_id, 'tbi_memory'),
-        'stroop_test': get_game_stats(user_id, 'stroop_test')
-    }
+    def compute():
+        user_scores = load_scores().get(user_id, {})
+        return {game_type: _game_stats(user_scores.get(game_type, [])) for game_type in GAME_TYPES}
+    return stats_cache.get(user_id, compute)
 
-def get_leaderboard(game_type, limit=10):
+def _local_leaderboard(game_type, limit):
     users = load_users()
     scores = load_scores()
     leaderboard = []
@@ -271,10 +615,797 @@ def get_leaderboard(game_type, limit=10):
     leaderboard.sort(key=lambda x: x['score'], reverse=True)
     return leaderboard[:limit]
 
+def _compute_leaderboard(game_type, limit):
+    if not shard_router.enabled:
+        return _local_leaderboard(game_type, limit)
+    # Global top-N is the top-N of every shard's top-N
+    results = shard_router.scatter(f'/internal/leaderboard/{game_type}?limit={limit}',
+                                   lambda: _local_leaderboard(game_type, limit))
+    return merge_top(results, limit, key=lambda entry: entry['score'])
+
+# Largest ?limit= served; every game caches one board of this size, and
+# smaller limits are prefixes of it
+LEADERBOARD_MAX_LIMIT = 100
+
+def get_leaderboard(game_type, limit=10):
+    board = leaderboard_cache.get(game_type, lambda: _compute_leaderboard(game_type, LEADERBOARD_MAX_LIMIT))
+    return board[:limit]
+
+def _leaderboard_affected(game_type, user_id, score):
+    """Whether a new score could change any cached top-N for a game.
+
+    Every process caches the same single board per game, so checking this
+    process's copy covers every limit served by any worker.
+    """
+    board = leaderboard_cache.peek(game_type)
+    if board is None or len(board) < LEADERBOARD_MAX_LIMIT:
+        return True
+    if any(entry['user_id'] == user_id for entry in board):
+        return True
+    return isinstance(score, (int, float)) and score >= board[-1]['score']
+
+# ============================================================================
+# CACHE INVALIDATION
+# ============================================================================
+
+# Per-process caches of derived data. Every write publishes the keys it
+# touched on the bus so all gunicorn workers drop exactly those entries:
+#   scores:<user_id>     per-user game stats
+#   user:<user_id>       per-user profile data
+#   leaderboard:<game>   top-N for one game
+#   badges:<user_id>     badges awarded to one user
+# Per-user caches keep at most CACHE_MAX_USERS users each, least recently
+# used first out, so a worker's memory doesn't grow with every user it sees
+CACHE_MAX_USERS = int(os.getenv('CACHE_MAX_USERS', '50000'))
+stats_cache = KeyedCache('stats', max_entries=CACHE_MAX_USERS)
+leaderboard_cache = KeyedCache('leaderboard')
+# Rendered public profile fragments, {(user_id, fragment): (version, html)},
+# at most PROFILE_CACHE_ENTRIES of them (four per profile)
+profile_fragments = KeyedCache('profile_fragments', max_entries=int(os.getenv('PROFILE_CACHE_ENTRIES', '10000')))
+# Aggregate version per user, so reading it doesn't re-parse aggregates.json
+# on every page view when PRELOAD_DATA is off
+aggregate_versions = KeyedCache('aggregate_versions', max_entries=CACHE_MAX_USERS)
+# `{% cache user_id, stats_version %}` blocks in the index and dashboard
+# templates. Entries are stamped with the user's aggregate version, which
+# every new score bumps, and are also dropped on scores:<user_id> because a
+# deleted and re-created account starts its version over.
+fragment_cache = FragmentCache('fragments', int(float(os.getenv('FRAGMENT_CACHE_MB', '32')) * 1024 * 1024))
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.jinja_env.fragment_cache = fragment_cache
+# Never keep a fragment rendered from stale fallback data
+app.jinja_env.fragment_cache_bypass = lambda: bool(g.get('stale_age'))
+invalidation_bus = InvalidationBus(BUS_DB)
+
+# Read-mostly per-user records served from memory when PRELOAD_DATA=1. Under
+# gunicorn with PRELOAD_APP=1 they are parsed once in the master and shared
+# copy-on-write by the workers (see gunicorn.conf.py); each worker re-reads
+# only the users invalidated since. Writes still go through the JSON files.
+PRELOAD_DATA = os.getenv('PRELOAD_DATA', '0') == '1'
+user_directory = PreloadedStore('users', load_users, enabled=PRELOAD_DATA)
+user_aggregates = PreloadedStore('aggregates', lambda: load_aggregates(), enabled=PRELOAD_DATA)
+
+def fetch_users(user_ids):
+    """{user_id: record or None}, reading users.json at most once"""
+    users = user_directory if PRELOAD_DATA else load_users()
+    return {user_id: users.get(user_id) for user_id in user_ids}
+
+# Display-name search for /api/users/search, built on first use (or in the
+# master with PRELOAD_DATA) and patched from user:<id> invalidations, so
+# signups, profile edits and deletions show up in every worker. Players are
+# only ever exposed by their public id, an HMAC of the user id. With
+# sharding, each node indexes the users it holds and search_players()
+# merges every node's matches.
+user_search = UserSearchIndex(app.secret_key, load_users, fetch_users)
+
+def search_players(query, offset, limit):
+    if not shard_router.enabled:
+        return user_search.search(query, offset, limit)
+    wanted = offset + limit + 1
+    results = shard_router.scatter(f"/internal/users/search?{urlencode({'q': query, 'limit': wanted})}",
+                                   lambda: user_search.matches(query, wanted))
+    return merge_pages(results, offset, limit)
+
+# Live top-N per game for /api/leaderboards/stream, refreshed whenever a
+# leaderboard key is invalidated by any worker.
+leaderboard_broadcaster = LeaderboardBroadcaster(get_leaderboard, GAME_TYPES)
+
+metrics.callback('brain_games_cache_hits_total', 'Derived-data cache hits', 'counter', ('cache',),
+                 lambda: {(c.name,): c.hits for c in (stats_cache, leaderboard_cache, profile_fragments, fragment_cache)})
+metrics.callback('brain_games_cache_misses_total', 'Derived-data cache misses', 'counter', ('cache',),
+                 lambda: {(c.name,): c.misses for c in (stats_cache, leaderboard_cache, profile_fragments, fragment_cache)})
+metrics.callback('brain_games_fragment_cache_bytes', 'Rendered template fragments held in memory', 'gauge', (),
+                 lambda: {(): fragment_cache.size})
+metrics.callback('brain_games_fragment_cache_evictions_total', 'Template fragments evicted to stay under FRAGMENT_CACHE_MB',
+                 'counter', (), lambda: {(): fragment_cache.evictions})
+metrics.callback('brain_games_preload_delta_entries', 'Records this worker re-read since preloading', 'gauge', ('store',),
+                 lambda: {(s.name,): s.delta_size for s in (user_directory, user_aggregates) if s.enabled})
+metrics.callback('brain_games_preload_reloads_total', 'File re-reads to refresh invalidated records', 'counter', ('store',),
+                 lambda: {(s.name,): s.reloads for s in (user_directory, user_aggregates) if s.enabled})
+
+def all_leaderboard_keys():
+    return [f'leaderboard:{game_type}' for game_type in GAME_TYPES]
+
+def publish_changes(*keys):
+    invalidation_bus.publish(*keys)
+    # Leaderboards span every shard, so other nodes must hear about them too
+    shared = [key for key in keys if key.startswith('leaderboard:')]
+    if shared and shard_router.enabled:
+        job_queue.enqueue('notify_shards', {'keys': shared})
+
+@invalidation_bus.subscribe
+def _on_invalidate(keys):
+    if ALL_KEYS in keys:
+        # Missed changes: nothing cached in this process can be trusted
+        stats_cache.clear()
+        leaderboard_cache.clear()
+        profile_fragments.clear()
+        aggregate_versions.clear()
+        fragment_cache.clear()
+        user_directory.invalidate_all()
+        user_aggregates.invalidate_all()
+        user_search.invalidate_all()
+        snapshot_writer.mark_dirty()
+        for game_type in GAME_TYPES:
+            leaderboard_broadcaster.mark_dirty(game_type)
+        return
+    for key in keys:
+        kind, _, ident = key.partition(':')
+        if kind == 'scores':
+            stats_cache.invalidate(ident)
+            user_aggregates.invalidate(ident)
+            profile_fragments.invalidate((ident, 'stats'))
+            profile_fragments.invalidate((ident, 'recent'))
+            aggregate_versions.invalidate(ident)
+            fragment_cache.invalidate(ident)
+            snapshot_writer.mark_dirty()
+        elif kind == 'badges':
+            profile_fragments.invalidate((ident, 'badges'))
+        elif kind == 'leaderboard':
+            leaderboard_cache.invalidate(ident)
+            leaderboard_broadcaster.mark_dirty(ident)
+        elif kind == 'user':
+            user_directory.invalidate(ident)
+            user_search.invalidate(ident)
+            profile_fragments.invalidate((ident, 'header'))
+            snapshot_writer.mark_dirty()
+
+# ============================================================================
+# LEADERBOARD SNAPSHOTS
+# ============================================================================
+
+# Full per-game rankings are rebuilt every SNAPSHOT_INTERVAL seconds (by one
+# worker) into a binary file that every worker maps read-only, so the pages
+# are shared instead of each worker holding its own copy. Sharded nodes only
+# hold part of the ranking and keep using scatter-gather instead.
+def build_snapshot_rankings():
+    return {game_type: _local_leaderboard(game_type, None) for game_type in GAME_TYPES}
+
+snapshot_writer = SnapshotWriter(LEADERBOARD_SNAPSHOT_FILE, build_snapshot_rankings,
+                                 interval=float(os.getenv('SNAPSHOT_INTERVAL', '5')))
+snapshot_reader = SnapshotReader(LEADERBOARD_SNAPSHOT_FILE)
+
+def _leaderboard_snapshot():
+    if shard_router.enabled:
+        return None
+    snapshot = snapshot_reader.get()
+    if snapshot is None or time.time() - snapshot.generated_at > snapshot_writer.max_age:
+        # No writer is keeping it fresh; compute live instead
+        return None
+    return snapshot
+
+def leaderboard_top(game_type, limit=10):
+    snapshot = _leaderboard_snapshot()
+    if snapshot is None:
+        return get_leaderboard(game_type, limit)
+    return snapshot.top(game_type, limit)
+
+def leaderboard_rank(user_id, game_type):
+    """Return (rank, entry) for a user in one game, or None if unranked"""
+    snapshot = _leaderboard_snapshot()
+    if snapshot is not None:
+        return snapshot.rank(game_type, user_id)
+    for i, entry in enumerate(_compute_leaderboard(game_type, None)):
+        if entry['user_id'] == user_id:
+            return i + 1, entry
+    return None
+
+# ============================================================================
+# STALE FALLBACK
+# ============================================================================
+
+# The read-heavy pages (/, /dashboard, /leaderboards) normally hit a cache or
+# the snapshot. On a miss they recompute from scores.json, which can stall
+# behind a large save_scores() rewrite. If that takes longer than
+# STALE_BUDGET_MS, the page is rendered from the last good result (marked with
+# an Age header) and the recompute finishes in the background.
+STALE_BUDGET = float(os.getenv('STALE_BUDGET_MS', '150')) / 1000
+stale_reads = StaleWhileRevalidate(max_stale=float(os.getenv('STALE_MAX_AGE', '300')))
+
+metrics.callback('brain_games_stale_reads_total', 'Page data read through the stale fallback', 'counter', ('result',),
+                 lambda: {('fresh',): stale_reads.served_fresh, ('stale',): stale_reads.served_stale})
+
+def _read_with_fallback(key, cached, compute):
+    value = cached()
+    if value is not None:
+        stale_reads.remember(key, value)
+        return value
+    if 'stale_deadline' not in g:
+        # One budget per request, however many values the page needs
+        g.stale_deadline = time.monotonic() + STALE_BUDGET
+    value, age = stale_reads.get(key, compute, g.stale_deadline)
+    if age:
+        g.stale_age = max(g.get('stale_age', 0), age)
+    return value
+
+def page_stats(user_id):
+    return _read_with_fallback(('stats', user_id), lambda: stats_cache.peek(user_id),
+                               lambda: get_all_games_stats(user_id))
+
+def stats_version(user_id):
+    """The user's aggregate version, which changes with every score they save"""
+    return aggregate_versions.get(user_id, lambda: (user_aggregates.get(user_id) or {}).get('version', 0))
+
+def page_leaderboard(game_type, limit=10):
+    def cached():
+        snapshot = _leaderboard_snapshot()
+        if snapshot is not None:
+            return snapshot.top(game_type, limit)
+        board = leaderboard_cache.peek(game_type)
+        return board[:limit] if board is not None else None
+    return _read_with_fallback(('leaderboard', game_type, limit), cached,
+                               lambda: get_leaderboard(game_type, limit))
+
+@app.after_request
+def mark_stale_response(response):
+    age = g.get('stale_age')
+    if age:
+        response.headers['Age'] = str(int(age))
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# ============================================================================
+# BACKGROUND JOBS
+# ============================================================================
+
+# Post-score work (badges, rollups, leaderboard updates) runs here so request
+# handlers only pay for a single INSERT. Worker threads start on first enqueue
+# and from gunicorn.conf.py once each worker has loaded the app.
+job_queue = JobQueue(JOBS_DB, workers=int(os.getenv('JOB_WORKERS', '2')))
+
+# ============================================================================
+# EMAIL
+# ============================================================================
+
+# Requests only INSERT into the outbox; sender threads deliver in batches and
+# retry with backoff. EMAIL_TRANSPORT picks sendgrid (SENDGRID_API_KEY), smtp
+# (SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD) or file, which writes .eml
+# files to EMAIL_FILE_DIR. The default is sendgrid when an API key is set and
+# file otherwise.
+def make_email_transport():
+    sender = os.getenv('EMAIL_FROM', 'Brain Games <no-reply@braingames.app>')
+    kind = os.getenv('EMAIL_TRANSPORT') or ('sendgrid' if os.getenv('SENDGRID_API_KEY') else 'file')
+    if kind == 'sendgrid':
+        return SendGridTransport(os.getenv('SENDGRID_API_KEY', ''), sender)
+    if kind == 'smtp':
+        return SMTPTransport(os.getenv('SMTP_HOST', 'localhost'), int(os.getenv('SMTP_PORT', '587')), sender,
+                             username=os.getenv('SMTP_USER') or None, password=os.getenv('SMTP_PASSWORD'),
+                             starttls=os.getenv('SMTP_STARTTLS', '1') == '1')
+    if kind != 'file':
+        print(f"[ERROR] Unknown EMAIL_TRANSPORT '{kind}', writing email to files")
+    return FileTransport(os.getenv('EMAIL_FILE_DIR', os.path.join(DATA_DIR, 'outbox-mail')), sender)
+
+email_outbox = EmailOutbox(
+    OUTBOX_DB,
+    make_email_transport(),
+    senders=int(os.getenv('EMAIL_SENDERS', '1')),
+    batch_size=int(os.getenv('EMAIL_BATCH_SIZE', '50')),
+    max_attempts=int(os.getenv('EMAIL_MAX_ATTEMPTS', '8'))
+)
+
+metrics.callback('brain_games_emails_total', 'Emails enqueued, sent, retried and dead', 'counter', ('event',),
+                 lambda: {(name,): n for name, n in email_outbox.counters().items() if name != 'batches'})
+metrics.callback('brain_games_email_batches_total', 'Outbox batches handed to the transport', 'counter', (),
+                 lambda: {(): email_outbox.counters()['batches']})
+
+# Links in email are built from PUBLIC_BASE_URL (the site's origin, e.g.
+# https://braingames.app), or from SERVER_NAME and PREFERRED_URL_SCHEME when
+# Flask is configured with them, never from the request's Host header, which
+# whoever asks for the email controls.
+PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL', '').rstrip('/')
+
+def external_url(endpoint, **values):
+    """Absolute URL for use in email, or None if no public address is configured"""
+    if PUBLIC_BASE_URL:
+        return PUBLIC_BASE_URL + url_for(endpoint, **values)
+    if app.config.get('SERVER_NAME'):
+        return url_for(endpoint, _external=True, _scheme=app.config['PREFERRED_URL_SCHEME'], **values)
+    if app.debug:
+        # Local development, where the Host header is the developer's own
+        return url_for(endpoint, _external=True, **values)
+    return None
+
+def send_email(kind, recipient, subject, template, html=False, **context):
+    """Render email/<template>.txt (and .html) and queue it for delivery"""
+    text_body = render_template(f'email/{template}.txt', **context)
+    html_body = render_template(f'email/{template}.html', **context) if html else None
+    return email_outbox.enqueue(kind, recipient, subject, text_body, html_body)
+
+# ============================================================================
+# AGGREGATE FUNCTIONS
+# ============================================================================
+
+@timed_storage('aggregates', 'load', AGGREGATES_FILE)
+def load_aggregates():
+    with aggregates_lock.read():
+        if os.path.exists(AGGREGATES_FILE):
+            try:
+                with open(AGGREGATES_FILE, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"[ERROR] Failed to load aggregates: {e}")
+                return {}
+        return {}
+
+@timed_storage('aggregates', 'save', AGGREGATES_FILE)
+def save_aggregates(aggregates):
+    try:
+        with aggregates_lock.write():
+            _write_json(AGGREGATES_FILE, aggregates)
+        return True
+    except Exception as e:
+        print(f"[ERROR] Failed to save aggregates: {e}")
+        return False
+
+def _empty_aggregates():
+    return {
+        'total_games': 0,
+        'games': {game_type: {'count': 0, 'best': 0} for game_type in GAME_TYPES},
+        'streak': 0,
+        'last_played': None,
+        'version': 0
+    }
+
+def _aggregates_from_history(user_scores):
+    """Seed aggregates for a user who played before aggregates were tracked"""
+    agg = _empty_aggregates()
+    last_played = None
+    for game_type, game_scores in user_scores.items():
+        numeric = [s['score'] for s in game_scores if isinstance(s.get('score'), (int, float))]
+        agg['games'][game_type] = {'count': len(game_scores), 'best': max(numeric, default=0)}
+        agg['total_games'] += len(game_scores)
+        for s in game_scores:
+            day = s.get('date', '')[:10]
+            if day and (last_played is None or day > last_played):
+                last_played = day
+    if last_played:
+        agg['last_played'] = last_played
+        agg['streak'] = 1
+    return agg
+
+# Score ids remembered per user so a re-run roll_up_score job is not counted twice
+ROLLED_UP_IDS = 20
+
+def update_aggregates(user_id, game_type, score, played_at, score_id):
+    """Fold one submitted score into the user's aggregates.
+
+    Returns the dotted keys of the aggregates whose value changed, which is
+    what the badge engine evaluates against, or [] if the score was already
+    counted.
+    """
+    second = played_at.strftime('%Y-%m-%d %H:%M:%S')
+    with aggregates_lock.write():
+        aggregates = load_aggregates()
+        agg = aggregates.get(user_id)
+        changed = []
+        if agg is None:
+            # Seed from the scores saved in earlier seconds, whose own jobs
+            # then skip; this score and the rest of its second are folded in
+            # one by one below
+            history = {g: [s for s in game_scores if s.get('date', '') < second]
+                       for g, game_scores in load_scores().get(user_id, {}).items()}
+            agg = aggregates[user_id] = _aggregates_from_history(history)
+            agg['seeded_before'] = second
+            changed = ['total_games', 'streak'] + [f'games.{g}.{k}' for g in agg['games'] for k in ('count', 'best')]
+        elif score_id in agg.get('rolled_up', []) or second < agg.get('seeded_before', ''):
+            return []
+
+        changed += ['total_games', f'games.{game_type}.count']
+        game = agg['games'].setdefault(game_type, {'count': 0, 'best': 0})
+        agg['total_games'] += 1
+        game['count'] += 1
+        if isinstance(score, (int, float)) and score > game['best']:
+            game['best'] = score
+            changed.append(f'games.{game_type}.best')
+
+        today = played_at.date()
+        last_played = agg.get('last_played')
+        if last_played != today.isoformat():
+            if last_played == (today - timedelta(days=1)).isoformat():
+                agg['streak'] += 1
+            else:
+                agg['streak'] = 1
+            agg['last_played'] = today.isoformat()
+            changed.append('streak')
+
+        agg['rolled_up'] = (agg.get('rolled_up', []) + [score_id])[-ROLLED_UP_IDS:]
+        agg['version'] = agg.get('version', 0) + 1
+        save_aggregates(aggregates)
+        return list(dict.fromkeys(changed))
+
+@job_queue.register('roll_up_score')
+def roll_up_score(user_id, game_type, score, played_at, score_id):
+    """Update aggregates for a submitted score, then queue the badge check.
+    Safe to re-run."""
+    changed = update_aggregates(user_id, game_type, score, datetime.fromisoformat(played_at), score_id)
+    if changed:
+        # Stats and recent-games fragments are stamped with the aggregate version
+        publish_changes(f'scores:{user_id}')
+        enqueue_badge_check(user_id, changed)
+
+# ============================================================================
+# BADGE FUNCTIONS
+# ============================================================================
+
+@timed_storage('badges', 'load', BADGES_FILE)
+def load_badges():
+    with badges_lock.read():
+        if os.path.exists(BADGES_FILE):
+            try:
+                with open(BADGES_FILE, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"[ERROR] Failed to load badges: {e}")
+                return {}
+        return {}
+
+@timed_storage('badges', 'save', BADGES_FILE)
+def save_badges(badges):
+    try:
+        with badges_lock.write():
+            _write_json(BADGES_FILE, badges)
+        return True
+    except Exception as e:
+        print(f"[ERROR] Failed to save badges: {e}")
+        return False
+
+@job_queue.register('evaluate_badges')
+def evaluate_badges(user_id, changed_keys):
+    """Award any badges earned by the changed aggregates. Safe to re-run."""
+    # This worker may not have polled the bus since the score was saved
+    invalidation_bus.sync()
+    agg = user_aggregates.get(user_id)
+    if not agg:
+        return []
+    with badges_lock.write():
+        badges = load_badges()
+        awarded = badges.get(user_id, {})
+        earned = BADGE_ENGINE.evaluate(agg, changed_keys, awarded)
+        if earned:
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for badge_id in earned:
+                awarded[badge_id] = now
+            badges[user_id] = awarded
+            save_badges(badges)
+    if earned:
+        publish_changes(f'badges:{user_id}')
+    return earned
+
+def get_user_badges(user_id):
+    awarded = load_badges().get(user_id, {})
+    return [
+        {'id': badge_id, 'name': BADGE_ENGINE.rules[badge_id]['name'], 'awarded_at': awarded_at}
+        for badge_id, awarded_at in sorted(awarded.items(), key=lambda item: item[1])
+        if badge_id in BADGE_ENGINE.rules
+    ]
+
+def enqueue_badge_check(user_id, changed_keys):
+    watched = [key for key in changed_keys if key in BADGE_ENGINE.watched_keys()]
+    if watched:
+        job_queue.enqueue('evaluate_badges', {'user_id': user_id, 'changed_keys': watched})
+
+# ============================================================================
+# PUBLIC PROFILES
+# ============================================================================
+
+# /profile/<public_id> is assembled from four fragments rendered and cached
+# separately, each stamped with the version of the data it shows: the user
+# version for the header, the aggregate version for stats and recent games,
+# the badge count for badges. Invalidation is per fragment (see
+# _on_invalidate), so a new score re-renders stats and recent games but not
+# the header or badges. The stamps also make up the page's ETag.
+GAME_LABELS = {'memory': '🧩 Memory Training', 'problem_solving': '💡 Problem Solving',
+               'tbi_memory': '🎯 TBI Memory', 'stroop_test': '🎨 Stroop Test'}
+
+def _render_profile_header(user_id):
+    user = user_directory.get(user_id)
+    if user is None:
+        return None
+    avatar = avatar_store.store(user.get('avatar'))
+    return user_versions.get(user_id), render_template(
+        'public_profile/header.html', display_name=user['display_name'], member_since=user.get('created_at', '')[:10],
+        avatar=url_for('avatar', name=avatar) if avatar else None)
+
+def _render_profile_stats(user_id):
+    agg = user_aggregates.get(user_id) or {}
+    return agg.get('version', 0), render_template(
+        'public_profile/stats.html', stats=get_all_games_stats(user_id), total_games=agg.get('total_games', 0),
+        streak=agg.get('streak', 0), last_played=agg.get('last_played'), games=list(GAME_LABELS.items()))
+
+def _render_profile_recent(user_id, limit=10):
+    agg = user_aggregates.get(user_id) or {}
+    user_scores = load_scores().get(user_id, {})
+    recent = [{'game': GAME_LABELS.get(game_type, game_type), **score}
+              for game_type, game_scores in user_scores.items() for score in game_scores[-limit:]]
+    recent.sort(key=lambda s: s['date'], reverse=True)
+    return agg.get('version', 0), render_template('public_profile/recent.html', recent=recent[:limit])
+
+def _render_profile_badges(user_id):
+    badges = get_user_badges(user_id)
+    return len(badges), render_template('public_profile/badges.html', badges=badges)
+
+PROFILE_FRAGMENTS = {
+    'header': _render_profile_header,
+    'stats': _render_profile_stats,
+    'recent': _render_profile_recent,
+    'badges': _render_profile_badges
+}
+
+def profile_fragment(user_id, name):
+    """Return (version, html) for one fragment of a user's public profile, or None"""
+    if name == 'header':
+        # Profile edits bump the user version right after publishing, so
+        # also check it in case the bus hasn't been polled yet
+        cached = profile_fragments.peek((user_id, name))
+        if cached is not None and cached[0] != user_versions.get(user_id):
+            invalidation_bus.sync()
+            profile_fragments.invalidate((user_id, name))
+    return profile_fragments.get((user_id, name), lambda: PROFILE_FRAGMENTS[name](user_id))
+
+def local_profile(public_id):
+    """Return (display_name, {fragment: (version, html)}) for a user held here, or None"""
+    found = user_search.resolve(public_id)
+    if found is None:
+        return None
+    fragments = {name: profile_fragment(found[0], name) for name in PROFILE_FRAGMENTS}
+    if fragments['header'] is None:
+        return None
+    return found[1], fragments
+
+def find_profile(public_id):
+    profile = local_profile(public_id)
+    if profile is not None or not shard_router.enabled:
+        return profile
+    # A public id doesn't say which node holds the user, so ask them all;
+    # only the owner answers with a profile, rendered and cached there
+    for result in shard_router.scatter(f'/internal/profile/{public_id}', lambda: None):
+        if result is not None:
+            return result
+    return None
+
+# ============================================================================
+# GAME SHELLS
+# ============================================================================
+
+# Game pages hold nothing per user: each template is rendered once per
+# process with no user and fingerprinted by a hash of the HTML. The player's
+# best score, games played and the navbar come from /api/stats/<game_type>,
+# fetched by the page. Links go to /games/<slug>/<fingerprint>, which
+# browsers keep for a year; the plain /games/<slug> URLs revalidate against
+# the fingerprint and get a 304 until the next deploy changes it.
+GAME_SHELLS = {
+    'memory': ('memory', 'memory', 'games/memory.html'),
+    'problem_solving': ('problem_solving', 'problem-solving', 'games/problem_solving.html'),
+    'tbi_memory': ('tbi_memory', 'tbi-memory', 'games/tbi_memory.html'),
+    'stroop_test': ('stroop_test', 'stroop-test', 'games/stroop_test.html')
+}
+GAME_SLUGS = {slug: game_type for game_type, (_, slug, _) in GAME_SHELLS.items()}
+_game_shells = {}
+
+def game_shell(game_type):
+    """Return (fingerprint, html) for a game page, rendering it on first use"""
+    shell = _game_shells.get(game_type)
+    if shell is None:
+        html = render_template(GAME_SHELLS[game_type][2], user=None, shell=game_type)
+        shell = _game_shells[game_type] = (hashlib.sha256(html.encode()).hexdigest()[:16], html)
+    return shell
+
+@app.template_global()
+def game_url(game_type):
+    return url_for('game_shell_versioned', slug=GAME_SHELLS[game_type][1], fingerprint=game_shell(game_type)[0])
+
+def serve_game_shell(game_type, immutable=False):
+    fingerprint, html = game_shell(game_type)
+    g.public_response = True
+    response = Response(html, mimetype='text/html')
+    response.set_etag(fingerprint)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' if immutable else 'public, no-cache'
+    return response.make_conditional(request)
+
+# ============================================================================
+# SHARDING
+# ============================================================================
+
+@job_queue.register('notify_shards')
+def notify_shards(keys):
+    for node in shard_router.peers():
+        shard_router.call(node, '/internal/invalidate', {'keys': keys})
+
+def delete_user_data(user_id):
+    """Remove a user from every local store"""
+    for lock, load, save in ((users_lock, load_users, save_users), (scores_lock, load_scores, save_scores),
+                             (aggregates_lock, load_aggregates, save_aggregates), (badges_lock, load_badges, save_badges)):
+        with lock.write():
+            data = load()
+            if user_id in data:
+                del data[user_id]
+                save(data)
+    reset_tokens.revoke(user_id)
+    email_index.release(user_id)
+    
+    publish_changes(f'user:{user_id}', f'scores:{user_id}', *all_leaderboard_keys())
+    bump_user_version(user_id)
+
+def export_user_data(user_id):
+    return {
+        'user_id': user_id,
+        'user': load_users().get(user_id),
+        'scores': load_scores().get(user_id),
+        'aggregates': load_aggregates().get(user_id),
+        'badges': load_badges().get(user_id)
+    }
+
+def import_user_data(record):
+    user_id = record['user_id']
+    for lock, load, save, key in ((users_lock, load_users, save_users, 'user'),
+                                  (scores_lock, load_scores, save_scores, 'scores'),
+                                  (aggregates_lock, load_aggregates, save_aggregates, 'aggregates'),
+                                  (badges_lock, load_badges, save_badges, 'badges')):
+        if record.get(key) is not None:
+            with lock.write():
+                data = load()
+                data[user_id] = record[key]
+                save(data)
+    if record.get('user') is not None:
+        email_index.claim(user_id, user_id)
+    publish_changes(f'user:{user_id}', f'scores:{user_id}', *all_leaderboard_keys())
+    bump_user_version(user_id)
+
+# Requests are served by the node that owns the user they act on. Anything
+# under these prefixes is node-local or not tied to a user.
+SHARD_LOCAL_PREFIXES = ('/internal/', '/static/', '/games/', '/api/leaderboards/stream', '/metrics')
+SHARD_EMAIL_FORMS = ('/signup', '/login', '/forgot-password')
+
+def _shard_key():
+    if 'user_id' in session:
+        return normalize_email(session['user_id'])
+    if request.method == 'POST' and request.path in SHARD_EMAIL_FORMS:
+        return normalize_email(request.form.get('email')) or None
+    return None
+
+def _is_shard_peer():
+    return shard_router.is_peer(request.headers.get('X-Shard-Secret'))
+
+@app.before_request
+def route_to_shard():
+    if request.path.startswith('/internal/'):
+        # The peer API doesn't exist unless this node is part of a ring
+        if not _is_shard_peer():
+            abort(404)
+        return None
+    if not shard_router.enabled or request.path.startswith(SHARD_LOCAL_PREFIXES):
+        return None
+    if request.headers.get('X-Shard-Forwarded') and _is_shard_peer():
+        return None
+    # Buffer the body before the form is parsed so it can still be forwarded
+    body = request.get_data()
+    user_id = _shard_key()
+    if not user_id or shard_router.is_local(user_id):
+        return None
+    node = shard_router.owner(user_id)
+    try:
+        status, headers, body = shard_router.forward(
+            node, request.method, request.full_path.rstrip('?'),
+            list(request.headers.items()), body)
+    except Exception as e:
+        print(f"[ERROR] Failed to forward {request.path} to shard {node}: {e}")
+        return jsonify({'success': False, 'message': 'Service unavailable'}), 503, {'Retry-After': '5'}
+    return Response(body, status=status, headers=headers)
+
+@app.route('/internal/leaderboard/<game_type>')
+def internal_leaderboard(game_type):
+    return jsonify(_local_leaderboard(game_type, request.args.get('limit', 10, type=int)))
+
+@app.route('/internal/profile/<public_id>')
+def internal_profile(public_id):
+    return jsonify(local_profile(public_id))
+
+@app.route('/internal/users/search')
+def internal_search_users():
+    return jsonify(user_search.matches(request.args.get('q', ''), request.args.get('limit', 21, type=int)))
+
+@app.route('/internal/users')
+def internal_users():
+    return jsonify(list(load_users().keys()))
+
+@app.route('/internal/users/export')
+def internal_export_user():
+    return jsonify(export_user_data(request.args.get('user_id', '')))
+
+@app.route('/internal/users/import', methods=['POST'])
+def internal_import_user():
+    import_user_data(request.json)
+    return jsonify({'success': True})
+
+@app.route('/internal/users/delete', methods=['POST'])
+def internal_delete_user():
+    delete_user_data(request.json['user_id'])
+    return jsonify({'success': True})
+
+@app.route('/internal/ring', methods=['POST'])
+def internal_ring():
+    shard_router.set_nodes(request.json['nodes'])
+    leaderboard_cache.clear()
+    return jsonify({'success': True, 'nodes': shard_router.nodes})
+
+@app.route('/internal/invalidate', methods=['POST'])
+def internal_invalidate():
+    invalidation_bus.publish(*request.json['keys'])
+    return jsonify({'success': True})
+
+@app.cli.command('rebalance')
+@click.argument('nodes')
+def rebalance_command(nodes):
+    """Move users so NODES (same format as SHARD_NODES) becomes the ring"""
+    moved = rebalance(shard_router, parse_nodes(nodes))
+    for user_id, src, dst in moved:
+        print(f"{user_id}: {src} -> {dst}")
+    print(f"Moved {len(moved)} users")
+
+# ============================================================================
+# WRITE ADMISSION
+# ============================================================================
+
+# Each write endpoint rewrites a whole JSON file, so writes are rate limited
+# per user and globally, and capped in flight across all workers. Rejected
+# requests fail fast with Retry-After instead of queueing on the disk.
+write_admission = WriteAdmission(
+    RATE_LIMIT_FILE,
+    user_rate=float(os.getenv('WRITE_RATE_PER_USER', '2')),
+    user_burst=int(os.getenv('WRITE_BURST_PER_USER', '10')),
+    global_rate=float(os.getenv('WRITE_RATE_GLOBAL', '50')),
+    global_burst=int(os.getenv('WRITE_BURST_GLOBAL', '100')),
+    max_inflight=int(os.getenv('MAX_INFLIGHT_WRITES', '4'))
+)
+
+def write_limited(f):
+    """Decorator to admit a signed-in user's write before the handler loads any file"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # The session cookie is enough to key the limit; no users.json read.
+        # Anonymous callers are turned away first so they can't spend the
+        # global budget or in-flight slots.
+        user_key = session.get('user_id')
+        if not user_key:
+            return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+        status, retry_after = write_admission.admit(user_key)
+        if status:
+            message = 'Too many requests' if status == 429 else 'Server busy, please retry'
+            return jsonify({'success': False, 'message': message}), status, {'Retry-After': retry_after_header(retry_after)}
+        try:
+            return f(*args, **kwargs)
+        finally:
+            write_admission.release()
+    return decorated_function
+
 # ============================================================================
 # ROUTES
 # ============================================================================
 
+@app.before_request
+def sync_caches():
+    # One PRAGMA when nothing changed; drops entries other workers invalidated
+    invalidation_bus.sync()
+
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
@@ -282,8 +1413,9 @@ def signup():
         email = request.form.get('email', '').strip()
         password = request.form.get('password', '')
         
-        if not display_name or len(display_name) < 2:
-            return render_template('auth/signup.html', error='Display name must be at least 2 characters')
+        error = display_name_error(display_name)
+        if error:
+            return render_template('auth/signup.html', error=error)
         
         if not email or len(email) < 5:
             return render_template('auth/signup.html', error='Email must be at least 5 characters')
@@ -309,7 +1441,7 @@ def login():
         success, result = verify_user(email, password)
         if success:
             session.permanent = True
-            session['user_id'] = email
+            session['user_id'] = result
             return redirect(url_for('index'))
         
         return render_template('auth/login.html', error='Invalid email or password')
@@ -321,18 +1453,40 @@ def logout():
     session.clear()
     return redirect(url_for('index'))
 
+# Reset emails are limited per address (so no one can flood a mailbox) and
+# per client address (so no one can walk the outbox through many mailboxes)
+RESET_EMAILS_PER_HOUR = float(os.getenv('RESET_EMAILS_PER_HOUR', '3'))
+RESET_REQUESTS_PER_HOUR_PER_IP = float(os.getenv('RESET_REQUESTS_PER_HOUR_PER_IP', '20'))
+
+def reset_retry_after(email):
+    """0 if a reset may be requested for `email` now, else seconds to wait"""
+    return (write_admission.take(f'reset-ip:{request.remote_addr}', RESET_REQUESTS_PER_HOUR_PER_IP / 3600,
+                                 RESET_REQUESTS_PER_HOUR_PER_IP)
+            or write_admission.take(f'reset-email:{normalize_email(email)}', RESET_EMAILS_PER_HOUR / 3600,
+                                    RESET_EMAILS_PER_HOUR))
+
 @app.route('/forgot-password', methods=['GET', 'POST'])
 def forgot_password():
     if request.method == 'POST':
-        email = request.form.get('email', '').strip()
+        retry_after = reset_retry_after(request.form.get('email', ''))
+        if retry_after:
+            page = render_template('auth/forgot_password.html', error='Too many reset requests, please try again later.')
+            return page, 429, {'Retry-After': retry_after_header(retry_after)}
+
+        email = resolve_user_id(request.form.get('email', ''))
         
-        token = create_reset_token(email)
-        if token:
-            # TODO: Send email with reset link
-            # For now, just show the reset link
-            reset_link = url_for('reset_password_route', token=token, _external=True)
-            return render_template('auth/forgot_password.html', 
-                message=f'Password reset link: {reset_link}')
+        token = create_reset_token(email) if email else None
+        reset_link = external_url('reset_password_route', token=token) if token else None
+        if token and not reset_link:
+            print("[ERROR] PUBLIC_BASE_URL is not set; not sending password reset email")
+        if reset_link:
+            send_email('reset_password', email, 'Reset your Brain Games password', 'reset_password', html=True,
+                       display_name=user_directory.get(email, {}).get('display_name', email),
+                       reset_link=reset_link, valid_hours=round(reset_tokens.ttl / 3600))
+            # Local development has no mailbox to read, so show the link too
+            if app.debug:
+                return render_template('auth/forgot_password.html',
+                    message=f'Password reset link: {reset_link}')
         
         return render_template('auth/forgot_password.html',
             message='If an account exists with that email, you will receive a password reset link.')
@@ -368,13 +1522,9 @@ def reset_password_route(token):
 def index():
     user_id, user_data = get_current_user()
     if user_id:
-        stats = get_all_games_stats(user_id)
-        total = stats['memory']['total'] + stats['problem_solving']['total'] + stats['tbi_memory']['total'] + stats['stroop_test']['total']
-        return render_template('index.html', logged_in=True, user=user_data, total_games=total,
-            memory_best=stats['memory']['best'], memory_total=stats['memory']['total'],
-            problem_best=stats['problem_solving']['best'], problem_total=stats['problem_solving']['total'],
-            tbi_best=stats['tbi_memory']['best'], tbi_total=stats['tbi_memory']['total'],
-            stroop_best=stats['stroop_test']['best'], stroop_total=stats['stroop_test']['total'])
+        # Stats are loaded by the template only if its cached fragment is stale
+        return render_template('index.html', logged_in=True, user=user_data, user_id=user_id,
+                               stats_version=stats_version(user_id), load_stats=lambda: page_stats(user_id))
     return render_template('index.html', logged_in=False)
 
 @app.route('/dashboard')
@@ -382,8 +1532,8 @@ def dashboard():
     user_id, user_data = get_current_user()
     if not user_id:
         return redirect(url_for('login'))
-    stats = get_all_games_stats(user_id)
-    return render_template('dashboard.html', user=user_data, stats=stats)
+    return render_template('dashboard.html', user=user_data, user_id=user_id,
+                           stats_version=stats_version(user_id), load_stats=lambda: page_stats(user_id))
 
 @app.route('/history')
 def history():
@@ -405,46 +1555,118 @@ def profile():
     if not user_id:
         return redirect(url_for('login'))
     stats = get_all_games_stats(user_id)
-    return render_template('profile.html', user=user_data, user_id=user_id, stats=stats)
+    member_since = (user_directory.get(user_id) or {}).get('created_at')
+    return render_template('profile.html', user=user_data, user_id=user_id, stats=stats, member_since=member_since)
+
+@app.route('/profile/<public_id>')
+def public_profile(public_id):
+    profile = find_profile(public_id)
+    if profile is None:
+        abort(404)
+    display_name, fragments = profile
+    viewer_id, viewer = get_current_user()
+    # The navbar shows the viewer, so their snapshot is part of the validator
+    stamp = [public_id, viewer_id or '', user_versions.get(viewer_id) if viewer_id else 0]
+    stamp += [f'{name}:{fragments[name][0]}' for name in PROFILE_FRAGMENTS]
+    etag = hashlib.sha1('|'.join(map(str, stamp)).encode()).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(render_template('public_profile.html', user=viewer, display_name=display_name,
+                                             fragments={name: html for name, (_, html) in fragments.items()}))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/leaderboards')
 def leaderboards():
     user_id, user_data = get_current_user()
-    memory_lb = get_leaderboard('memory', 10)
-    problem_lb = get_leaderboard('problem_solving', 10)
-    tbi_lb = get_leaderboard('tbi_memory', 10)
-    stroop_lb = get_leaderboard('stroop_test', 10)
-    return render_template('leaderboards.html', user=user_data, memory_leaderboard=memory_lb, problem_leaderboard=problem_lb, tbi_leaderboard=tbi_lb, stroop_leaderboard=stroop_lb)
+    memory_lb = page_leaderboard('memory', 10)
+    problem_lb = page_leaderboard('problem_solving', 10)
+    tbi_lb = page_leaderboard('tbi_memory', 10)
+    stroop_lb = page_leaderboard('stroop_test', 10)
+    return render_template('leaderboards.html', user=user_data, memory_leaderboard=memory_lb, problem_leaderboard=problem_lb, tbi_leaderboard=tbi_lb, stroop_leaderboard=stroop_lb,
+                           live_updates=LEADERBOARD_STREAM)
+
+@app.route('/api/leaderboards/<game_type>')
+def leaderboard_json(game_type):
+    if game_type not in GAME_TYPES:
+        return jsonify({'success': False, 'message': 'Unknown game'}), 404
+    limit = min(max(1, request.args.get('limit', 10, type=int)), LEADERBOARD_MAX_LIMIT)
+    return jsonify({'gameType': game_type, 'leaderboard': public_rows(leaderboard_top(game_type, limit))})
+
+@app.route('/api/leaderboards/<game_type>/rank')
+def leaderboard_rank_json(game_type):
+    user_id, user_data = get_current_user()
+    if not user_id:
+        return jsonify({'success': False}), 401
+    if game_type not in GAME_TYPES:
+        return jsonify({'success': False, 'message': 'Unknown game'}), 404
+    found = leaderboard_rank(user_id, game_type)
+    if found is None:
+        return jsonify({'success': True, 'rank': None})
+    rank, entry = found
+    return jsonify({'success': True, 'rank': rank, 'score': entry['score'], 'games_played': entry['games_played']})
+
+# Off when each open stream would pin a sync worker or a gthread thread (set
+# by gunicorn.conf.py); the page then keeps the boards it was rendered with.
+LEADERBOARD_STREAM = os.getenv('LEADERBOARD_STREAM', '1') == '1'
+
+@app.route('/api/leaderboards/stream')
+def leaderboards_stream():
+    if not LEADERBOARD_STREAM:
+        # EventSource gives up on 204 instead of reconnecting
+        return Response(status=204)
+    games = request.args.get('games')
+    games = [g for g in games.split(',') if g in GAME_TYPES] if games else None
+    # Streams forced on with non-gevent workers are kept short (see
+    # gunicorn.conf.py); EventSource reconnects and resumes from a full board.
+    max_duration = float(os.getenv('SSE_STREAM_SECONDS', '300'))
+    invalidation_bus.start()
+    response = Response(leaderboard_broadcaster.stream(games, max_duration=max_duration), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/games/memory')
 def memory():
-    user_id, user_data = get_current_user()
-    best_score = get_best_score(user_id, 'memory') if user_id else 0
-    total_games = get_game_stats(user_id, 'memory')['total'] if user_id else 0
-    return render_template('games/memory.html', user=user_data, best_score=best_score, total_games=total_games)
+    return serve_game_shell('memory')
 
 @app.route('/games/problem-solving')
 def problem_solving():
-    user_id, user_data = get_current_user()
-    best_score = get_best_score(user_id, 'problem_solving') if user_id else 0
-    total_games = get_game_stats(user_id, 'problem_solving')['total'] if user_id else 0
-    return render_template('games/problem_solving.html', user=user_data, best_score=best_score, total_games=total_games)
+    return serve_game_shell('problem_solving')
 
 @app.route('/games/tbi-memory')
 def tbi_memory():
-    user_id, user_data = get_current_user()
-    best_score = get_best_score(user_id, 'tbi_memory') if user_id else 0
-    total_games = get_game_stats(user_id, 'tbi_memory')['total'] if user_id else 0
-    return render_template('games/tbi_memory.html', user=user_data, best_score=best_score, total_games=total_games)
+    return serve_game_shell('tbi_memory')
 
 @app.route('/games/stroop-test')
 def stroop_test():
+    return serve_game_shell('stroop_test')
+
+@app.route('/games/<slug>/<fingerprint>')
+def game_shell_versioned(slug, fingerprint):
+    game_type = GAME_SLUGS.get(slug)
+    if game_type is None:
+        abort(404)
+    if fingerprint != game_shell(game_type)[0]:
+        # A link from before a deploy; the plain URL serves the current shell
+        return redirect(url_for(GAME_SHELLS[game_type][0]))
+    return serve_game_shell(game_type, immutable=True)
+
+@app.route('/api/stats/<game_type>')
+def game_stats_api(game_type):
+    if game_type not in GAME_SHELLS:
+        return jsonify({'success': False, 'message': 'Unknown game'}), 404
     user_id, user_data = get_current_user()
-    best_score = get_best_score(user_id, 'stroop_test') if user_id else 0
-    total_games = get_game_stats(user_id, 'stroop_test')['total'] if user_id else 0
-    return render_template('games/stroop_test.html', user=user_data, best_score=best_score, total_games=total_games)
+    stats = get_game_stats(user_id, game_type) if user_id else {'best': 0, 'total': 0}
+    response = jsonify({'success': True, 'user': user_data, 'best_score': stats['best'], 'total_games': stats['total']})
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/api/save-score', methods=['POST'])
+@write_limited
 def save_score():
     user_id, user_data = get_current_user()
     if not user_id:
@@ -453,18 +1675,88 @@ def save_score():
     add_score(user_id, data.get('game_type'), data.get('score'), data.get('difficulty', 'medium'))
     return jsonify({'success': True, 'best_score': get_best_score(user_id, data.get('game_type'))})
 
+@app.route('/api/users/search')
+def search_users():
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(50, max(1, int(request.args.get('limit', 20))))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'offset and limit must be integers'}), 400
+    results, has_more = search_players(request.args.get('q', '')[:100], offset, limit)
+    for result in results:
+        result['url'] = url_for('public_profile', public_id=result['id'])
+    return jsonify({'success': True, 'results': results, 'next_offset': offset + limit if has_more else None})
+
+@app.route('/api/badges')
+def badges():
+    user_id, user_data = get_current_user()
+    if not user_id:
+        return jsonify({'success': False}), 401
+    return jsonify({'success': True, 'badges': get_user_badges(user_id)})
+
+@app.route('/api/jobs/metrics')
+@operator_required
+def jobs_metrics():
+    return jsonify(job_queue.metrics())
+
+@app.route('/api/outbox/metrics')
+@operator_required
+def outbox_metrics():
+    return jsonify(email_outbox.metrics())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Optional bearer token for when the port is reachable from outside
+    if os.getenv('METRICS_TOKEN') and not has_metrics_token():
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    user_id, user_data = get_current_user()
+    return render_template('admin/profiles.html', user=user_data, profiles=request_profiler.list(),
+                           enabled=request_profiler.enabled)
+
+@app.route('/admin/profiles/<name>')
+@admin_required
+def admin_profile_detail(name):
+    user_id, user_data = get_current_user()
+    result = request_profiler.load(name)
+    if result is None:
+        return redirect(url_for('admin_profiles'))
+    if request.args.get('format') == 'json':
+        return jsonify(result)
+    return render_template('admin/profile_detail.html', user=user_data, name=name, profile=result)
+
+@app.route('/avatar/<name>')
+def avatar(name):
+    # Names are content hashes, so a cached copy never goes stale
+    g.public_response = True
+    response = send_from_directory(AVATARS_DIR, name, max_age=365 * 24 * 3600)
+    response.headers['Cache-Control'] += ', immutable'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
 @app.route('/api/upload-avatar', methods=['POST'])
+@write_limited
 def upload_avatar():
     user_id, user_data = get_current_user()
     if not user_id:
         return jsonify({'success': False}), 401
     data = request.json
-    users = load_users()
-    users[user_id]['avatar'] = data.get('avatar')
-    save_users(users)
+    with users_lock.write():
+        users = load_users()
+        if user_id not in users:
+            return jsonify({'success': False}), 401
+        users[user_id]['avatar'] = data.get('avatar')
+        save_users(users)
+    publish_changes(f'user:{user_id}')
+    bump_user_version(user_id)
     return jsonify({'success': True})
 
 @app.route('/api/update-profile', methods=['POST'])
+@write_limited
 def update_profile():
     user_id, user_data = get_current_user()
     if not user_id:
@@ -473,12 +1765,19 @@ def update_profile():
     data = request.json
     display_name = data.get('display_name', '').strip()
     
-    if not display_name or len(display_name) < 2:
-        return jsonify({'success': False, 'message': 'Display name must be at least 2 characters'})
+    error = display_name_error(display_name)
+    if error:
+        return jsonify({'success': False, 'message': error})
     
-    users = load_users()
-    users[user_id]['display_name'] = display_name
-    save_users(users)
+    with users_lock.write():
+        users = load_users()
+        if user_id not in users:
+            return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+        users[user_id]['display_name'] = display_name
+        save_users(users)
+    # Display names appear on every leaderboard the user is on
+    publish_changes(f'user:{user_id}', *all_leaderboard_keys())
+    bump_user_version(user_id)
     
     return jsonify({'success': True, 'message': 'Profile updated'})
 
@@ -493,16 +1792,25 @@ def change_password():
     new_password = data.get('new_password', '')
     
     # Verify current password
-    users = load_users()
-    if users[user_id]['password'] != hash_password(current_password):
+    # Salted hashes can't be compared to a fresh hash; verify instead
+    # (the session snapshot doesn't carry the hash, so read the record)
+    stored = (user_directory.get(user_id) or {}).get('password')
+    if not check_password(current_password, stored)[0]:
         return jsonify({'success': False, 'message': 'Current password is incorrect'})
     
     if len(new_password) < 5:
         return jsonify({'success': False, 'message': 'New password must be at least 5 characters'})
     
     # Update password
-    users[user_id]['password'] = hash_password(new_password)
-    save_users(users)
+    password_hash = hash_password(new_password)
+    with users_lock.write():
+        users = load_users()
+        if user_id not in users:
+            return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+        users[user_id]['password'] = password_hash
+        save_users(users)
+    publish_changes(f'user:{user_id}')
+    send_password_changed(user_id, users[user_id])
     
     return jsonify({'success': True, 'message': 'Password changed successfully'})
 
@@ -516,25 +1824,79 @@ def delete_account():
     email = data.get('email', '').strip()
     
     # Verify email matches
-    if email != user_id:
+    if normalize_email(email) != normalize_email(user_id):
         return jsonify({'success': False, 'message': 'Email does not match'})
     
-    # Delete user
-    users = load_users()
-    if user_id in users:
-        del users[user_id]
-        save_users(users)
-    
-    # Delete scores
-    scores = load_scores()
-    if user_id in scores:
-        del scores[user_id]
-        save_scores(scores)
+    # Delete user, scores, aggregates and badges
+    delete_user_data(user_id)
     
     # Clear session
     session.clear()
     
     return jsonify({'success': True, 'message': 'Account deleted'})
 
+# ============================================================================
+# STARTUP
+# ============================================================================
+
+# Default accounts are seeded once per deployment: gunicorn.conf.py runs
+# `flask seed` from the master and sets SEED_ON_STARTUP=0 for the workers.
+# `python app.py` and other entry points keep seeding on import, which only
+# writes when an account is missing.
+BOOT_SECONDS = metrics.histogram('brain_games_worker_boot_seconds', 'Per-process app import and cache warm-up time',
+                                 ('phase',), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+# First boot with the email index: build it from the existing accounts
+if email_index.is_empty():
+    rebuild_email_index()
+
+if os.getenv('SEED_ON_STARTUP', '1') == '1':
+    init_default_users()
+
+@app.cli.command('seed')
+def seed_command():
+    """Add missing default accounts (safe to run on every deploy)"""
+    added = init_default_users()
+    print(f"Added {added} default users" if added else "Default users already present")
+
+@app.cli.command('email-index')
+def email_index_command():
+    """Rebuild the normalized email index and list accounts differing only in case"""
+    collisions = rebuild_email_index()
+    print(f"{len(collisions)} case collisions" if collisions else "No case collisions")
+
+def warm_caches():
+    """Fill this process's caches before it takes traffic; returns seconds spent"""
+    started = time.perf_counter()
+    snapshot_reader.get()
+    for game_type in GAME_TYPES:
+        leaderboard_top(game_type, 10)
+    elapsed = time.perf_counter() - started
+    BOOT_SECONDS.observe(elapsed, 'warmup')
+    return elapsed
+
+def preload_shared_data():
+    """Load read-mostly data before workers fork so they share one copy"""
+    user_directory.preload()
+    user_aggregates.preload()
+    user_search.build()
+    snapshot_reader.get()
+    for game_type in GAME_TYPES:
+        leaderboard_top(game_type, 10)
+    # Garbage left by the loads would otherwise be freed in each worker,
+    # dirtying the shared pages it sits on
+    gc.collect()
+
+if PRELOAD_DATA:
+    preload_shared_data()
+
+IMPORT_SECONDS = time.perf_counter() - _BOOT_STARTED
+BOOT_SECONDS.observe(IMPORT_SECONDS, 'import')
+
 if __name__ == '__main__':
+    job_queue.start()
+    email_outbox.start()
+    reset_tokens.start()
+    invalidation_bus.start()
+    snapshot_writer.start()
     app.run(debug=True)
\ No newline at end of file
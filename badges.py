@@ -0,0 +1,104 @@
+# Brain Games - Badge / Achievement Rules
+# Declarative badge rules evaluated incrementally against per-user aggregates
+
+from bisect import bisect_right
+
+# ============================================================================
+# RULE DEFINITIONS
+# ============================================================================
+
+# Each rule watches a single aggregate and fires once its value reaches the
+# threshold. Supported types:
+#   game_count      - total games played across every game
+#   game_milestone  - games played of one game type
+#   score_threshold - best score reached in one game type
+#   streak          - consecutive days with at least one game played
+BADGE_RULES = [
+    {'id': 'first_game', 'name': 'First Steps', 'type': 'game_count', 'count': 1},
+    {'id': 'ten_games', 'name': 'Warming Up', 'type': 'game_count', 'count': 10},
+    {'id': 'fifty_games', 'name': 'Dedicated', 'type': 'game_count', 'count': 50},
+    {'id': 'hundred_games', 'name': 'Centurion', 'type': 'game_count', 'count': 100},
+
+    {'id': 'memory_25', 'name': 'Memory Regular', 'type': 'game_milestone', 'game': 'memory', 'count': 25},
+    {'id': 'problem_solving_25', 'name': 'Puzzle Regular', 'type': 'game_milestone', 'game': 'problem_solving', 'count': 25},
+    {'id': 'tbi_memory_25', 'name': 'Recall Regular', 'type': 'game_milestone', 'game': 'tbi_memory', 'count': 25},
+    {'id': 'stroop_test_25', 'name': 'Stroop Regular', 'type': 'game_milestone', 'game': 'stroop_test', 'count': 25},
+
+    {'id': 'memory_10', 'name': 'Sequence Master', 'type': 'score_threshold', 'game': 'memory', 'score': 10},
+    {'id': 'problem_solving_90', 'name': 'Problem Crusher', 'type': 'score_threshold', 'game': 'problem_solving', 'score': 90},
+    {'id': 'tbi_memory_100', 'name': 'Perfect Recall', 'type': 'score_threshold', 'game': 'tbi_memory', 'score': 100},
+    {'id': 'stroop_test_100', 'name': 'Unflappable', 'type': 'score_threshold', 'game': 'stroop_test', 'score': 100},
+
+    {'id': 'streak_3', 'name': 'On a Roll', 'type': 'streak', 'days': 3},
+    {'id': 'streak_7', 'name': 'Week Streak', 'type': 'streak', 'days': 7},
+    {'id': 'streak_30', 'name': 'Habit Formed', 'type': 'streak', 'days': 30},
+]
+
+# ============================================================================
+# ENGINE
+# ============================================================================
+
+def rule_key(rule):
+    """Return (aggregate key, threshold) watched by a rule"""
+    rule_type = rule['type']
+    if rule_type == 'game_count':
+        return 'total_games', rule['count']
+    if rule_type == 'game_milestone':
+        return f"games.{rule['game']}.count", rule['count']
+    if rule_type == 'score_threshold':
+        return f"games.{rule['game']}.best", rule['score']
+    if rule_type == 'streak':
+        return 'streak', rule['days']
+    raise ValueError(f"Unknown badge rule type: {rule_type}")
+
+def aggregate_value(aggregates, key):
+    """Look up a dotted aggregate key such as 'games.memory.best'"""
+    value = aggregates
+    for part in key.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+class BadgeEngine:
+    """Rules indexed by the aggregate they watch, sorted by threshold.
+
+    Evaluation only touches the aggregates that changed, and within each one
+    only the rules whose threshold has been reached, so the cost of an update
+    does not grow with the total number of rules.
+    """
+
+    def __init__(self, rules):
+        self.rules = {rule['id']: rule for rule in rules}
+        self._by_key = {}
+        for rule in rules:
+            key, threshold = rule_key(rule)
+            self._by_key.setdefault(key, []).append((threshold, rule['id']))
+        for entries in self._by_key.values():
+            entries.sort()
+        self._thresholds = {key: [t for t, _ in entries] for key, entries in self._by_key.items()}
+
+    def watched_keys(self):
+        return set(self._by_key)
+
+    def evaluate(self, aggregates, changed_keys, awarded):
+        """Return ids of badges newly earned given the changed aggregate keys.
+
+        Badges already present in `awarded` are never returned again, so
+        re-running an evaluation is a no-op.
+        """
+        earned = []
+        for key in changed_keys:
+            entries = self._by_key.get(key)
+            if not entries:
+                continue
+            value = aggregate_value(aggregates, key)
+            if value is None:
+                continue
+            reached = bisect_right(self._thresholds[key], value)
+            for _, badge_id in entries[:reached]:
+                if badge_id not in awarded and badge_id not in earned:
+                    earned.append(badge_id)
+        return earned
+
+BADGE_ENGINE = BadgeEngine(BADGE_RULES)
@@ -0,0 +1,153 @@
+# Brain Games - Per-Worker Memory With and Without Preloading
+# Starts gunicorn at several worker counts in each data mode, touches every
+# worker with logged-in page views and reports RSS, PSS and private
+# (unshared) memory per worker from /proc/<pid>/smaps_rollup
+#
+#   python bench/cow_memory.py                          # 20k users, 2/4/8 workers
+#   python bench/cow_memory.py --users 100000 --workers 4,8
+#   python bench/cow_memory.py --modes preload --requests 400
+#
+# Linux only. PSS splits each shared page between the processes mapping it,
+# so the sum of PSS over master and workers is what the deployment costs.
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from loadtest import HTTPSession, wait_ready
+from microbench import PASSWORD, fixture_dir, pick_users
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+# fork: files parsed per request (the default); private: each worker keeps
+# its own in-memory copy; preload: one copy loaded by the master before fork
+MODES = {
+    'fork': {'PRELOAD_APP': '0', 'PRELOAD_DATA': '0'},
+    'private': {'PRELOAD_APP': '0', 'PRELOAD_DATA': '1'},
+    'preload': {'PRELOAD_APP': '1', 'PRELOAD_DATA': '1'}
+}
+PAGES = ['/', '/dashboard', '/games/memory', '/leaderboards']
+
+# ============================================================================
+# MEMORY
+# ============================================================================
+
+def smaps_rollup(pid):
+    """Return {field: kB} for one process"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            parts = rest.split()
+            if len(parts) == 2 and parts[1] == 'kB':
+                fields[name] = int(parts[0])
+    return fields
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+def usage(pid):
+    m = smaps_rollup(pid)
+    return {
+        'rss_kb': m.get('Rss', 0),
+        'pss_kb': m.get('Pss', 0),
+        'private_kb': m.get('Private_Clean', 0) + m.get('Private_Dirty', 0),
+        'shared_kb': m.get('Shared_Clean', 0) + m.get('Shared_Dirty', 0)
+    }
+
+# ============================================================================
+# RUN
+# ============================================================================
+
+def measure(mode, workers, source, args):
+    data_dir = tempfile.mkdtemp(prefix=f'cow-{mode}-{workers}-')
+    shutil.rmtree(data_dir)
+    shutil.copytree(source, data_dir)
+    pidfile = os.path.join(data_dir, 'gunicorn.pid')
+    env = dict(os.environ, DATA_DIR=data_dir, WEB_CONCURRENCY=str(workers), GUNICORN_BIND=f'127.0.0.1:{args.port}',
+               GUNICORN_WORKER_CLASS='sync', SNAPSHOT_INTERVAL='3600', **MODES[mode])
+    log = open(os.path.join(data_dir, 'gunicorn.log'), 'w')
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-p', pidfile, 'app:app'],
+                            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        base_url = f'http://127.0.0.1:{args.port}'
+        wait_ready(base_url, proc, timeout=120)
+        # Sync workers close every connection, so requests spread over all of them
+        heavy, typical = pick_users(data_dir)
+        for user in (heavy, typical):
+            session = HTTPSession(base_url)
+            session.request('POST', '/login', form={'email': user, 'password': PASSWORD})
+            for i in range(args.requests // 2):
+                session.request('GET', PAGES[i % len(PAGES)])
+        time.sleep(args.settle)
+        with open(pidfile) as f:
+            master = int(f.read())
+        pids = children(master)
+        per_worker = [usage(pid) for pid in pids]
+        master_usage = usage(master)
+    finally:
+        proc.terminate()
+        proc.wait()
+        log.close()
+        shutil.rmtree(data_dir, ignore_errors=True)
+    if len(per_worker) != workers:
+        print(f"  warning: found {len(per_worker)} workers, expected {workers}", file=sys.stderr)
+    mean = lambda key: round(sum(w[key] for w in per_worker) / max(1, len(per_worker)))
+    return {
+        'mode': mode,
+        'workers': workers,
+        'worker_rss_kb': mean('rss_kb'),
+        'worker_pss_kb': mean('pss_kb'),
+        'worker_private_kb': mean('private_kb'),
+        'worker_shared_kb': mean('shared_kb'),
+        'master_pss_kb': master_usage['pss_kb'],
+        'total_pss_kb': master_usage['pss_kb'] + sum(w['pss_kb'] for w in per_worker),
+        'per_worker': per_worker
+    }
+
+def print_report(rows):
+    print(f"{'mode':<9}{'workers':>8}{'RSS/worker':>12}{'PSS/worker':>12}{'private/wkr':>13}"
+          f"{'shared/wkr':>12}{'master PSS':>12}{'total PSS':>12}")
+    mb = lambda kb: f'{kb / 1024:,.1f} MB'
+    for r in rows:
+        print(f"{r['mode']:<9}{r['workers']:>8}{mb(r['worker_rss_kb']):>12}{mb(r['worker_pss_kb']):>12}"
+              f"{mb(r['worker_private_kb']):>13}{mb(r['worker_shared_kb']):>12}{mb(r['master_pss_kb']):>12}"
+              f"{mb(r['total_pss_kb']):>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', default='2,4,8', help='comma separated worker counts')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma separated: ' + ', '.join(MODES))
+    parser.add_argument('--requests', type=int, default=200, help='page views spread over the workers')
+    parser.add_argument('--settle', type=float, default=1.0, help='seconds to wait before sampling')
+    parser.add_argument('--port', type=int, default=8093)
+    parser.add_argument('--output', help='results JSON (default bench/results/cow-memory-<time>.json)')
+    args = parser.parse_args()
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        raise SystemExit('Needs Linux 4.14+ (/proc/<pid>/smaps_rollup)')
+    source = fixture_dir(args.users, args.seed)
+    rows = []
+    for workers in [int(w) for w in args.workers.split(',')]:
+        for mode in args.modes.split(','):
+            print(f"Measuring {mode} with {workers} workers...", file=sys.stderr)
+            rows.append(measure(mode, workers, source, args))
+    print_report(rows)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f'cow-memory-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    with open(output, 'w') as f:
+        json.dump({'users': args.users, 'results': rows}, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# Brain Games - Template Fragment Cache Savings
+# Times index.html and dashboard.html with the {% cache %} blocks disabled,
+# on a miss and on a hit, both as a bare render and as a full page request
+#
+#   python bench/fragment_bench.py                      # 10k users
+#   python bench/fragment_bench.py --users 100000 --preload
+#
+# Stats are warm in every case (stats_cache hit), so the render numbers are
+# template work only; the page numbers add the session, the aggregate
+# version lookup and the response.
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from microbench import PASSWORD, fixture_dir, pick_users
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+PAGES = {'index.html': '/', 'dashboard.html': '/dashboard'}
+
+def time_op(op, setup, reps, rounds):
+    """Median over rounds of the mean microseconds per op"""
+    setup()
+    op()
+    means = []
+    for _ in range(rounds):
+        spent = 0.0
+        for _ in range(reps):
+            setup()
+            started = time.perf_counter()
+            op()
+            spent += time.perf_counter() - started
+        means.append(spent / reps * 1e6)
+    return statistics.median(means)
+
+def bench_user(app, user_id, reps, rounds):
+    client = app.app.test_client()
+    client.post('/login', data={'email': user_id, 'password': PASSWORD})
+    user = {'display_name': user_id, 'avatar': None}
+    cache = app.fragment_cache
+    env = app.app.jinja_env
+    results = {}
+    for template, path in PAGES.items():
+        def render():
+            app.render_template(template, logged_in=True, user=user, user_id=user_id,
+                                stats_version=app.stats_version(user_id), load_stats=lambda: app.page_stats(user_id))
+
+        def page():
+            resp = client.get(path)
+            assert resp.status_code == 200, resp.status_code
+            resp.close()
+
+        def off():
+            env.fragment_cache = None
+
+        def miss():
+            env.fragment_cache = cache
+            cache.invalidate(user_id)
+
+        def hit():
+            env.fragment_cache = cache
+
+        row = {}
+        with app.app.test_request_context(path):
+            for mode, setup in (('off', off), ('miss', miss), ('hit', hit)):
+                row[f'render_{mode}_us'] = round(time_op(render, setup, reps, rounds), 1)
+        for mode, setup in (('off', off), ('hit', hit)):
+            row[f'page_{mode}_us'] = round(time_op(page, setup, reps, rounds), 1)
+        env.fragment_cache = cache
+        row['render_saved'] = round(1 - row['render_hit_us'] / row['render_off_us'], 3)
+        row['page_saved'] = round(1 - row['page_hit_us'] / row['page_off_us'], 3)
+        results[template] = row
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reps', type=int, default=200, help='ops per round')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--preload', action='store_true', help='run with PRELOAD_DATA=1')
+    parser.add_argument('--output', help='results JSON (default bench/results/fragments-<time>.json)')
+    args = parser.parse_args()
+
+    source = fixture_dir(args.users, args.seed)
+    data_dir = tempfile.mkdtemp(prefix='fragment-bench-')
+    shutil.rmtree(data_dir)
+    shutil.copytree(source, data_dir)
+    os.environ.update(DATA_DIR=data_dir, JOB_WORKERS='0', EMAIL_SENDERS='0', SNAPSHOT_INTERVAL='3600',
+                      PRELOAD_DATA='1' if args.preload else '0')
+    sys.path.insert(0, ROOT)
+    try:
+        heavy, typical = pick_users(data_dir)
+        import app
+        results = {'users': args.users, 'preload': args.preload, 'heavy': {}, 'typical': {}}
+        print(f"{'user':<9}{'template':<16}{'render off':>11}{'miss':>9}{'hit':>9}{'saved':>7}"
+              f"{'page off':>11}{'hit':>9}{'saved':>7}   (us)")
+        for name, user_id in (('heavy', heavy), ('typical', typical)):
+            results[name] = bench_user(app, user_id, args.reps, args.rounds)
+            for template, r in results[name].items():
+                print(f"{name:<9}{template:<16}{r['render_off_us']:>11,.0f}{r['render_miss_us']:>9,.0f}"
+                      f"{r['render_hit_us']:>9,.0f}{r['render_saved']:>7.0%}"
+                      f"{r['page_off_us']:>11,.0f}{r['page_hit_us']:>9,.0f}{r['page_saved']:>7.0%}")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f'fragments-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
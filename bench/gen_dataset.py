@@ -0,0 +1,257 @@
+# Brain Games - Synthetic Dataset Generator
+# Writes seeded, realistic users/scores/aggregates/badges files for scale
+# testing, streaming one user at a time so 1M users fit in constant memory
+#
+#   python bench/gen_dataset.py --users 100000 --out /tmp/bg-100k
+#   python bench/gen_dataset.py --users 1000000 --out /tmp/bg-1m --compact
+#   python bench/gen_dataset.py --users 100000 --out /tmp/bg-sharded --shards a,b,c
+#
+# The same --seed and --users always produce the same players, whichever
+# layout they are written in. Every player's password is --password.
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from badges import BADGE_ENGINE
+from sharding import HashRing, shard_key
+
+GAME_TYPES = ['memory', 'problem_solving', 'tbi_memory', 'stroop_test']
+DIFFICULTIES = ['easy', 'medium', 'hard']
+# tbi_memory shows this many words per round
+TBI_WORDS = {'easy': 4, 'medium': 6, 'hard': 8}
+MAX_HISTORY = 100  # add_score keeps the last 100 scores per game
+
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn',
+               'Maria', 'Wei', 'Aisha', 'Luca', 'Noah', 'Emma', 'Olivia', 'Liam', 'Mateo', 'Yuki',
+               'Priya', 'Omar', 'Sofia', 'Ivan', 'Chloe', 'Kwame', 'Nina', 'Diego', 'Hana', 'Eli']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Okafor', 'Müller', 'Rossi', 'Kim', 'Patel', 'Nguyen', 'Silva',
+              'Johnson', 'Brown', 'Ivanova', 'Haddad', 'Tanaka', 'Lopez', 'Novak', 'Singh', 'Cohen', 'Ali']
+
+# ============================================================================
+# STREAMING JSON
+# ============================================================================
+
+class JsonObjectWriter:
+    """Writes one top-level JSON object entry by entry.
+
+    With indent=2 the output is byte-for-byte what json.dump(obj, f, indent=2)
+    would produce, so file sizes and parse times match files the app wrote.
+    """
+
+    def __init__(self, path, indent=2):
+        self.path = path
+        self.indent = indent
+        self.count = 0
+        self._tmp_path = f'{path}.tmp'
+        self._f = open(self._tmp_path, 'w', buffering=1 << 20)
+        self._f.write('{')
+
+    def add(self, key, value):
+        sep = ',' if self.count else ''
+        if self.indent:
+            body = json.dumps(value, indent=self.indent).replace('\n', '\n' + ' ' * self.indent)
+            self._f.write(f'{sep}\n{" " * self.indent}{json.dumps(key)}: {body}')
+        else:
+            self._f.write(f'{sep}{json.dumps(key)}:{json.dumps(value, separators=(",", ":"))}')
+        self.count += 1
+
+    def close(self):
+        if self.indent and self.count:
+            self._f.write('\n')
+        self._f.write('}')
+        self._f.close()
+        os.replace(self._tmp_path, self.path)
+
+class DataDirWriter:
+    """The four per-user JSON stores of one DATA_DIR"""
+
+    FILES = ('users', 'scores', 'aggregates', 'badges')
+
+    def __init__(self, directory, indent):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.writers = {name: JsonObjectWriter(os.path.join(directory, f'{name}.json'), indent) for name in self.FILES}
+
+    def add(self, user_id, record):
+        for name in self.FILES:
+            if record.get(name) is not None:
+                self.writers[name].add(user_id, record[name])
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+# ============================================================================
+# PLAYER MODEL
+# ============================================================================
+
+def _sigmoid(x):
+    return 1 / (1 + math.exp(-x))
+
+def _binomial(rng, n, p):
+    return sum(1 for _ in range(n) if rng.random() < p)
+
+def play_score(rng, game, difficulty, skill, progress):
+    """One score for a game, given skill (z-score) and how far into their
+    playing life the player is (0..1, players improve with practice)"""
+    harder = {'easy': -0.6, 'medium': 0.0, 'hard': 0.7}[difficulty]
+    if game == 'memory':
+        # Longest sequence repeated; most players top out around 5-8
+        return max(0, int(rng.gauss(5 + 2 * skill + 2 * progress - harder, 2)))
+    if game == 'problem_solving':
+        return min(100, max(0, round(rng.gauss(55 + 12 * skill + 8 * progress - 6 * harder, 15))))
+    if game == 'tbi_memory':
+        words = TBI_WORDS[difficulty]
+        correct = _binomial(rng, words, _sigmoid(0.8 + 0.9 * skill + 0.6 * progress - harder))
+        return round(correct / words * 100)
+    # stroop_test: ten trials
+    return _binomial(rng, 10, _sigmoid(1.2 + 0.8 * skill + 0.5 * progress)) * 10
+
+def plays_for(rng, max_plays):
+    """Total games played: many casual players, a long tail of heavy ones"""
+    if rng.random() < 0.15:
+        return 0  # signed up and never played
+    return min(max_plays, int(rng.paretovariate(1.16) * 2))
+
+def difficulty_weights(rng, skill):
+    lean = skill + rng.gauss(0, 0.7)
+    return [max(0.05, 1 - lean), 1.5, max(0.05, 0.5 + lean)]
+
+def streak_ending(days):
+    """Consecutive days ending at the last day played, like update_aggregates"""
+    ordered = sorted(days)
+    streak = 1
+    for prev, cur in zip(reversed(ordered[:-1]), reversed(ordered)):
+        if (cur - prev).days == 1:
+            streak += 1
+        else:
+            break
+    return streak
+
+def make_player(seed, index, start, end, password_hash, max_plays):
+    rng = random.Random(seed * 1_000_003 + index)
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    user_id = f'{first.lower()}.{last.lower()}{index}@example.com'.replace('ü', 'u')
+    span = (end - start).total_seconds()
+    signup = start + timedelta(seconds=rng.random() * span * 0.9)
+    skill = rng.gauss(0, 1)
+
+    total = plays_for(rng, max_plays)
+    # Each player has favourite games
+    preference = [rng.gammavariate(0.7, 1) for _ in GAME_TYPES]
+    diff_weights = difficulty_weights(rng, skill)
+    # Heavy players stay active longer; times cluster inside the active window
+    remaining = (end - signup).total_seconds()
+    active = remaining * min(1.0, rng.betavariate(1, 3) + total / 400)
+    times = sorted(rng.random() * active for _ in range(total))
+
+    scores = {game: [] for game in GAME_TYPES}
+    agg = {
+        'total_games': total,
+        'games': {game: {'count': 0, 'best': 0} for game in GAME_TYPES},
+        'streak': 0,
+        'last_played': None,
+        'version': total
+    }
+    days = set()
+    for i, offset in enumerate(times):
+        game = rng.choices(GAME_TYPES, preference)[0]
+        difficulty = rng.choices(DIFFICULTIES, diff_weights)[0]
+        played_at = signup + timedelta(seconds=offset)
+        score = play_score(rng, game, difficulty, skill, i / max(1, total - 1))
+        scores[game].append({'score': score, 'difficulty': difficulty, 'date': played_at.strftime('%Y-%m-%d %H:%M:%S')})
+        stats = agg['games'][game]
+        stats['count'] += 1
+        stats['best'] = max(stats['best'], score)
+        days.add(played_at.date())
+
+    if days:
+        agg['last_played'] = max(days).isoformat()
+        agg['streak'] = streak_ending(days)
+    for game in GAME_TYPES:
+        scores[game] = scores[game][-MAX_HISTORY:]
+
+    badges = None
+    if total:
+        earned = BADGE_ENGINE.evaluate(agg, BADGE_ENGINE.watched_keys(), {})
+        if earned:
+            awarded_at = f"{agg['last_played']} 23:59:59"
+            badges = {badge_id: awarded_at for badge_id in earned}
+
+    return user_id, {
+        'users': {
+            'password': password_hash,
+            'display_name': f'{first} {last}',
+            'created_at': signup.strftime('%Y-%m-%d %H:%M:%S'),
+            'avatar': None
+        },
+        'scores': scores if total else None,
+        'aggregates': agg if total else None,
+        'badges': badges
+    }
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', required=True, help='DATA_DIR to write (one subdirectory per node with --shards)')
+    parser.add_argument('--shards', help='comma separated node names, written with the same hash ring the app uses')
+    parser.add_argument('--vnodes', type=int, default=64)
+    parser.add_argument('--start', default='2025-01-01', help='earliest signup date')
+    parser.add_argument('--end', default='2025-12-31', help='latest play date')
+    parser.add_argument('--max-plays', type=int, default=2000, help='cap on games per player')
+    parser.add_argument('--password', default='password1')
+    parser.add_argument('--compact', action='store_true', help='no indentation (the app writes indent=2)')
+    args = parser.parse_args()
+
+    start = datetime.fromisoformat(args.start)
+    end = datetime.fromisoformat(args.end) + timedelta(days=1)
+    # Legacy unsalted SHA-256: scrypt would take hours at 1M users. The app
+    # accepts it and upgrades each account to scrypt at its first login.
+    password_hash = hashlib.sha256(args.password.encode()).hexdigest()
+    indent = None if args.compact else 2
+
+    if args.shards:
+        nodes = [n.strip() for n in args.shards.split(',') if n.strip()]
+        ring = HashRing(nodes, args.vnodes)
+        outputs = {node: DataDirWriter(os.path.join(args.out, node), indent) for node in nodes}
+        route = lambda user_id: ring.node_for(shard_key(user_id))
+    else:
+        outputs = {None: DataDirWriter(args.out, indent)}
+        route = lambda user_id: None
+
+    began = time.time()
+    plays = 0
+    for index in range(args.users):
+        user_id, record = make_player(args.seed, index, start, end, password_hash, args.max_plays)
+        if record['aggregates']:
+            plays += record['aggregates']['total_games']
+        outputs[route(user_id)].add(user_id, record)
+        if (index + 1) % 50000 == 0:
+            print(f"  {index + 1} users, {plays} games, {time.time() - began:.0f}s")
+    for writer in outputs.values():
+        writer.close()
+
+    print(f"Wrote {args.users} users and {plays} games in {time.time() - began:.1f}s")
+    for node, writer in outputs.items():
+        sizes = ', '.join(f"{name}.json {os.path.getsize(w.path) / 1e6:.1f} MB"
+                          for name, w in writer.writers.items())
+        print(f"  {writer.directory}: {writer.writers['users'].count} users; {sizes}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# Brain Games - Invalidation Bus Propagation Latency
+# Measures how long a published key takes to reach subscribers in other processes
+#
+#   python bench/invalidation_latency.py --processes 4 --probes 200
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invalidation import InvalidationBus
+
+def subscriber(path, poll_interval, ready, results, probes):
+    bus = InvalidationBus(path, poll_interval=poll_interval)
+    seen = {}
+
+    @bus.subscribe
+    def on_keys(keys):
+        now = time.time()
+        for key in keys:
+            if key.startswith('probe:'):
+                seen.setdefault(key, now)
+
+    bus.start()
+    ready.set()
+    deadline = time.time() + 60
+    while len(seen) < probes and time.time() < deadline:
+        time.sleep(0.01)
+    results.put(seen)
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--probes', type=int, default=200)
+    parser.add_argument('--interval', type=float, default=0.01, help='seconds between probes')
+    parser.add_argument('--poll-interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'invalidation.sqlite3')
+    publisher = InvalidationBus(path)
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    readies = []
+    procs = []
+    for _ in range(args.processes):
+        ready = ctx.Event()
+        proc = ctx.Process(target=subscriber, args=(path, args.poll_interval, ready, results, args.probes))
+        proc.start()
+        readies.append(ready)
+        procs.append(proc)
+    for ready in readies:
+        ready.wait(30)
+
+    published = {}
+    for i in range(args.probes):
+        key = f'probe:{i}'
+        published[key] = time.time()
+        publisher.publish(key)
+        time.sleep(args.interval)
+
+    latencies = []
+    missing = 0
+    for _ in procs:
+        seen = results.get(timeout=90)
+        for key, sent in published.items():
+            if key in seen:
+                latencies.append((seen[key] - sent) * 1000)
+            else:
+                missing += 1
+    for proc in procs:
+        proc.join()
+
+    print(f"processes={args.processes} probes={args.probes} poll_interval={args.poll_interval * 1000:.0f}ms")
+    print(f"delivered={len(latencies)} missing={missing}")
+    if latencies:
+        print(f"latency ms: p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+              f"p99={percentile(latencies, 99):.1f} max={max(latencies):.1f}")
+    return 1 if missing else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
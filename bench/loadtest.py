@@ -0,0 +1,399 @@
+# Brain Games - Load Test
+# Drives a realistic player mix against the app and reports throughput and
+# latency percentiles per route, saved as JSON for comparing runs
+#
+#   python bench/loadtest.py --target testclient --duration 20 --concurrency 8
+#   python bench/loadtest.py --target gunicorn --workers 4 --worker-class gthread
+#   python bench/loadtest.py --target url --url http://127.0.0.1:8080
+#   python bench/loadtest.py --compare bench/results/before.json bench/results/after.json
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gen_dataset import DIFFICULTIES, difficulty_weights, play_score
+
+GAMES = ['memory', 'problem_solving', 'tbi_memory', 'stroop_test']
+GAME_PAGES = ['/games/memory', '/games/problem-solving', '/games/tbi-memory', '/games/stroop-test']
+PASSWORD = 'loadtest1'
+DEFAULT_MIX = 'signup=1,login=2,game_page=10,save_score=8,history=3,leaderboards=4,dashboard=2'
+
+# ============================================================================
+# CLIENTS
+# ============================================================================
+
+class TestClientSession:
+    """One player's session against the app in this process"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, form=None, payload=None):
+        resp = self.client.open(path, method=method, data=form, json=payload)
+        resp.close()
+        return resp.status_code
+
+class HTTPSession:
+    """One player's session over a persistent HTTP connection with cookies"""
+
+    def __init__(self, base_url, timeout=30):
+        parsed = urllib.parse.urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.cookies = {}
+        self.conn = None
+
+    def _send(self, method, path, body, headers):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self.conn.request(method, path, body=body, headers=headers)
+        resp = self.conn.getresponse()
+        resp.read()
+        for header, value in resp.getheaders():
+            if header.lower() == 'set-cookie':
+                name, _, rest = value.partition('=')
+                self.cookies[name.strip()] = rest.split(';', 1)[0]
+        if resp.getheader('Connection', '').lower() == 'close':
+            self.conn.close()
+            self.conn = None
+        return resp.status
+
+    def request(self, method, path, form=None, payload=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        try:
+            return self._send(method, path, body, headers)
+        except (http.client.HTTPException, OSError):
+            # Sync gunicorn workers close idle keep-alive connections; retry once
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+            return self._send(method, path, body, headers)
+
+# ============================================================================
+# TARGETS
+# ============================================================================
+
+def start_testclient(args, env):
+    os.environ.update(env)
+    import app
+    return (lambda: TestClientSession(app.app)), lambda: None
+
+def start_gunicorn(args, env):
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app']
+    proc_env = dict(os.environ, **env, GUNICORN_BIND=f'127.0.0.1:{args.port}',
+                    WEB_CONCURRENCY=str(args.workers), GUNICORN_WORKER_CLASS=args.worker_class)
+    if args.threads:
+        cmd += ['--threads', str(args.threads)]
+    log = open(os.path.join(env['DATA_DIR'], 'gunicorn.log'), 'w')
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=proc_env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{args.port}'
+    wait_ready(base_url, proc)
+
+    def stop():
+        proc.terminate()
+        proc.wait()
+        log.close()
+    return (lambda: HTTPSession(base_url)), stop
+
+def start_url(args, env):
+    return (lambda: HTTPSession(args.url)), lambda: None
+
+def wait_ready(base_url, proc=None, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError('Server exited during startup')
+        try:
+            if HTTPSession(base_url, timeout=2).request('GET', '/login') == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'{base_url} did not become ready')
+
+# ============================================================================
+# PLAYERS
+# ============================================================================
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(ACTIONS)
+    if unknown:
+        raise SystemExit(f'Unknown actions in mix: {", ".join(sorted(unknown))}')
+    return mix
+
+class Player:
+    def __init__(self, session, rng, pool, run_id):
+        self.session = session
+        self.rng = rng
+        self.pool = pool
+        self.run_id = run_id
+        self.logged_in = False
+        # Scores follow the same model as the generated datasets
+        self.skill = rng.gauss(0, 1)
+        self.difficulty_weights = difficulty_weights(rng, self.skill)
+
+    def signup(self):
+        email = f'lt-{self.run_id}-{threading.get_ident()}-{self.rng.getrandbits(40):x}@example.com'
+        status = self.session.request('POST', '/signup', form={'display_name': 'Load Tester', 'email': email, 'password': PASSWORD})
+        # A successful signup or login redirects; 200 is the form again with an error
+        self.logged_in = status == 302
+        return status
+
+    def login(self):
+        email = self.rng.choice(self.pool)
+        status = self.session.request('POST', '/login', form={'email': email, 'password': PASSWORD})
+        self.logged_in = status == 302
+        return status
+
+    def game_page(self):
+        return self.session.request('GET', self.rng.choice(GAME_PAGES))
+
+    def save_score(self):
+        game = self.rng.choice(GAMES)
+        difficulty = self.rng.choices(DIFFICULTIES, self.difficulty_weights)[0]
+        payload = {'game_type': game, 'difficulty': difficulty,
+                   'score': play_score(self.rng, game, difficulty, self.skill, self.rng.random())}
+        return self.session.request('POST', '/api/save-score', payload=payload)
+
+    def history(self):
+        return self.session.request('GET', '/history')
+
+    def leaderboards(self):
+        return self.session.request('GET', '/leaderboards')
+
+    def dashboard(self):
+        return self.session.request('GET', '/dashboard')
+
+ACTIONS = ['signup', 'login', 'game_page', 'save_score', 'history', 'leaderboards', 'dashboard']
+NEEDS_LOGIN = {'save_score', 'history', 'dashboard'}
+
+def seed_players(new_session, count, run_id):
+    pool = []
+    session = new_session()
+    for i in range(count):
+        email = f'lt-{run_id}-seed{i}@example.com'
+        session.request('POST', '/signup', form={'display_name': f'Seed {i}', 'email': email, 'password': PASSWORD})
+        pool.append(email)
+    return pool
+
+def run_player(index, args, new_session, mix, pool, run_id, start_at, stop_at, warm_until, samples):
+    rng = random.Random(args.seed * 1000 + index)
+    player = Player(new_session(), rng, pool, run_id)
+    names, weights = zip(*mix.items())
+    local = {name: [] for name in names}
+    while time.time() < start_at:
+        time.sleep(0.001)
+    while True:
+        now = time.time()
+        if now >= stop_at:
+            break
+        action = rng.choices(names, weights)[0]
+        if action in NEEDS_LOGIN and not player.logged_in:
+            action = 'login'
+        started = time.perf_counter()
+        try:
+            status = getattr(player, action)()
+        except Exception as e:
+            status = f'error: {type(e).__name__}'
+        elapsed = time.perf_counter() - started
+        if now >= warm_until:
+            local.setdefault(action, []).append((elapsed, status))
+        if args.think_ms:
+            time.sleep(rng.expovariate(1000 / args.think_ms))
+    samples.append(local)
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return None
+    k = (len(sorted_samples) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_samples) - 1)
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (k - lo)
+
+def summarize(per_thread, measured_seconds):
+    merged = {}
+    for local in per_thread:
+        for action, items in local.items():
+            merged.setdefault(action, []).extend(items)
+    routes = {}
+    all_latencies = []
+    for action, items in sorted(merged.items()):
+        latencies = sorted(elapsed for elapsed, _ in items)
+        all_latencies.extend(latencies)
+        statuses = {}
+        for _, status in items:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+        routes[action] = _stats(latencies, measured_seconds)
+        routes[action].update({'statuses': statuses, 'errors': errors})
+    all_latencies.sort()
+    return routes, _stats(all_latencies, measured_seconds)
+
+def _stats(latencies, seconds):
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / seconds, 2) if seconds else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'max_ms': ms(latencies[-1]) if latencies else None
+    }
+
+def print_report(result):
+    print(f"{result['label'] or result['target']}: {result['overall']['requests']} requests in "
+          f"{result['measured_seconds']:.1f}s, {result['overall']['throughput_rps']} req/s")
+    print(f"{'route':<14}{'reqs':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  statuses")
+    for name, stats in list(result['routes'].items()) + [('overall', result['overall'])]:
+        statuses = ' '.join(f'{k}:{v}' for k, v in sorted(stats.get('statuses', {}).items()))
+        print(f"{name:<14}{stats['requests']:>8}{stats['throughput_rps'] or 0:>9.1f}"
+              f"{stats['p50_ms'] or 0:>9.1f}{stats['p95_ms'] or 0:>9.1f}{stats['p99_ms'] or 0:>9.1f}"
+              f"{stats['max_ms'] or 0:>9.1f}  {statuses}")
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'route':<14}{'req/s before':>14}{'after':>10}{'p95 before':>12}{'after':>10}{'p99 before':>12}{'after':>10}")
+    routes = sorted(set(before['routes']) | set(after['routes'])) + ['overall']
+    for name in routes:
+        b = before['overall'] if name == 'overall' else before['routes'].get(name, {})
+        a = after['overall'] if name == 'overall' else after['routes'].get(name, {})
+        cells = [b.get('throughput_rps'), a.get('throughput_rps'), b.get('p95_ms'), a.get('p95_ms'), b.get('p99_ms'), a.get('p99_ms')]
+        print(f"{name:<14}" + ''.join(f"{c if c is not None else '-':>{w}}" for c, w in zip(cells, (14, 10, 12, 10, 12, 10))))
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--target', choices=['testclient', 'gunicorn', 'url'], default='testclient')
+    parser.add_argument('--url', help='base URL for --target url')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds excluded from the results')
+    parser.add_argument('--concurrency', type=int, default=8, help='simultaneous players')
+    parser.add_argument('--players', type=int, default=50, help='accounts created up front for logins')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='comma separated action=weight')
+    parser.add_argument('--think-ms', type=float, default=0, help='mean pause between a player\'s requests')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class')
+    parser.add_argument('--threads', type=int, default=0, help='gunicorn threads per worker (gthread)')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--data-dir', help='DATA_DIR for the app (default: a fresh temp dir)')
+    parser.add_argument('--no-write-limits', action='store_true', help='raise write rate limits out of the way')
+    parser.add_argument('--env', action='append', default=[], help='extra KEY=VALUE for the app')
+    parser.add_argument('--label', default='', help='name for this run, e.g. the storage backend')
+    parser.add_argument('--output', help='result JSON path (default: bench/results/loadtest-<target>-<time>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    if args.target == 'url' and not args.url:
+        parser.error('--target url needs --url')
+
+    mix = parse_mix(args.mix)
+    env = {'DATA_DIR': args.data_dir or tempfile.mkdtemp(prefix='loadtest-')}
+    if args.no_write_limits:
+        env.update(WRITE_RATE_PER_USER='100000', WRITE_BURST_PER_USER='100000',
+                   WRITE_RATE_GLOBAL='100000', WRITE_BURST_GLOBAL='100000', MAX_INFLIGHT_WRITES='100000')
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    os.makedirs(env['DATA_DIR'], exist_ok=True)
+
+    starters = {'testclient': start_testclient, 'gunicorn': start_gunicorn, 'url': start_url}
+    new_session, stop = starters[args.target](args, env)
+    run_id = f'{int(time.time())}'
+    try:
+        print(f"Seeding {args.players} players...")
+        pool = seed_players(new_session, args.players, run_id)
+        samples = []
+        start_at = time.time() + 0.5
+        warm_until = start_at + args.warmup
+        stop_at = warm_until + args.duration
+        threads = [threading.Thread(target=run_player, args=(i, args, new_session, mix, pool, run_id,
+                                                             start_at, stop_at, warm_until, samples))
+                   for i in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        stop()
+
+    routes, overall = summarize(samples, args.duration)
+    result = {
+        'label': args.label,
+        'target': args.target,
+        'url': args.url,
+        'workers': args.workers if args.target == 'gunicorn' else None,
+        'worker_class': args.worker_class if args.target == 'gunicorn' else None,
+        'threads': args.threads or None,
+        'concurrency': args.concurrency,
+        'players': args.players,
+        'mix': mix,
+        'think_ms': args.think_ms,
+        'seed': args.seed,
+        'env': {k: v for k, v in env.items() if k != 'DATA_DIR'},
+        'measured_seconds': args.duration,
+        'warmup_seconds': args.warmup,
+        'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_at)),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'routes': routes,
+        'overall': overall
+    }
+    print_report(result)
+    output = args.output or os.path.join(ROOT, 'bench', 'results',
+                                         f"loadtest-{args.label or args.target}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved {output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# Brain Games - Login Cost and Its Effect on Other Routes
+# Runs a login-heavy mix next to game page views with password hashing
+# inline and on the low-priority pool, and reports login throughput and the
+# latency of the other routes while logins are in flight
+#
+#   python bench/login_bench.py                             # inline vs pool
+#   python bench/login_bench.py --scrypt-n 16384,32768      # cost sweep
+#   python bench/login_bench.py --worker-class gthread --workers 2
+#
+# The interesting columns are the game_page tail latencies: hashing on the
+# pool (niced) should leave them close to a run without logins.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+LOGIN_MIX = 'login=3,game_page=10,leaderboards=2'
+# PASSWORD_HASH_WORKERS per mode
+MODES = {'inline': '0', 'pool': '1'}
+
+def run(mode, scrypt_n, args):
+    output = os.path.join(tempfile.mkdtemp(prefix='login-bench-'), 'result.json')
+    cmd = [sys.executable, os.path.join(ROOT, 'bench', 'loadtest.py'), '--target', 'gunicorn',
+           '--workers', str(args.workers), '--worker-class', args.worker_class, '--port', str(args.port),
+           '--concurrency', str(args.concurrency), '--duration', str(args.duration), '--warmup', str(args.warmup),
+           '--mix', args.mix, '--players', str(args.players), '--label', f'{mode}-n{scrypt_n}',
+           '--output', output, '--no-write-limits',
+           '--env', f'PASSWORD_HASH_WORKERS={MODES[mode]}', '--env', f'SCRYPT_N={scrypt_n}']
+    if args.worker_class == 'gthread':
+        cmd += ['--threads', str(args.threads)]
+    subprocess.run(cmd, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        return json.load(f)
+
+def print_table(rows, args):
+    print(f"{args.workers} {args.worker_class} workers, {args.concurrency} clients, mix {args.mix}")
+    print(f"{'mode':<8}{'scrypt n':>9}{'login r/s':>11}{'login p95':>11}{'page r/s':>10}"
+          f"{'page p50':>10}{'page p95':>10}{'page p99':>10}{'errors':>8}")
+    for row in rows:
+        routes = row['result']['routes']
+        login, page = routes.get('login', {}), routes.get('game_page', {})
+        errors = sum(stats.get('errors', 0) for stats in routes.values())
+        print(f"{row['mode']:<8}{row['scrypt_n']:>9}{login.get('throughput_rps') or 0:>11.1f}{login.get('p95_ms') or 0:>11.1f}"
+              f"{page.get('throughput_rps') or 0:>10.1f}{page.get('p50_ms') or 0:>10.1f}{page.get('p95_ms') or 0:>10.1f}"
+              f"{page.get('p99_ms') or 0:>10.1f}{errors:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modes', default=','.join(MODES), help='comma separated: ' + ', '.join(MODES))
+    parser.add_argument('--scrypt-n', default=str(2 ** 14), help='comma separated scrypt n values')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--worker-class', default='sync', choices=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--players', type=int, default=30)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--mix', default=LOGIN_MIX)
+    parser.add_argument('--port', type=int, default=18091)
+    parser.add_argument('--output', help='results JSON (default bench/results/login-<time>.json)')
+    args = parser.parse_args()
+
+    rows = []
+    for scrypt_n in [int(n) for n in args.scrypt_n.split(',')]:
+        for mode in args.modes.split(','):
+            print(f"Running {mode}, scrypt n={scrypt_n}...", file=sys.stderr)
+            rows.append({'mode': mode, 'scrypt_n': scrypt_n, 'result': run(mode, scrypt_n, args)})
+    print_table(rows, args)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f'login-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    with open(output, 'w') as f:
+        json.dump({'args': vars(args), 'runs': rows}, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
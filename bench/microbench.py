@@ -0,0 +1,274 @@
+# Brain Games - Storage and Stats Microbenchmarks
+# Times the hot data-layer functions against generated fixtures, reports
+# ops/sec and allocations, and fails when a tracked metric regresses
+#
+#   python bench/microbench.py                       # compare against the baseline
+#   python bench/microbench.py --sizes 1000,10000,100000
+#   python bench/microbench.py --update-baseline     # record new numbers
+#   python bench/microbench.py --only get_leaderboard_cold,history_page
+#
+# Baseline numbers are machine specific; regenerate them on the machine
+# that runs the gate.
+
+import argparse
+import json
+import os
+import secrets
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT, 'bench', 'microbench_baseline.json')
+FIXTURES_DIR = os.path.join(tempfile.gettempdir(), 'brain-games-fixtures')
+PASSWORD = 'password1'
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def fixture_dir(size, seed):
+    """Generate (once) a dataset of `size` users and return its directory"""
+    path = os.path.join(FIXTURES_DIR, f'{size}-{seed}')
+    if not os.path.exists(os.path.join(path, 'users.json')):
+        subprocess.run([sys.executable, os.path.join(ROOT, 'bench', 'gen_dataset.py'), '--users', str(size),
+                        '--seed', str(seed), '--out', path, '--password', PASSWORD],
+                       check=True, stdout=subprocess.DEVNULL)
+        # Outstanding reset tokens, about one per twenty users
+        now = datetime.now()
+        tokens = {secrets.token_urlsafe(32): {
+            'email': f'user{i}@example.com',
+            'created_at': now.isoformat(),
+            'expires_at': (now + timedelta(days=3650)).isoformat()
+        } for i in range(max(1, size // 20))}
+        with open(os.path.join(path, 'reset_tokens.json'), 'w') as f:
+            json.dump(tokens, f, indent=2)
+    return path
+
+def pick_users(data_dir):
+    """The heaviest player and a typical one, by games played"""
+    with open(os.path.join(data_dir, 'aggregates.json')) as f:
+        totals = sorted((agg['total_games'], user_id) for user_id, agg in json.load(f).items())
+    return totals[-1][1], totals[len(totals) // 2][1]
+
+# ============================================================================
+# BENCHMARKS
+# ============================================================================
+
+def define_benchmarks(app, heavy, typical):
+    """Return {name: (setup, op)}; setup runs before each op and is not timed"""
+    client = app.app.test_client()
+    client.post('/login', data={'email': heavy, 'password': PASSWORD})
+    token = app.create_reset_token(typical)
+    counter = iter(range(10 ** 9))
+
+    def invalidate_stats():
+        app.stats_cache.invalidate(typical)
+
+    def clear_leaderboards():
+        app.leaderboard_cache.clear()
+
+    def noop():
+        pass
+
+    def history():
+        resp = client.get('/history')
+        assert resp.status_code == 200, resp.status_code
+        resp.close()
+
+    return {
+        'load_users': (noop, app.load_users),
+        'load_scores': (noop, app.load_scores),
+        'add_score': (noop, lambda: app.add_score(typical, 'memory', next(counter) % 12, 'medium')),
+        'get_game_stats_cold': (invalidate_stats, lambda: app.get_game_stats(typical, 'memory')),
+        'get_game_stats_warm': (noop, lambda: app.get_game_stats(typical, 'memory')),
+        'get_all_games_stats_cold': (invalidate_stats, lambda: app.get_all_games_stats(typical)),
+        'get_leaderboard_cold': (clear_leaderboards, lambda: app.get_leaderboard('memory', 10)),
+        'get_leaderboard_warm': (noop, lambda: app.get_leaderboard('memory', 10)),
+        'verify_reset_token': (noop, lambda: app.verify_reset_token(token)),
+        'history_page': (noop, history)
+    }
+
+def _round(setup, op, min_time):
+    reps = 0
+    spent = 0.0
+    while spent < min_time:
+        setup()
+        start = time.perf_counter()
+        op()
+        spent += time.perf_counter() - start
+        reps += 1
+    return reps / spent
+
+def _calibration_op():
+    blob = json.dumps({f'user{i}@example.com': {'memory': [{'score': j, 'date': '2025-01-01'} for j in range(20)]}
+                       for i in range(200)})
+
+    def op():
+        data = json.loads(blob)
+        sorted((max(s['score'] for s in v['memory']), k) for k, v in data.items())
+    return op
+
+CALIBRATION = _calibration_op()
+
+def measure(setup, op, min_time, rounds):
+    """Return (best ops/sec, median speed relative to the calibration loop).
+
+    Each round is paired with a round of a fixed parse-and-aggregate loop.
+    The gate compares the ratio of the two, so a slower machine or a noisy
+    neighbour during one round moves both numbers and cancels out.
+    """
+    setup()
+    op()  # warm up imports, caches and the page cache
+    rates, relative = [], []
+    for _ in range(rounds):
+        calibration = _round(lambda: None, CALIBRATION, min_time / 2)
+        rate = _round(setup, op, min_time)
+        rates.append(rate)
+        relative.append(rate / calibration)
+    return max(rates), statistics.median(relative)
+
+def allocations(setup, op, reps=3):
+    """Peak traced bytes during one op and blocks it left allocated (medians)"""
+    peaks, blocks = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(reps):
+            setup()
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            op()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            peaks.append(peak - base)
+            blocks.append(sum(max(0, stat.count_diff) for stat in after.compare_to(before, 'filename')))
+    finally:
+        tracemalloc.stop()
+    return statistics.median(peaks), statistics.median(blocks)
+
+def run_size(size, args):
+    """Run every benchmark for one fixture size in a fresh process"""
+    source = fixture_dir(size, args.seed)
+    data_dir = tempfile.mkdtemp(prefix=f'microbench-{size}-')
+    shutil.rmtree(data_dir)
+    shutil.copytree(source, data_dir)
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', data_dir,
+           '--min-time', str(args.min_time), '--rounds', str(args.rounds)]
+    if args.only:
+        cmd += ['--only', args.only]
+    env = dict(os.environ, DATA_DIR=data_dir, JOB_WORKERS='0', SNAPSHOT_INTERVAL='3600')
+    try:
+        out = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return json.loads(out.strip().splitlines()[-1])
+
+def worker(args):
+    sys.path.insert(0, ROOT)
+    heavy, typical = pick_users(args.worker)
+    import app
+    benchmarks = define_benchmarks(app, heavy, typical)
+    only = set(args.only.split(',')) if args.only else None
+    results = {}
+    for name, (setup, op) in benchmarks.items():
+        if only and name not in only:
+            continue
+        rate, relative = measure(setup, op, args.min_time, args.rounds)
+        peak, blocks = allocations(setup, op)
+        results[name] = {'ops_per_sec': round(rate, 2), 'relative_speed': float(f'{relative:.6g}'),
+                         'alloc_peak_kb': round(peak / 1024, 1), 'retained_blocks': blocks}
+    print(json.dumps(results))
+
+# ============================================================================
+# REGRESSION GATE
+# ============================================================================
+
+# Higher is better for speed (relative to the calibration loop), lower for
+# allocations. Raw ops/sec is reported but too machine dependent to gate on.
+TRACKED = {'relative_speed': 'higher', 'alloc_peak_kb': 'lower'}
+# Peaks this small are interpreter noise, not a regression
+ALLOC_SLACK_KB = 16
+
+def regressions(results, baseline, threshold):
+    found = []
+    for size, benchmarks in results.items():
+        for name, metrics in benchmarks.items():
+            base = baseline.get(size, {}).get(name)
+            if not base:
+                continue
+            for metric, better in TRACKED.items():
+                old, new = base.get(metric), metrics.get(metric)
+                if not old or new is None:
+                    continue
+                if metric == 'alloc_peak_kb' and new - old < ALLOC_SLACK_KB:
+                    continue
+                change = (new - old) / old
+                if (better == 'higher' and change < -threshold) or (better == 'lower' and change > threshold):
+                    found.append((size, name, metric, old, new, change))
+    return found
+
+def print_results(results, baseline):
+    print(f"{'size':>8}  {'benchmark':<26}{'ops/sec':>12}{'speed vs base':>15}{'peak KB':>10}{'vs base':>9}{'retained':>10}")
+    for size, benchmarks in results.items():
+        for name, m in benchmarks.items():
+            base = baseline.get(size, {}).get(name, {})
+            delta = lambda metric: f"{(m[metric] - base[metric]) / base[metric]:+.0%}" if base.get(metric) else '-'
+            print(f"{size:>8}  {name:<26}{m['ops_per_sec']:>12,.1f}{delta('relative_speed'):>15}"
+                  f"{m['alloc_peak_kb']:>10,.1f}{delta('alloc_peak_kb'):>9}{m['retained_blocks']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,10000', help='comma separated user counts')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per round')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--only', help='comma separated benchmark names')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed regression, e.g. 0.25 for 25%%')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', help='also write the results JSON here')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return 0
+
+    results = {}
+    for size in [int(s) for s in args.sizes.split(',')]:
+        print(f"Running {size} users...", file=sys.stderr)
+        results[str(size)] = run_size(size, args)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        for size, benchmarks in results.items():
+            baseline.setdefault(size, {}).update(benchmarks)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    found = regressions(results, baseline, args.threshold)
+    for size, name, metric, old, new, change in found:
+        print(f"REGRESSION {size} {name} {metric}: {old} -> {new} ({change:+.0%})")
+    if found:
+        return 1
+    print('OK' if baseline else 'No baseline yet; run with --update-baseline')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# Brain Games - Player Search Latency
+# Builds the display-name index over synthetic users and times prefix,
+# typo and no-match queries
+#
+#   python bench/search_bench.py                        # 1M users
+#   python bench/search_bench.py --users 100000 --limit 50
+#
+# Names are random two-word strings, so prefixes of a few letters match
+# thousands of users and full names match about one.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import UserSearchIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+
+def random_word(rng, low, high):
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(low, high))).title()
+
+def swap_letters(rng, text):
+    i = rng.randrange(1, len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+def time_queries(index, queries, limit):
+    started = time.perf_counter()
+    for query in queries:
+        index.search(query, limit=limit)
+    return (time.perf_counter() - started) / len(queries) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=10, help='results per page')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='results JSON (default bench/results/search-<time>.json)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    first = [random_word(rng, 3, 8) for _ in range(5000)]
+    last = [random_word(rng, 4, 10) for _ in range(20000)]
+    users = {f'user{i}@example.com': {'display_name': f'{rng.choice(first)} {rng.choice(last)}'}
+             for i in range(args.users)}
+    index = UserSearchIndex('bench', lambda: users, lambda ids: {i: users.get(i) for i in ids})
+    started = time.perf_counter()
+    index.build()
+    build_seconds = time.perf_counter() - started
+
+    names = [users[f'user{rng.randrange(args.users)}@example.com']['display_name'] for _ in range(args.queries)]
+    cases = {
+        'prefix_3': [name[:3] for name in names],
+        'last_name_prefix_4': [name.split()[1][:4] for name in names],
+        'full_name': names,
+        'full_name_typo': [swap_letters(rng, name) for name in names],
+        'last_name_typo': [swap_letters(rng, name.split()[1]) for name in names],
+        'no_match': [f'qzx{i}' for i in range(args.queries)],
+    }
+    results = {'users': args.users, 'build_seconds': round(build_seconds, 2), 'us_per_query': {}}
+    print(f"{args.users:,} users indexed in {build_seconds:.1f} s, top {args.limit}")
+    for name, queries in cases.items():
+        time_queries(index, queries[:50], args.limit)
+        us = time_queries(index, queries, args.limit)
+        results['us_per_query'][name] = round(us, 1)
+        print(f"  {name:<20}{us:>9.0f} us/query")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f'search-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# Brain Games - Local Shard Cluster Check
+# Starts several app processes as shard nodes, drives traffic through one of
+# them, then adds and removes a node and checks placement and leaderboards
+#
+#   python bench/shard_cluster.py --nodes 3 --users 60
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sharding import HashRing, ShardRouter, rebalance, shard_key
+
+SECRET = 'shard-cluster-secret'
+GAMES = ['memory', 'problem_solving', 'tbi_memory', 'stroop_test']
+
+def start_node(name, port, nodes, base_dir):
+    data_dir = os.path.join(base_dir, name)
+    os.makedirs(data_dir, exist_ok=True)
+    env = dict(os.environ, DATA_DIR=data_dir, SHARD_SELF=name, SHARD_SECRET=SECRET,
+               SHARD_NODES=','.join(f'{n}={u}' for n, u in nodes.items()), JOB_WORKERS='1')
+    code = ('import app; app.job_queue.start(); app.invalidation_bus.start(); '
+            f'app.app.run(port={port}, threaded=True)')
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = nodes[name]
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + '/login', timeout=1).read()
+            return proc, data_dir
+        except Exception:
+            time.sleep(0.1)
+    raise RuntimeError(f'Node {name} did not start')
+
+def client():
+    return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+def post_form(opener, url, fields):
+    return opener.open(url, data=urllib.parse.urlencode(fields).encode(), timeout=10).read()
+
+def post_json(opener, url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+    return json.loads(opener.open(req, timeout=10).read())
+
+def local_users(data_dir):
+    with open(os.path.join(data_dir, 'users.json')) as f:
+        return set(json.load(f))
+
+def check_placement(nodes, data_dirs, players):
+    ring = HashRing(nodes)
+    misplaced = 0
+    for name in nodes:
+        for user_id in local_users(data_dirs[name]) & set(players):
+            if ring.node_for(shard_key(user_id)) != name:
+                misplaced += 1
+    held = set().union(*(local_users(data_dirs[n]) for n in nodes)) & set(players)
+    return misplaced, len(set(players) - held)
+
+def expected_board(players, game, limit=10):
+    return sorted((max(s[game]) for s in players.values() if s[game]), reverse=True)[:limit]
+
+def check_leaderboards(url, players):
+    ok = True
+    for game in GAMES:
+        board = json.loads(urllib.request.urlopen(f'{url}/api/leaderboards/{game}', timeout=10).read())['leaderboard']
+        if [row['score'] for row in board] != expected_board(players, game):
+            ok = False
+    return ok
+
+def report(stage, nodes, data_dirs, players, entry_url):
+    misplaced, missing = check_placement(nodes, data_dirs, players)
+    counts = {n: len(local_users(data_dirs[n]) & set(players)) for n in nodes}
+    boards_ok = check_leaderboards(entry_url, players)
+    print(f"{stage}: users per node {counts}, misplaced={misplaced}, missing={missing}, leaderboards_ok={boards_ok}")
+    return misplaced == 0 and missing == 0 and boards_ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--users', type=int, default=60)
+    parser.add_argument('--base-port', type=int, default=18600)
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp(prefix='shards-')
+    names = [chr(ord('a') + i) for i in range(args.nodes + 1)]
+    urls = {n: f'http://127.0.0.1:{args.base_port + i}' for i, n in enumerate(names)}
+    nodes = {n: urls[n] for n in names[:args.nodes]}
+    procs, data_dirs = {}, {}
+    ok = True
+    try:
+        for name in nodes:
+            procs[name], data_dirs[name] = start_node(name, args.base_port + names.index(name), nodes, base_dir)
+        entry = nodes[names[0]]
+
+        rng = random.Random(7)
+        players = {}
+        sessions = {}
+        for i in range(args.users):
+            email = f'player{i}@example.com'
+            opener = client()
+            post_form(opener, f'{entry}/signup', {'display_name': f'Player {i}', 'email': email, 'password': 'secret1'})
+            players[email] = {game: [] for game in GAMES}
+            for _ in range(3):
+                game = rng.choice(GAMES)
+                score = rng.randint(1, 100)
+                post_json(opener, f'{entry}/api/save-score', {'game_type': game, 'score': score})
+                players[email][game].append(score)
+            sessions[email] = opener
+        ok &= report('initial', nodes, data_dirs, players, entry)
+
+        # Add a node
+        new_name = names[args.nodes]
+        grown = {**nodes, new_name: urls[new_name]}
+        procs[new_name], data_dirs[new_name] = start_node(new_name, args.base_port + args.nodes, grown, base_dir)
+        moved = rebalance(ShardRouter(None, nodes, SECRET), grown)
+        print(f"add {new_name}: moved {len(moved)} of {len(players)} users")
+        ok &= report('after add', grown, data_dirs, players, entry)
+
+        # Existing sessions keep working against the new owner
+        moved_players = [user_id for user_id, _, _ in moved if user_id in players]
+        if moved_players:
+            email = moved_players[0]
+            played = [game for game, scores in players[email].items() if scores]
+            page = sessions[email].open(f'{entry}/history', timeout=10).read().decode()
+            history_ok = all(game.replace('_', ' ').title() in page for game in played)
+            print(f"moved user's history served by new owner: {history_ok}")
+            ok &= history_ok
+
+        # Remove a node
+        removed = names[1]
+        shrunk = {n: u for n, u in grown.items() if n != removed}
+        moved = rebalance(ShardRouter(None, grown, SECRET), shrunk)
+        print(f"remove {removed}: moved {len(moved)} users")
+        ok &= report('after remove', shrunk, data_dirs, players, entry)
+    finally:
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            proc.wait()
+    print('OK' if ok else 'FAILED')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
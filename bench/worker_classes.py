@@ -0,0 +1,98 @@
+# Brain Games - Throughput by Gunicorn Worker Class
+# Runs the load test's read-heavy mix against sync, gthread and gevent
+# workers on the same dataset and tabulates throughput and latency
+#
+#   python bench/worker_classes.py                          # 2 workers, 10k users
+#   python bench/worker_classes.py --workers 4 --threads 8 --concurrency 64
+#   python bench/worker_classes.py --classes gthread,gevent --think-ms 20 --preload
+#
+# Every class gets a fresh copy of the same generated DATA_DIR. --think-ms
+# adds client pauses, which is where threads and greenlets pull ahead of
+# sync workers: an idle keep-alive connection no longer holds a process.
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from microbench import fixture_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+READ_MIX = 'login=1,game_page=10,leaderboards=4,dashboard=3,history=2'
+READ_ROUTES = ['game_page', 'leaderboards', 'dashboard', 'history']
+
+def run_class(worker_class, source, args):
+    data_dir = tempfile.mkdtemp(prefix=f'workers-{worker_class}-')
+    shutil.rmtree(data_dir)
+    shutil.copytree(source, data_dir)
+    output = os.path.join(data_dir, 'result.json')
+    cmd = [sys.executable, os.path.join(ROOT, 'bench', 'loadtest.py'), '--target', 'gunicorn',
+           '--workers', str(args.workers), '--worker-class', worker_class, '--port', str(args.port),
+           '--concurrency', str(args.concurrency), '--duration', str(args.duration), '--warmup', str(args.warmup),
+           '--mix', args.mix, '--think-ms', str(args.think_ms), '--players', str(args.players),
+           '--data-dir', data_dir, '--label', worker_class, '--output', output, '--no-write-limits',
+           '--env', 'SNAPSHOT_INTERVAL=5']
+    if worker_class == 'gthread':
+        cmd += ['--threads', str(args.threads)]
+    if args.preload:
+        cmd += ['--env', 'PRELOAD_APP=1']
+    try:
+        subprocess.run(cmd, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def print_table(results, args):
+    print(f"{args.workers} workers, {args.concurrency} clients, think {args.think_ms} ms, "
+          f"{'preloaded' if args.preload else 'not preloaded'}")
+    routes = [r for r in READ_ROUTES if any(r in res['routes'] for res in results.values())]
+    print(f"{'class':<10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          + ''.join(f'{r + " r/s":>17}' for r in routes))
+    for worker_class, res in results.items():
+        overall = res['overall']
+        errors = sum(stats.get('errors', 0) for stats in res['routes'].values())
+        label = f'{worker_class}x{args.threads}' if worker_class == 'gthread' else worker_class
+        print(f"{label:<10}{overall['throughput_rps']:>9.1f}{overall['p50_ms']:>9.1f}{overall['p95_ms']:>9.1f}"
+              f"{overall['p99_ms']:>9.1f}{errors:>8}"
+              + ''.join(f"{res['routes'].get(r, {}).get('throughput_rps') or 0:>17.1f}" for r in routes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--classes', default='sync,gthread,gevent')
+    parser.add_argument('--users', type=int, default=10000, help='generated dataset size')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='threads per gthread worker')
+    parser.add_argument('--concurrency', type=int, default=32, help='simultaneous players')
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--think-ms', type=float, default=0)
+    parser.add_argument('--mix', default=READ_MIX)
+    parser.add_argument('--preload', action='store_true', help='run with PRELOAD_APP=1')
+    parser.add_argument('--port', type=int, default=18090)
+    parser.add_argument('--output', help='results JSON (default bench/results/worker-classes-<time>.json)')
+    args = parser.parse_args()
+
+    source = fixture_dir(args.users, args.seed)
+    results = {}
+    for worker_class in args.classes.split(','):
+        print(f"Running {worker_class}...", file=sys.stderr)
+        results[worker_class] = run_class(worker_class, source, args)
+    print_table(results, args)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f'worker-classes-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    with open(output, 'w') as f:
+        json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
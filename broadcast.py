@@ -0,0 +1,142 @@
+# Brain Games - Live Leaderboard Broadcaster
+# Fans out top-N leaderboard changes to Server-Sent Events subscribers
+
+import json
+import threading
+import time
+
+# ============================================================================
+# BROADCASTER
+# ============================================================================
+
+class LeaderboardBroadcaster:
+    """Keeps the current top-N per game and the delta from the previous version.
+
+    Writers call mark_dirty(); a single flusher thread waits a short coalescing
+    window, recomputes only the dirty games and bumps a game's version only if
+    its visible ranking actually changed. Subscribers hold nothing but the last
+    version they saw per game: one behind gets the stored delta, further
+    behind gets the full board, so a burst of scores becomes one message.
+    """
+
+    def __init__(self, compute, games, limit=10, coalesce_window=0.25):
+        self._compute = compute
+        self.games = list(games)
+        self.limit = limit
+        self.coalesce_window = coalesce_window
+        self._cond = threading.Condition()
+        self._boards = {}
+        self._versions = {game: 0 for game in self.games}
+        self._deltas = {}
+        self._dirty = set()
+        self._dirty_event = threading.Event()
+        self._flusher = None
+        self._subscribers = 0
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, name='leaderboard-broadcaster', daemon=True)
+            self._flusher.start()
+
+    def mark_dirty(self, game):
+        """Note that a game's ranking may have changed"""
+        with self._cond:
+            if not self._subscribers:
+                # Nobody is listening: forget the board and rebuild on subscribe
+                self._boards.pop(game, None)
+                return
+            self._dirty.add(game)
+        self._dirty_event.set()
+        self._ensure_flusher()
+
+    def _flush_loop(self):
+        while True:
+            self._dirty_event.wait()
+            time.sleep(self.coalesce_window)
+            self._dirty_event.clear()
+            with self._cond:
+                dirty, self._dirty = self._dirty, set()
+            for game in dirty:
+                try:
+                    self._refresh(game)
+                except Exception as e:
+                    print(f"[ERROR] Failed to refresh {game} leaderboard: {e}")
+
+    def _refresh(self, game):
+        board = self._compute(game, self.limit)
+        with self._cond:
+            old = self._boards.get(game)
+            self._boards[game] = board
+            if old is None:
+                return
+            rows = public_rows(board)
+            old_rows = public_rows(old)
+            changed = [row for i, row in enumerate(rows) if i >= len(old_rows) or old_rows[i] != row]
+            if not changed and len(rows) == len(old_rows):
+                return
+            self._versions[game] += 1
+            self._deltas[game] = {'rows': changed, 'size': len(rows)}
+            self._cond.notify_all()
+
+    def _board(self, game):
+        with self._cond:
+            board = self._boards.get(game)
+        if board is None:
+            board = self._compute(game, self.limit)
+            with self._cond:
+                self._boards.setdefault(game, board)
+                board = self._boards[game]
+        return board
+
+    def _message(self, game, seen):
+        """Build the event for a subscriber that last saw version `seen`"""
+        version = self._versions[game]
+        if seen == version - 1 and game in self._deltas:
+            payload = {'game': game, 'version': version, 'full': False, **self._deltas[game]}
+        else:
+            rows = public_rows(self._boards[game])
+            payload = {'game': game, 'version': version, 'full': True, 'rows': rows, 'size': len(rows)}
+        return _sse('leaderboard', payload)
+
+    def stream(self, games=None, heartbeat=15.0, max_duration=None):
+        """Generator of SSE text for one connection"""
+        games = [game for game in (games or self.games) if game in self._versions]
+        with self._cond:
+            self._subscribers += 1
+        try:
+            for game in games:
+                self._board(game)
+            self._ensure_flusher()
+            seen = {}
+            with self._cond:
+                messages = []
+                for game in games:
+                    seen[game] = self._versions[game]
+                    messages.append(self._message(game, None))
+            yield 'retry: 3000\n\n' + ''.join(messages)
+            started = time.monotonic()
+            while max_duration is None or time.monotonic() - started < max_duration:
+                with self._cond:
+                    self._cond.wait_for(lambda: any(self._versions[g] != seen[g] for g in games), heartbeat)
+                    messages = []
+                    for game in games:
+                        if self._versions[game] != seen[game]:
+                            messages.append(self._message(game, seen[game]))
+                            seen[game] = self._versions[game]
+                yield ''.join(messages) if messages else ': keepalive\n\n'
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+                if not self._subscribers:
+                    # Rebuilt from scratch for the next subscriber
+                    self._boards.clear()
+
+def public_rows(board):
+    # Leaderboard entries are keyed by email internally; never send that out
+    return [
+        {'rank': i + 1, 'display_name': entry['display_name'], 'score': entry['score'], 'games_played': entry['games_played']}
+        for i, entry in enumerate(board)
+    ]
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
@@ -0,0 +1,90 @@
+# Brain Games - Normalized Email Index
+# Maps case-normalized emails to the user id (the email as first entered)
+# they belong to, so lookups ignore case without scanning every user
+
+from sqlite_conn import LocalConnection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_index (
+    normalized TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+def normalize_email(email):
+    return (email or '').strip().casefold()
+
+# ============================================================================
+# INDEX
+# ============================================================================
+
+class EmailIndex:
+    """Secondary index over the user store, shared by every process pointing at the same file.
+
+    claim() is the uniqueness check for new accounts: the primary key makes
+    it atomic across workers, so two signups differing only in case cannot
+    both succeed. Users keep their original ids; the index only says which
+    id a normalized email resolves to.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connect = LocalConnection(path)
+        self._init_schema()
+
+    def _init_schema(self):
+        try:
+            self._connect().executescript(SCHEMA)
+        except Exception as e:
+            print(f"[ERROR] Failed to initialize email index: {e}")
+
+    def lookup(self, email):
+        row = self._connect().execute('SELECT user_id FROM email_index WHERE normalized = ?',
+                                      (normalize_email(email),)).fetchone()
+        return row[0] if row else None
+
+    def claim(self, email, user_id):
+        """Point `email` at `user_id` unless it already points elsewhere; returns the owner"""
+        conn = self._connect()
+        conn.execute('INSERT OR IGNORE INTO email_index VALUES (?, ?)', (normalize_email(email), user_id))
+        return self.lookup(email)
+
+    def assign(self, email, user_id):
+        """Point `email` at `user_id`, replacing any previous owner"""
+        self._connect().execute('INSERT OR REPLACE INTO email_index VALUES (?, ?)', (normalize_email(email), user_id))
+
+    def release(self, user_id):
+        """Drop the entry for `user_id` if it owns one"""
+        self._connect().execute('DELETE FROM email_index WHERE normalized = ? AND user_id = ?',
+                                (normalize_email(user_id), user_id))
+
+    def is_empty(self):
+        return self._connect().execute('SELECT 1 FROM email_index LIMIT 1').fetchone() is None
+
+    def rebuild(self, users):
+        """Replace the index with one built from {user_id: record}.
+
+        Ids that normalize to the same email collide; the earliest created
+        account keeps the normalized entry and the others stay reachable
+        only by their exact id. Returns {normalized: [ids, winner first]}.
+        """
+        groups = {}
+        for user_id, record in users.items():
+            groups.setdefault(normalize_email(user_id), []).append(((record or {}).get('created_at') or '', user_id))
+        rows = []
+        collisions = {}
+        for normalized, members in groups.items():
+            members.sort()
+            rows.append((normalized, members[0][1]))
+            if len(members) > 1:
+                collisions[normalized] = [user_id for _, user_id in members]
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM email_index')
+            conn.executemany('INSERT INTO email_index VALUES (?, ?)', rows)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return collisions
@@ -0,0 +1,136 @@
+# Brain Games - Template Fragment Cache
+# A `{% cache key, version %}` Jinja tag backed by a byte-bounded LRU of
+# rendered HTML, so stat-heavy page sections render once per data version
+
+import sys
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+# ============================================================================
+# LRU
+# ============================================================================
+
+class FragmentCache:
+    """Rendered fragments, least recently used evicted once over `max_bytes`.
+
+    Entries are keyed by (slot, key), where the slot names one `{% cache %}`
+    block in one template, and hold only the latest version rendered: a
+    lookup with another version is a miss, and storing it replaces the old
+    one. invalidate(key) drops every block cached under that key.
+
+    Sizes count the rendered strings (sys.getsizeof), not keys or overhead.
+    A fragment rendered while anything was invalidated is not stored, so a
+    slow render cannot bring back data dropped meanwhile.
+    """
+
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._slots = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, slot, key, version):
+        """Return (html, None) on a hit, else (None, token) to pass to put()"""
+        with self._lock:
+            entry = self._entries.get((slot, key))
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end((slot, key))
+                self.hits += 1
+                return entry[1], None
+            self.misses += 1
+            return None, self._epoch
+
+    def put(self, slot, key, version, html, token):
+        size = sys.getsizeof(html)
+        with self._lock:
+            if token != self._epoch or size > self.max_bytes:
+                return
+            self._remove((slot, key))
+            self._entries[(slot, key)] = (version, html, size)
+            self._slots.setdefault(key, set()).add(slot)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return
+        self.size -= entry[2]
+        slot, key = entry_key
+        slots = self._slots[key]
+        slots.discard(slot)
+        if not slots:
+            del self._slots[key]
+
+    def invalidate(self, key):
+        with self._lock:
+            for slot in list(self._slots.get(key, ())):
+                self._remove((slot, key))
+            self._epoch += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._slots.clear()
+            self.size = 0
+            self._epoch += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+# ============================================================================
+# JINJA EXTENSION
+# ============================================================================
+
+class FragmentCacheExtension(Extension):
+    """{% cache key, version %}...{% endcache %}
+
+    Renders the body once per (block, key, version) and serves it from
+    `environment.fragment_cache` afterwards. Everything the body shows must
+    be covered by the key and version. Values only the body uses are best
+    passed as callables, so a hit skips computing them too.
+
+    `environment.fragment_cache_bypass`, if set, is called after a miss
+    renders; returning true keeps that render out of the cache (e.g. when
+    it was built from stale data).
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None, fragment_cache_bypass=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        parser.stream.expect('comma')
+        version = parser.parse_expression()
+        slot = nodes.Const(f'{parser.name}:{lineno}')
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [slot, key, version]), [], [], body).set_lineno(lineno)
+
+    def _render(self, slot, key, version, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        html, token = cache.get(slot, key, version)
+        if html is not None:
+            return html
+        html = Markup(caller())
+        bypass = self.environment.fragment_cache_bypass
+        if bypass is None or not bypass():
+            cache.put(slot, key, version, html, token)
+        return html
@@ -0,0 +1,115 @@
+# Brain Games - Gunicorn configuration
+# Loaded automatically by `gunicorn app:app` from the project directory
+
+import gc
+import os
+import shutil
+import subprocess
+import sys
+
+# PORT is set by Render and similar hosts
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8080')}")
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# Concurrency model, picked with GUNICORN_WORKER_CLASS:
+#   sync     one request at a time per worker process
+#   gthread  GUNICORN_THREADS requests at a time per worker, one thread each
+#   gevent   up to GUNICORN_WORKER_CONNECTIONS requests per worker as greenlets
+# The data layer locks per store across threads, greenlets and processes
+# (locking.py), so all three are safe. The live leaderboard stream
+# (/api/leaderboards/stream) is only served by 'gevent', where hundreds of
+# idle SSE connections cost one greenlet each.
+WORKER_CLASSES = ('sync', 'gthread', 'gevent')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+if worker_class not in WORKER_CLASSES:
+    raise SystemExit(f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}, not {worker_class!r}")
+threads = int(os.getenv('GUNICORN_THREADS', '4')) if worker_class == 'gthread' else 1
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Each open stream would hold a whole worker (sync) or thread (gthread), so a
+# few leaderboard tabs could block the site; those classes serve the page
+# without live updates unless LEADERBOARD_STREAM=1 is set explicitly.
+os.environ.setdefault('LEADERBOARD_STREAM', '1' if worker_class == 'gevent' else '0')
+if worker_class != 'gevent':
+    # Sync workers are killed after `timeout` seconds on one request, so
+    # forced-on streams are kept short and EventSource reconnects.
+    os.environ.setdefault('SSE_STREAM_SECONDS', '20')
+
+# Each worker writes its metrics here and /metrics merges them. It is wiped
+# when the master starts so counters begin at zero for every deployment.
+os.environ.setdefault('METRICS_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else os.getenv('DATA_DIR', '.'),
+    f'brain-games-metrics-{bind.rsplit(":", 1)[-1]}'))
+
+# Write admission state (ratelimit.py) shared by the workers, reset with the
+# metrics so in-flight counts left by a previous deployment don't linger.
+os.environ.setdefault('RATE_LIMIT_FILE', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else os.getenv('DATA_DIR', '.'),
+    f'brain-games-ratelimit-{bind.rsplit(":", 1)[-1]}'))
+
+# PRELOAD_APP=1 imports the app in the master and loads users, aggregates
+# and leaderboards there (PRELOAD_DATA), so every worker forks with the same
+# copy instead of parsing its own. The collector is off in the master and
+# everything is frozen right before each fork, so no collection in a worker
+# touches (and copies) the shared objects. A deploy or restart reloads the
+# data; HUP does not reload a preloaded app.
+preload_app = os.getenv('PRELOAD_APP', '0') == '1'
+if preload_app:
+    os.environ.setdefault('PRELOAD_DATA', '1')
+    gc.disable()
+    if worker_class == 'gevent':
+        # The app's locks are created in the master, so patch before it loads
+        from gevent import monkey
+        monkey.patch_all()
+
+# Workers skip seeding on import; the master seeds once per deployment below.
+# A preloaded master seeds on import instead, before it loads the data.
+os.environ.setdefault('SEED_ON_STARTUP', '1' if preload_app else '0')
+
+def on_starting(server):
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+    from ratelimit import reset
+    reset(os.environ['RATE_LIMIT_FILE'])
+    if os.environ['SEED_ON_STARTUP'] == '0':
+        # In a child process so the master never imports the app (or opens
+        # its databases) before forking workers
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'seed'],
+                       cwd=os.path.dirname(os.path.abspath(__file__)), check=False)
+
+def pre_fork(server, worker):
+    if preload_app:
+        gc.freeze()
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+
+def worker_exit(server, worker):
+    # Last flush so requests served since the previous one are not lost
+    from app import metrics
+    metrics.flush()
+
+def post_worker_init(worker):
+    # Start the background job and email threads alongside each worker so
+    # work queued before a restart is picked up without waiting for a new
+    # enqueue, and the invalidation poller so pushes from other workers reach
+    # this worker's SSE streams. One worker at a time wins the snapshot lock
+    # and keeps the shared leaderboard snapshot fresh. Each worker also sweeps
+    # expired reset tokens; sweeps are idempotent, so overlap is harmless.
+    from app import (job_queue, invalidation_bus, snapshot_writer, metrics, warm_caches, password_hasher,
+                     reset_tokens, email_outbox, IMPORT_SECONDS)
+    # First, while the worker has no other threads to fork along with it
+    password_hasher.start()
+    metrics.start()
+    job_queue.start()
+    email_outbox.start()
+    invalidation_bus.start()
+    snapshot_writer.start()
+    reset_tokens.start()
+    # WARM_CACHES=1 fills leaderboard and index caches before the first
+    # request instead of on it
+    warmup = warm_caches() if os.getenv('WARM_CACHES', '0') == '1' else 0
+    worker.log.info(f"[BOOT] worker {worker.pid} {'preloaded' if preload_app else 'imported'} app in "
+                    f"{IMPORT_SECONDS * 1000:.0f} ms, "
+                    f"warm-up {warmup * 1000:.0f} ms")
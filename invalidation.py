@@ -0,0 +1,221 @@
+# Brain Games - Cross-Worker Cache Invalidation
+# SQLite change log polled via PRAGMA data_version, plus a keyed in-memory cache
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_conn import LocalConnection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    origin INTEGER NOT NULL,
+    at REAL NOT NULL
+);
+"""
+
+# Dispatched when changes were pruned before this process read them
+ALL_KEYS = '*'
+
+# ============================================================================
+# BUS
+# ============================================================================
+
+class InvalidationBus:
+    """Publishes changed cache keys to every process sharing the same file.
+
+    Writers append keys to a change log. Readers check PRAGMA data_version,
+    which only moves when another connection has committed, so the common
+    "nothing changed" case costs one pragma and no table read. New rows are
+    handed to subscribers, which drop just those entries. Keys published by
+    this process are dispatched immediately and skipped when read back.
+
+    A process that falls behind by more than `retention` seconds (e.g. a
+    worker forked long after its preloaded master started) finds the rows it
+    missed already pruned; subscribers then get ALL_KEYS and must drop
+    everything.
+    """
+
+    def __init__(self, path, poll_interval=0.05, retention=3600):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._connect = LocalConnection(path)
+        self._subscribers = []
+        self._sync_lock = threading.Lock()
+        self._last_seq = None
+        self._data_version = None
+        self._poller_pid = None
+        self._published = 0
+        try:
+            self._connect().executescript(SCHEMA)
+            # Start the cursor now so nothing published after construction is missed
+            self._sync_connection()
+        except Exception as e:
+            print(f"[ERROR] Failed to initialize invalidation bus: {e}")
+
+    def subscribe(self, callback):
+        """Register callback(keys) for every batch of changed keys"""
+        self._subscribers.append(callback)
+        return callback
+
+    def _dispatch(self, keys):
+        for callback in self._subscribers:
+            try:
+                callback(keys)
+            except Exception as e:
+                print(f"[ERROR] Invalidation subscriber failed: {e}")
+
+    def publish(self, *keys):
+        if not keys:
+            return
+        with self._sync_lock:
+            self._sync_connection()
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.executemany('INSERT INTO changes (key, origin, at) VALUES (?, ?, ?)',
+                             [(key, os.getpid(), now) for key in keys])
+            self._published += 1
+            if self._published % 1000 == 0:
+                conn.execute('DELETE FROM changes WHERE at < ?', (now - self.retention,))
+        except Exception as e:
+            print(f"[ERROR] Failed to publish invalidation for {keys}: {e}")
+        self._dispatch(set(keys))
+
+    def _sync_connection(self):
+        # data_version is only comparable on one connection, so all syncs in
+        # this process share a dedicated connection under _sync_lock
+        if getattr(self, '_sync_conn_pid', None) != os.getpid():
+            self._sync_conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._sync_conn_pid = os.getpid()
+            self._data_version = None
+            if self._last_seq is None:
+                # sqlite_sequence keeps the highest seq ever used, even once pruned
+                row = self._sync_conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+                self._last_seq = row[0] if row else 0
+        return self._sync_conn
+
+    def sync(self):
+        """Apply changes published by other processes. Returns the keys applied."""
+        with self._sync_lock:
+            conn = self._sync_connection()
+            version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if version == self._data_version:
+                return set()
+            self._data_version = version
+            rows = conn.execute('SELECT seq, key, origin FROM changes WHERE seq > ? ORDER BY seq',
+                                (self._last_seq,)).fetchall()
+            if not rows:
+                return set()
+            # seq has no holes except where old rows were pruned
+            missed = rows[0][0] > self._last_seq + 1
+            self._last_seq = rows[-1][0]
+        pid = os.getpid()
+        keys = {key for _, key, origin in rows if origin != pid}
+        if missed:
+            keys.add(ALL_KEYS)
+        if keys:
+            self._dispatch(keys)
+        return keys
+
+    def start(self):
+        """Start the background poller for this process (no-op if running)"""
+        if self._poller_pid == os.getpid():
+            return
+        self._poller_pid = os.getpid()
+        threading.Thread(target=self._poll, name='invalidation-poller', daemon=True).start()
+
+    def _poll(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"[ERROR] Invalidation poll failed: {e}")
+            time.sleep(self.poll_interval)
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class KeyedCache:
+    """Process-local cache whose entries are dropped by key on invalidation.
+
+    A value computed while an invalidation for the same key was in flight is
+    not stored, so a slow computation cannot resurrect stale data. Only keys
+    being computed right now are tracked for that, so nothing outlives its
+    entry. With `max_entries`, the least recently used entries are evicted
+    beyond that many.
+    """
+
+    def __init__(self, name, max_entries=None):
+        self.name = name
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        # key -> [computations in flight, invalidations seen while in flight]
+        self._pending = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            pending = self._pending.setdefault(key, [0, 0])
+            pending[0] += 1
+            generation = (self._epoch, pending[1])
+        try:
+            value = compute()
+        except BaseException:
+            with self._lock:
+                self._release(key, pending)
+            raise
+        with self._lock:
+            if (self._epoch, pending[1]) == generation:
+                self._data[key] = value
+                self._data.move_to_end(key)
+                if self.max_entries is not None:
+                    while len(self._data) > self.max_entries:
+                        self._data.popitem(last=False)
+                        self.evictions += 1
+            self._release(key, pending)
+        return value
+
+    def _release(self, key, pending):
+        pending[0] -= 1
+        if not pending[0]:
+            del self._pending[key]
+
+    def peek(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            if key in self._pending:
+                self._pending[key][1] += 1
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                self._data.pop(key)
+            self._epoch += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._epoch += 1
+
+    def __len__(self):
+        return len(self._data)
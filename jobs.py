@@ -0,0 +1,101 @@
+# Brain Games - Background Job Queue
+# Durable SQLite-backed queue with a small worker thread pool per process
+
+import json
+import time
+from collections import deque
+
+from sqlite_queue import SQLiteQueue, summarize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    run_at REAL NOT NULL,
+    started_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+"""
+
+# ============================================================================
+# QUEUE
+# ============================================================================
+
+class JobQueue(SQLiteQueue):
+    """Durable job queue shared by every process pointing at the same file.
+
+    Each job is a registered handler called with its JSON payload as keyword
+    arguments, one job per claim. Claiming, retries and dead jobs work as in
+    SQLiteQueue; since a job may run more than once, handlers must be safe
+    to re-run.
+    """
+
+    table = 'jobs'
+    schema = SCHEMA
+    columns = ('payload',)
+    label = 'job'
+
+    def __init__(self, path, workers=2, max_attempts=5, base_backoff=1.0,
+                 max_backoff=300.0, poll_interval=1.0, stale_after=300.0):
+        self.handlers = {}
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+        super().__init__(path, workers, 1, max_attempts, base_backoff, max_backoff, poll_interval, stale_after)
+
+    def register(self, kind):
+        """Decorator registering the handler for a job kind"""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def enqueue(self, kind, payload, delay=0):
+        return self._insert(kind, {'payload': json.dumps(payload)}, delay)
+
+    def process(self, jobs):
+        results = []
+        for job in jobs:
+            started = time.time()
+            try:
+                handler = self.handlers.get(job['kind'])
+                if handler is None:
+                    raise LookupError(f"No handler registered for job kind '{job['kind']}'")
+                handler(**json.loads(job['payload']))
+            except Exception as e:
+                results.append(e)
+                continue
+            results.append(None)
+            with self._stats_lock:
+                self._wait_times.append(started - max(job['enqueued_at'], job['run_at']))
+                self._run_times.append(time.time() - started)
+        return results
+
+    def run_one(self):
+        """Claim and run a single ready job. Returns False if none was ready."""
+        return bool(self.process_batch())
+
+    def run_pending(self, limit=None):
+        """Drain ready jobs on the calling thread (CLI and debugging)"""
+        return self.drain(limit)
+
+    # ------------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------------
+
+    def metrics(self):
+        """Queue depth (shared) plus latency and outcome counters (this process)"""
+        with self._stats_lock:
+            wait_times = sorted(self._wait_times)
+            run_times = sorted(self._run_times)
+        return {
+            'depth': self.depth(),
+            'oldest_pending_age': self.oldest_pending_age(),
+            'counters': self.counters(),
+            'queue_wait': summarize(wait_times),
+            'run_time': summarize(run_times),
+        }
@@ -0,0 +1,133 @@
+# Brain Games - Storage Locks
+# Reader/writer locks for the JSON stores, shared by the threads (or
+# greenlets) of one worker and, through flock, by every worker process
+
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+# ============================================================================
+# IN-PROCESS
+# ============================================================================
+
+class ReadWriteLock:
+    """Many readers or one writer; waiting writers block new readers.
+
+    Reentrant per thread: the writer may read or write again, and a reader
+    may read again even while a writer waits. Upgrading a read to a write
+    would deadlock against another upgrading reader, so it raises.
+
+    With gevent's monkey patching, threading primitives and thread idents
+    are per greenlet, so the same lock also orders greenlets.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    def owned(self):
+        """Whether the current thread holds the lock in either mode"""
+        return self._writer == threading.get_ident() or getattr(self._local, 'reads', 0) > 0
+
+    def acquire_read(self):
+        reads = getattr(self._local, 'reads', 0)
+        if reads or self._writer == threading.get_ident():
+            self._local.reads = reads + 1
+            return
+        with self._cond:
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        self._local.reads = 1
+
+    def release_read(self):
+        self._local.reads -= 1
+        if self._local.reads or self._writer == threading.get_ident():
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        if getattr(self._local, 'reads', 0):
+            raise RuntimeError('Cannot upgrade a read lock to a write lock')
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        self._write_depth -= 1
+        if self._write_depth:
+            return
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+# ============================================================================
+# ACROSS PROCESSES
+# ============================================================================
+
+class StoreLock:
+    """Reader/writer lock for one data file, held across worker processes.
+
+    The in-process lock is taken first, so only one thread per process at a
+    time waits on flock(2) of `<path>.lock` for a write, and nested sections
+    reuse the outer lock instead of locking the file again.
+    """
+
+    def __init__(self, path):
+        self.path = f'{path}.lock'
+        self._lock = ReadWriteLock()
+
+    def _flock(self, mode):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, mode)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    @contextmanager
+    def read(self):
+        nested = self._lock.owned()
+        self._lock.acquire_read()
+        try:
+            fd = None if nested else self._flock(fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fd is not None:
+                    os.close(fd)  # releases the flock
+        finally:
+            self._lock.release_read()
+
+    @contextmanager
+    def write(self):
+        nested = self._lock.owned()
+        self._lock.acquire_write()
+        try:
+            fd = None if nested else self._flock(fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fd is not None:
+                    os.close(fd)
+        finally:
+            self._lock.release_write()
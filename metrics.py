@@ -0,0 +1,278 @@
+# Brain Games - Metrics
+# Counters, gauges and histograms rendered in the Prometheus text format, with
+# an optional per-process file mode so one scrape covers every gunicorn worker
+
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from processes import alive
+
+# Request and storage latencies, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# File sizes, in bytes
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+ARCHIVE_FILE = 'archive.json'
+LOCK_FILE = '.lock'
+
+# ============================================================================
+# METRIC TYPES
+# ============================================================================
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    """Gauge summed across live processes (dead workers' values are dropped)"""
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, buckets):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1]]
+
+class _Callback(_Metric):
+    """Values read from elsewhere (e.g. cache hit counters) at collection time"""
+
+    def __init__(self, name, help, labels, kind, collect):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self._collect = collect
+
+    def samples(self):
+        return {tuple(key): value for key, value in self._collect().items()}
+
+# ============================================================================
+# REGISTRY
+# ============================================================================
+
+class Metrics:
+    """Registry of metrics for one app.
+
+    Without `directory` every process reports only its own values. With it,
+    each process writes its values to `<directory>/<pid>.json` every
+    `flush_interval` seconds and render() merges all of them: counters and
+    histograms are summed, including those of exited workers (folded into
+    archive.json), and gauges are summed over live processes only.
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._flusher_pid = None
+        self._last_written = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, kind, labels, collect):
+        """Register a metric whose values come from collect() -> {label_values: value}"""
+        return self._add(_Callback(name, help, labels, kind, collect))
+
+    def collect(self):
+        return {name: metric.samples() for name, metric in self._metrics.items()}
+
+    # ------------------------------------------------------------------
+    # Multiprocess files
+    # ------------------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _locked(self, mode):
+        lock = open(self._path(LOCK_FILE), 'a')
+        fcntl.flock(lock, mode)
+        return lock
+
+    def flush(self):
+        """Write this process's values for other processes to merge"""
+        if not self.directory:
+            return
+        payload = json.dumps({name: [[list(k), v] for k, v in samples.items()]
+                              for name, samples in self.collect().items()})
+        if payload == self._last_written:
+            return
+        path = self._path(f'{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        self._last_written = payload
+
+    def start(self):
+        """Start the flusher thread for this process (no-op without a directory)"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        self._last_written = None
+        threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[ERROR] Failed to flush metrics: {e}")
+
+    def _read(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return {metric: {tuple(k): v for k, v in samples} for metric, samples in json.load(f).items()}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _merge(self, total, values, include_gauges):
+        for name, samples in values.items():
+            metric = self._metrics.get(name)
+            if metric is None or (metric.kind == 'gauge' and not include_gauges):
+                continue
+            merged = total.setdefault(name, {})
+            for key, value in samples.items():
+                if metric.kind == 'histogram':
+                    current = merged.get(key)
+                    if current is None:
+                        merged[key] = [list(value[0]), value[1]]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+
+    def mark_process_dead(self, pid):
+        """Fold an exited worker's counters into the archive and drop its file"""
+        if not self.directory:
+            return
+        name = f'{pid}.json'
+        lock = self._locked(fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(self._path(name)):
+                return
+            archive = self._read(ARCHIVE_FILE)
+            self._merge(archive, self._read(name), include_gauges=False)
+            tmp_path = self._path(ARCHIVE_FILE + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({metric: [[list(k), v] for k, v in samples.items()] for metric, samples in archive.items()}, f)
+            os.replace(tmp_path, self._path(ARCHIVE_FILE))
+            os.remove(self._path(name))
+        finally:
+            lock.close()
+
+    def _merged(self):
+        self.flush()
+        dead = []
+        total = {}
+        lock = self._locked(fcntl.LOCK_SH)
+        try:
+            self._merge(total, self._read(ARCHIVE_FILE), include_gauges=False)
+            for name in os.listdir(self.directory):
+                pid = name[:-len('.json')]
+                if not name.endswith('.json') or not pid.isdigit():
+                    continue
+                running = alive(int(pid))
+                if not running:
+                    dead.append(int(pid))
+                self._merge(total, self._read(name), include_gauges=running)
+        finally:
+            lock.close()
+        for pid in dead:
+            self.mark_process_dead(pid)
+        return total
+
+    # ------------------------------------------------------------------
+    # Exposition
+    # ------------------------------------------------------------------
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        values = self._merged() if self.directory else self.collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(values.get(name, {}).items()):
+                pairs = list(zip(metric.labels, key))
+                if metric.kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (math.inf,), value[0]):
+                        cumulative += count
+                        le = '+Inf' if bound == math.inf else _number(bound)
+                        lines.append(f'{name}_bucket{_labels(pairs + [("le", le)])} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(pairs)} {_number(value[1])}')
+                    lines.append(f'{name}_count{_labels(pairs)} {cumulative}')
+                else:
+                    lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
@@ -0,0 +1,217 @@
+# Brain Games - Email Outbox
+# Durable SQLite-backed outbox drained in batches by a sender thread per
+# process, with pluggable transports (SendGrid, SMTP, files on disk)
+
+import os
+import smtplib
+import time
+from collections import deque
+from email.message import EmailMessage
+
+from sqlite_queue import SQLiteQueue, summarize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    text_body TEXT NOT NULL,
+    html_body TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    run_at REAL NOT NULL,
+    started_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (status, run_at);
+"""
+
+class PermanentError(Exception):
+    """A delivery failure that retrying will not fix (bad address, rejected content)"""
+
+# ============================================================================
+# TRANSPORTS
+# ============================================================================
+
+# Each transport's send_batch(messages) returns one entry per message: None
+# if it was accepted, else the exception that stopped it.
+
+class FileTransport:
+    """Writes each message to `<directory>/<id>.eml`; for development and tests"""
+
+    name = 'file'
+
+    def __init__(self, directory, sender):
+        self.directory = directory
+        self.sender = sender
+
+    def send_batch(self, messages):
+        os.makedirs(self.directory, exist_ok=True)
+        results = []
+        for message in messages:
+            try:
+                path = os.path.join(self.directory, f"{message['id']}.eml")
+                with open(path, 'wb') as f:
+                    f.write(bytes(_mime(message, self.sender)))
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+class SMTPTransport:
+    """One SMTP connection per batch"""
+
+    name = 'smtp'
+
+    def __init__(self, host, port, sender, username=None, password=None, starttls=True, timeout=30):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send_batch(self, messages):
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        except Exception as e:
+            return [e] * len(messages)
+        results = []
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for message in messages:
+                try:
+                    smtp.send_message(_mime(message, self.sender))
+                    results.append(None)
+                except smtplib.SMTPRecipientsRefused as e:
+                    results.append(PermanentError(str(e)))
+                except Exception as e:
+                    results.append(e)
+        except Exception as e:
+            results += [e] * (len(messages) - len(results))
+        finally:
+            try:
+                smtp.quit()
+            except Exception:
+                pass
+        return results
+
+class SendGridTransport:
+    """SendGrid v3 mail send, one API call per message over a shared client"""
+
+    name = 'sendgrid'
+
+    def __init__(self, api_key, sender):
+        from sendgrid import SendGridAPIClient
+        self.client = SendGridAPIClient(api_key)
+        self.sender = sender
+
+    def send_batch(self, messages):
+        from python_http_client.exceptions import HTTPError
+        from sendgrid.helpers.mail import Mail
+        results = []
+        for message in messages:
+            mail = Mail(from_email=self.sender, to_emails=message['recipient'], subject=message['subject'],
+                        plain_text_content=message['text_body'], html_content=message['html_body'])
+            try:
+                self.client.send(mail)
+                results.append(None)
+            except HTTPError as e:
+                # 4xx other than rate limiting means the message itself is bad
+                if 400 <= e.status_code < 500 and e.status_code != 429:
+                    results.append(PermanentError(f'HTTP {e.status_code}: {e.body}'))
+                else:
+                    results.append(e)
+            except Exception as e:
+                results.append(e)
+        return results
+
+def _mime(message, sender):
+    mime = EmailMessage()
+    mime['From'] = sender
+    mime['To'] = message['recipient']
+    mime['Subject'] = message['subject']
+    mime.set_content(message['text_body'])
+    if message['html_body']:
+        mime.add_alternative(message['html_body'], subtype='html')
+    return mime
+
+# ============================================================================
+# OUTBOX
+# ============================================================================
+
+class EmailOutbox(SQLiteQueue):
+    """Outgoing email shared by every process pointing at the same file.
+
+    A sender thread claims up to `batch_size` ready messages at once and
+    hands them to the transport together, so SMTP reuses one connection per
+    batch. Retries and dead messages work as in SQLiteQueue; PermanentError
+    from the transport kills a message at once. Sent messages are deleted.
+    """
+
+    table = 'outbox'
+    schema = SCHEMA
+    columns = ('recipient', 'subject', 'text_body', 'html_body')
+    label = 'email'
+    claimed_status = 'sending'
+    done_counter = 'sent'
+    extra_counters = ('batches',)
+    permanent_errors = (PermanentError,)
+
+    def __init__(self, path, transport, senders=1, batch_size=50, max_attempts=8, base_backoff=5.0,
+                 max_backoff=3600.0, poll_interval=2.0, stale_after=300.0):
+        self.transport = transport
+        self._delivery_times = deque(maxlen=1000)
+        super().__init__(path, senders, batch_size, max_attempts, base_backoff, max_backoff,
+                         poll_interval, stale_after)
+
+    def enqueue(self, kind, recipient, subject, text_body, html_body=None):
+        return self._insert(kind, {'recipient': recipient, 'subject': subject,
+                                   'text_body': text_body, 'html_body': html_body})
+
+    def process(self, messages):
+        try:
+            results = self.transport.send_batch(messages)
+        except Exception as e:
+            results = [e] * len(messages)
+        now = time.time()
+        with self._stats_lock:
+            self._delivery_times.extend(now - message['enqueued_at']
+                                        for message, error in zip(messages, results) if error is None)
+        return results
+
+    def process_batch(self):
+        claimed = super().process_batch()
+        if claimed:
+            self._count('batches')
+        return claimed
+
+    def send_one_batch(self):
+        """Claim and send one batch. Returns the number of messages claimed."""
+        return self.process_batch()
+
+    def send_pending(self):
+        """Drain ready messages on the calling thread (CLI and debugging)"""
+        return self.drain()
+
+    # ------------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------------
+
+    def metrics(self):
+        """Outbox depth (shared) plus delivery counters and latency (this process)"""
+        with self._stats_lock:
+            delivery_times = sorted(self._delivery_times)
+        return {
+            'transport': self.transport.name,
+            'depth': self.depth(),
+            'oldest_pending_age': self.oldest_pending_age(),
+            'counters': self.counters(),
+            'delivery_time': summarize(delivery_times),
+        }
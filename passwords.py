@@ -0,0 +1,167 @@
+# Brain Games - Password Hashing
+# Salted scrypt hashes computed off the request thread on a small,
+# low-priority process pool; legacy unsalted SHA-256 hashes still verify
+
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+SCHEME = 'scrypt'
+SALT_BYTES = 16
+KEY_BYTES = 64
+
+# ============================================================================
+# KDF
+# ============================================================================
+
+def _derive(password, salt, n, r, p):
+    # scrypt needs 128 * r * (n + p + 2) bytes; hashlib refuses above maxmem
+    maxmem = 128 * r * (n + p + 2) + (1 << 20)
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=KEY_BYTES)
+
+def _init_pool_process(niceness):
+    # Pool processes yield the CPU to request handling when both want it
+    os.nice(niceness)
+    # A worker killed by gunicorn can't shut its pool down; exit with it
+    parent = os.getppid()
+
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(1)
+        os._exit(0)
+    threading.Thread(target=watch, daemon=True).start()
+
+_niced_threads = set()
+
+def _derive_niced(niceness, password, salt, n, r, p):
+    # Linux keeps a nice value per thread, so pool threads can yield the
+    # CPU like pool processes do; each lowers its own priority once
+    tid = threading.get_native_id()
+    if tid not in _niced_threads:
+        try:
+            os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + niceness)
+        except OSError:
+            pass
+        _niced_threads.add(tid)
+    return _derive(password, salt, n, r, p)
+
+def _noop():
+    return None
+
+def _b64(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _legacy(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+def _is_legacy(stored):
+    return len(stored) == 64 and all(c in '0123456789abcdef' for c in stored)
+
+def _gevent_patched():
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+# ============================================================================
+# HASHER
+# ============================================================================
+
+class PasswordHasher:
+    """Hashes as 'scrypt$n$r$p$salt$key' with cost parameters n, r and p.
+
+    Each process hashes on its own pool of `workers` forked processes.
+    start() forks them up front, which gunicorn workers do before they
+    start any threads; otherwise they are forked on first use. Pool
+    processes run at +`niceness`, so a burst of logins competes for the
+    CPU below the game routes. With `workers` 0 hashing runs inline.
+    Under gevent a process pool does not mix with monkey patching, so
+    hashing runs on a gevent thread pool of `workers` native threads, also
+    at +`niceness`; scrypt releases the GIL, so greenlets keep running.
+
+    verify() also accepts legacy unsalted SHA-256 hex digests and reports
+    them, like hashes made with other cost parameters, as needing a rehash.
+    """
+
+    def __init__(self, n=2 ** 14, r=8, p=1, workers=1, niceness=10):
+        if n < 2 or n & (n - 1):
+            raise ValueError(f'scrypt n must be a power of two above 1, not {n}')
+        self.n = n
+        self.r = r
+        self.p = p
+        self.workers = workers
+        self.niceness = niceness
+        self._executor = None
+        self._executor_pid = None
+        self._threadpool = None
+        self._threadpool_pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    # fork, not spawn/forkserver: those re-import __main__
+                    # (the app under `python app.py`) in every pool process
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'),
+                                                         initializer=_init_pool_process, initargs=(self.niceness,))
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _gevent_pool(self):
+        if self._threadpool_pid != os.getpid():
+            with self._lock:
+                if self._threadpool_pid != os.getpid():
+                    from gevent.threadpool import ThreadPool
+                    self._threadpool = ThreadPool(self.workers)
+                    self._threadpool_pid = os.getpid()
+        return self._threadpool
+
+    def start(self):
+        """Fork the pool now, before this process starts other threads"""
+        if self.workers > 0 and not _gevent_patched():
+            self._pool().submit(_noop).result()
+
+    def _run(self, password, salt, n, r, p, offload=True):
+        if not offload or self.workers <= 0:
+            return _derive(password, salt, n, r, p)
+        if _gevent_patched():
+            return self._gevent_pool().apply(_derive_niced, (self.niceness, password, salt, n, r, p))
+        try:
+            return self._pool().submit(_derive, password, salt, n, r, p).result()
+        except BrokenProcessPool as e:
+            print(f"[ERROR] Password hashing pool failed, hashing inline: {e}")
+            with self._lock:
+                self._executor_pid = None
+            return _derive(password, salt, n, r, p)
+
+    def hash(self, password, offload=True):
+        salt = secrets.token_bytes(SALT_BYTES)
+        key = self._run(password, salt, self.n, self.r, self.p, offload)
+        return f'{SCHEME}${self.n}${self.r}${self.p}${_b64(salt)}${_b64(key)}'
+
+    def verify(self, password, stored):
+        """Return (matches, needs_rehash)"""
+        if not stored:
+            return False, False
+        if _is_legacy(stored):
+            return hmac.compare_digest(stored, _legacy(password)), True
+        try:
+            scheme, n, r, p, salt, key = stored.split('$')
+            n, r, p = int(n), int(r), int(p)
+            salt, key = _unb64(salt), _unb64(key)
+        except ValueError:
+            return False, False
+        if scheme != SCHEME:
+            return False, False
+        matches = hmac.compare_digest(self._run(password, salt, n, r, p), key)
+        return matches, (n, r, p) != (self.n, self.r, self.p)
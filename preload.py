@@ -0,0 +1,113 @@
+# Brain Games - Preloaded Read-Mostly Data
+# Per-user JSON stores loaded once before gunicorn forks, shared copy-on-write
+# by every worker, with each worker's changes kept in a small overlay
+
+import threading
+
+_MISSING = object()
+_DELETED = object()
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+class PreloadedStore:
+    """A {user_id: record} JSON store read from memory instead of its file.
+
+    preload() parses the whole file into `base`. Done in the gunicorn master
+    (PRELOAD_APP=1), every forked worker starts with the same base in shared
+    pages, and base is never modified afterwards. Keys invalidated on the
+    bus are marked stale; the next read re-parses the file once for all stale
+    keys and keeps their current values in this process's `delta`, which
+    shadows base. A worker's private memory therefore grows with the users
+    that changed since the fork, not with the whole file.
+
+    Reading a record still updates its reference count, so the pages of
+    records a worker actually reads get copied; the rest stay shared.
+    Records are returned as-is and must not be modified by callers.
+
+    With `enabled` False every read loads the file, as before.
+    """
+
+    def __init__(self, name, load, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self._load = load
+        self._base = None
+        self._delta = {}
+        self._stale = set()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+
+    def preload(self):
+        """Parse the file now (in the master, before workers fork)"""
+        if not self.enabled:
+            return
+        data = self._load()
+        with self._lock:
+            self._base = data
+            self._delta = {}
+            self._stale = set()
+
+    def get(self, key, default=None):
+        if not self.enabled:
+            return self._load().get(key, default)
+        while True:
+            if self._stale or self._base is None:
+                self._refresh()
+            # invalidate_all() on the bus thread may drop base at any point
+            with self._lock:
+                base, delta = self._base, self._delta
+            if base is not None:
+                break
+        value = delta.get(key, _MISSING)
+        if value is _MISSING:
+            value = base.get(key, _DELETED)
+        return default if value is _DELETED else value
+
+    def __contains__(self, key):
+        return self.get(key, _DELETED) is not _DELETED
+
+    def invalidate(self, key):
+        if self.enabled:
+            with self._lock:
+                self._stale.add(key)
+
+    def invalidate_all(self):
+        """Drop base and delta; the next read loads a private copy of the file"""
+        with self._lock:
+            self._base = None
+            self._delta = {}
+            self._stale = set()
+            self._generation += 1
+
+    @property
+    def delta_size(self):
+        return len(self._delta)
+
+    def _refresh(self):
+        # One parse covers every key that went stale meanwhile; keys
+        # invalidated again while it runs stay stale for the next read
+        with self._reload_lock:
+            with self._lock:
+                keys, self._stale = self._stale, set()
+                whole = self._base is None
+                generation = self._generation
+            if not keys and not whole:
+                return
+            data = self._load()
+            self.reloads += 1
+            with self._lock:
+                if generation != self._generation:
+                    # Dropped by invalidate_all() meanwhile; the data may
+                    # predate whatever caused that, so load it again
+                    return
+                if whole:
+                    self._base = data
+                    self._delta = {}
+                    return
+                for key in keys:
+                    if key not in self._stale:
+                        self._delta[key] = data.get(key, _DELETED)
@@ -0,0 +1,14 @@
+# Brain Games - Process Helpers
+# Liveness checks for the per-pid records other workers leave in shared files
+
+import os
+
+def alive(pid):
+    """Whether a process with this pid exists (it may belong to another user)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
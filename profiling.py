@@ -0,0 +1,230 @@
+# Brain Games - Request Profiling
+# Opt-in cProfile sampling, stack sampling of slow requests and a per-request
+# breakdown of JSON storage calls, written to a rotating directory
+
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+# ============================================================================
+# PROFILER
+# ============================================================================
+
+class RequestProfiler:
+    """Captures profiles for a fraction of requests and for slow ones.
+
+    - `sample_rate` of requests run under cProfile.
+    - While any request is in flight, a sampler thread looks at each one
+      every `sample_interval` seconds. A request older than `slow_ms` has
+      its stack recorded, so slow requests get a sampled profile without
+      having paid for cProfile from the start.
+    - Every profiled request records its storage calls (file, op,
+      duration, bytes).
+
+    A request that was sampled or ended up slower than `slow_ms` is saved as
+    JSON in `directory`, keeping the newest `keep` files. Requests are
+    recorded by route ('/reset-password/<token>'), never by concrete path,
+    so tokens and other values in URLs stay out of the files. With both knobs
+    at 0, `enabled` is False and the app's hooks return straight away.
+    Stack sampling relies on sys._current_frames(), so it sees OS threads
+    (sync and gthread workers) but not individual gevent greenlets.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, slow_ms=0.0, keep=200, sample_interval=0.005, top=40):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow = slow_ms / 1000 if slow_ms else None
+        self.keep = keep
+        self.sample_interval = sample_interval
+        self.top = top
+        self.enabled = bool(sample_rate > 0 or self.slow)
+        self._local = threading.local()
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sampler_pid = None
+        self._wakeup = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Per-request hooks
+    # ------------------------------------------------------------------
+
+    def begin(self, method, route):
+        if not self.enabled:
+            return
+        profile = None
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            profile = cProfile.Profile()
+        record = {
+            'method': method,
+            'route': route,
+            'started_at': time.time(),
+            'start': time.perf_counter(),
+            'storage': [],
+            'stacks': Counter(),
+            'profile': profile
+        }
+        self._local.record = record
+        if self.slow:
+            self._ensure_sampler()
+            with self._lock:
+                self._active[threading.get_ident()] = record
+            self._wakeup.set()
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is active (one per process on Python 3.12+)
+                record['profile'] = None
+
+    def record_storage(self, name, op, duration, size):
+        record = getattr(self._local, 'record', None)
+        if record is not None:
+            record['storage'].append((name, op, duration, size))
+
+    def end(self, status, user_id=None):
+        record = getattr(self._local, 'record', None)
+        if record is None:
+            return
+        self._local.record = None
+        profile = record['profile']
+        if profile is not None:
+            profile.disable()
+        if self.slow:
+            with self._lock:
+                self._active.pop(threading.get_ident(), None)
+        duration = time.perf_counter() - record['start']
+        slow = self.slow is not None and duration >= self.slow
+        if profile is None and not slow:
+            return
+        try:
+            self._save(record, duration, status, user_id, 'slow' if slow else 'sampled')
+        except Exception as e:
+            print(f"[ERROR] Failed to save request profile: {e}")
+
+    # ------------------------------------------------------------------
+    # Stack sampling
+    # ------------------------------------------------------------------
+
+    def _ensure_sampler(self):
+        if self._sampler_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sampler_pid == os.getpid():
+                return
+            self._sampler_pid = os.getpid()
+            self._active.clear()
+        threading.Thread(target=self._sample_loop, name='request-sampler', daemon=True).start()
+
+    def _sample_loop(self):
+        while True:
+            if not self._active:
+                # Idle until a request starts
+                self._wakeup.wait()
+                self._wakeup.clear()
+            time.sleep(self.sample_interval)
+            now = time.perf_counter()
+            with self._lock:
+                overdue = [(ident, record) for ident, record in self._active.items()
+                           if now - record['start'] >= self.slow]
+            if not overdue:
+                continue
+            frames = sys._current_frames()
+            for ident, record in overdue:
+                frame = frames.get(ident)
+                if frame is not None:
+                    record['stacks'][_collapse(frame)] += 1
+
+    # ------------------------------------------------------------------
+    # Output
+    # ------------------------------------------------------------------
+
+    def _save(self, record, duration, status, user_id, reason):
+        storage_totals = {}
+        for name, op, seconds, size in record['storage']:
+            total = storage_totals.setdefault(f'{name}.{op}', {'calls': 0, 'ms': 0.0, 'bytes': 0})
+            total['calls'] += 1
+            total['ms'] += seconds * 1000
+            total['bytes'] += size
+        result = {
+            'reason': reason,
+            'method': record['method'],
+            'route': record['route'],
+            'user_id': user_id,
+            'status': status,
+            'started_at': record['started_at'],
+            'duration_ms': round(duration * 1000, 3),
+            'pid': os.getpid(),
+            'storage_ms': round(sum(t['ms'] for t in storage_totals.values()), 3),
+            'storage': storage_totals,
+            'storage_calls': [{'file': n, 'op': o, 'ms': round(s * 1000, 3), 'bytes': b}
+                              for n, o, s, b in record['storage']],
+            'stacks': [{'stack': stack, 'samples': count} for stack, count in record['stacks'].most_common(self.top)],
+            'sample_interval_ms': self.sample_interval * 1000,
+            'functions': _top_functions(record['profile'], self.top) if record['profile'] is not None else []
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(record['started_at']))
+        slug = record['route'].strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+        name = f'{stamp}-{int(record["started_at"] * 1000) % 1000:03d}-{os.getpid()}-{slug}.json'
+        tmp_path = os.path.join(self.directory, f'.{name}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.directory, name))
+        self._rotate()
+
+    def _rotate(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith('.json'))
+        for name in names[:max(0, len(names) - self.keep)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def list(self, limit=100):
+        """Newest saved profiles as (file name, summary) pairs"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted((n for n in os.listdir(self.directory) if n.endswith('.json')), reverse=True)[:limit]
+        summaries = []
+        for name in names:
+            result = self.load(name)
+            if result is not None:
+                summaries.append((name, result))
+        return summaries
+
+    def load(self, name):
+        if os.path.basename(name) != name or not name.endswith('.json'):
+            return None
+        try:
+            with open(os.path.join(self.directory, name)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+def _collapse(frame, limit=40):
+    """Render a stack as 'outer;...;inner' in the collapsed flame-graph format"""
+    parts = []
+    while frame is not None and len(parts) < limit:
+        code = frame.f_code
+        parts.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+def _top_functions(profile, limit):
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, name), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': f'{name} ({os.path.basename(filename)}:{line})',
+            'calls': ncalls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3)
+        })
+    rows.sort(key=lambda r: r['cumtime_ms'], reverse=True)
+    return rows[:limit]
@@ -0,0 +1,206 @@
+# Brain Games - Write Admission Control
+# Per-user and global token buckets plus an in-flight write limit, kept in a
+# shared memory map so every gunicorn worker enforces the same limits
+
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from processes import alive
+
+# global bucket tokens, global bucket updated_at
+GLOBAL = struct.Struct('<dd')
+# pid, writes in flight for that pid
+INFLIGHT = struct.Struct('<II')
+# user key hash, tokens, updated_at
+BUCKET = struct.Struct('<Qdd')
+
+PROCESS_SLOTS = 64
+PROBE = 8
+
+# ============================================================================
+# ADMISSION
+# ============================================================================
+
+class WriteAdmission:
+    """Decides, before any file is touched, whether a write may proceed.
+
+    The map holds the global bucket, one in-flight counter per worker pid and
+    a fixed open-addressed table of per-user buckets. A full table evicts the
+    least recently used bucket in the probe window, which at worst hands that
+    user a fresh burst. Everything is updated under an flock on the map file
+    (plus a thread lock, since flock does not exclude threads of one process).
+    """
+
+    def __init__(self, path, user_rate=2.0, user_burst=10, global_rate=50.0, global_burst=100,
+                 max_inflight=4, user_slots=4096):
+        self.path = path
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_inflight = max_inflight
+        self.user_slots = user_slots
+        self._inflight_offset = GLOBAL.size
+        self._buckets_offset = self._inflight_offset + INFLIGHT.size * PROCESS_SLOTS
+        self._size = self._buckets_offset + BUCKET.size * user_slots
+        self._thread_lock = threading.Lock()
+        self._pid = None
+
+    def _map(self):
+        # Opened lazily per process so forked workers get their own descriptor
+        if self._pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < self._size:
+                os.ftruncate(fd, self._size)
+            self._fd = fd
+            self._mm = mmap.mmap(fd, self._size)
+            self._pid = os.getpid()
+        return self._mm
+
+    def _locked(self):
+        return _FileLock(self._thread_lock, self._fd)
+
+    @staticmethod
+    def _refill(tokens, updated_at, rate, burst, now):
+        if updated_at == 0:
+            return float(burst)
+        return min(float(burst), tokens + (now - updated_at) * rate)
+
+    def _user_slot(self, mm, key_hash):
+        """Offset of the user's bucket, claiming or evicting a slot if needed"""
+        start = key_hash % self.user_slots
+        oldest, oldest_at = None, None
+        for i in range(PROBE):
+            offset = self._buckets_offset + ((start + i) % self.user_slots) * BUCKET.size
+            slot_hash, _, updated_at = BUCKET.unpack_from(mm, offset)
+            if slot_hash == key_hash:
+                return offset
+            if slot_hash == 0:
+                BUCKET.pack_into(mm, offset, key_hash, 0.0, 0.0)
+                return offset
+            if oldest_at is None or updated_at < oldest_at:
+                oldest, oldest_at = offset, updated_at
+        BUCKET.pack_into(mm, oldest, key_hash, 0.0, 0.0)
+        return oldest
+
+    def _inflight(self, mm, prune=False):
+        """Return (writes in flight across workers, offset of this pid's slot).
+
+        A pid holds a slot only while it has writes in flight, so the slot is
+        a free one when this pid has none. None means every slot is taken.
+        """
+        region = mm[self._inflight_offset:self._buckets_offset]
+        total = 0
+        own = None
+        free = None
+        for i, (pid, count) in enumerate(INFLIGHT.iter_unpack(region)):
+            offset = self._inflight_offset + i * INFLIGHT.size
+            if pid == self._pid:
+                own = offset
+            elif pid and prune and not alive(pid):
+                # A worker died mid-request; its writes are no longer in flight
+                INFLIGHT.pack_into(mm, offset, 0, 0)
+                pid, count = 0, 0
+            if pid == 0 and free is None:
+                free = offset
+            total += count
+        return total, own if own is not None else free
+
+    def admit(self, user_key):
+        """Return (None, 0) if admitted, else (http_status, retry_after_seconds).
+
+        An admitted caller must call release() when the write finishes.
+        """
+        mm = self._map()
+        key_hash = int.from_bytes(hashlib.blake2b(user_key.encode(), digest_size=8).digest(), 'big') or 1
+        now = time.time()
+        with self._locked():
+            offset = self._user_slot(mm, key_hash)
+            _, user_tokens, user_at = BUCKET.unpack_from(mm, offset)
+            user_tokens = self._refill(user_tokens, user_at, self.user_rate, self.user_burst, now)
+            global_tokens, global_at = GLOBAL.unpack_from(mm, 0)
+            global_tokens = self._refill(global_tokens, global_at, self.global_rate, self.global_burst, now)
+
+            if user_tokens < 1:
+                BUCKET.pack_into(mm, offset, key_hash, user_tokens, now)
+                return 429, (1 - user_tokens) / self.user_rate
+            if global_tokens < 1:
+                GLOBAL.pack_into(mm, 0, global_tokens, now)
+                return 429, (1 - global_tokens) / self.global_rate
+
+            total, slot = self._inflight(mm)
+            if total >= self.max_inflight or slot is None:
+                total, slot = self._inflight(mm, prune=True)
+            if total >= self.max_inflight or slot is None:
+                return 503, 1.0
+
+            BUCKET.pack_into(mm, offset, key_hash, user_tokens - 1, now)
+            GLOBAL.pack_into(mm, 0, global_tokens - 1, now)
+            _, count = INFLIGHT.unpack_from(mm, slot)
+            INFLIGHT.pack_into(mm, slot, self._pid, count + 1)
+        return None, 0
+
+    def take(self, key, rate, burst):
+        """Spend one token of `key`'s own bucket; return 0, or seconds until one refills.
+
+        For limits outside the write path (e.g. password reset email), with
+        their own rate. Keys share the table with admit()'s per-user
+        buckets, so callers prefix them.
+        """
+        mm = self._map()
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big') or 1
+        now = time.time()
+        with self._locked():
+            offset = self._user_slot(mm, key_hash)
+            _, tokens, updated_at = BUCKET.unpack_from(mm, offset)
+            tokens = self._refill(tokens, updated_at, rate, burst, now)
+            if tokens < 1:
+                BUCKET.pack_into(mm, offset, key_hash, tokens, now)
+                return (1 - tokens) / rate
+            BUCKET.pack_into(mm, offset, key_hash, tokens - 1, now)
+        return 0
+
+    def release(self):
+        mm = self._map()
+        with self._locked():
+            _, slot = self._inflight(mm)
+            if slot is None:
+                return
+            pid, count = INFLIGHT.unpack_from(mm, slot)
+            if pid == self._pid and count:
+                # Give the slot back once idle, so short-lived pids (worker
+                # restarts, max_requests) don't use up the table
+                INFLIGHT.pack_into(mm, slot, pid if count > 1 else 0, count - 1)
+
+def reset(path):
+    """Start from an empty map (new deployment); workers recreate it lazily.
+
+    Workers still mapping the old file, e.g. during a USR2 upgrade, keep
+    their copy until they exit.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+class _FileLock:
+    def __init__(self, thread_lock, fd):
+        self._thread_lock = thread_lock
+        self._fd = fd
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
@@ -0,0 +1,176 @@
+# Brain Games - Password Reset Tokens
+# SQLite token store indexed by token and by expiry, with a sweeper thread
+# that purges expired tokens in small batches
+
+import json
+import os
+import random
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from sqlite_conn import LocalConnection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reset_tokens (
+    token TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS reset_tokens_expiry ON reset_tokens (expires_at);
+CREATE INDEX IF NOT EXISTS reset_tokens_email ON reset_tokens (email);
+"""
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+class ResetTokenStore:
+    """Reset tokens shared by every process pointing at the same file.
+
+    create(), consume() and revoke() each touch only the rows involved, and
+    lookup() is one primary-key probe that ignores expired rows, so an
+    expired token is dead the moment it expires whether or not it has been
+    purged yet. The sweeper walks the expiry index from the oldest end and
+    deletes at most `batch_size` rows per transaction, so a large backlog
+    never holds the write lock for long.
+
+    `legacy_file` is an old reset_tokens.json; its unexpired tokens are
+    imported once and the file is renamed to `<file>.migrated`.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, sweep_interval=300.0, batch_size=500, legacy_file=None):
+        self.path = path
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.batch_size = batch_size
+        self.legacy_file = legacy_file
+        self._connect = LocalConnection(path)
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._counters = {'created': 0, 'consumed': 0, 'revoked': 0, 'swept': 0}
+        self._init_schema()
+
+    def _init_schema(self):
+        try:
+            self._connect().executescript(SCHEMA)
+            if self.legacy_file and os.path.exists(self.legacy_file):
+                self._migrate()
+        except Exception as e:
+            print(f"[ERROR] Failed to initialize reset token store: {e}")
+
+    def _migrate(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker may have migrated while we waited for the lock
+            if not os.path.exists(self.legacy_file):
+                conn.execute('ROLLBACK')
+                return
+            with open(self.legacy_file) as f:
+                content = f.read().strip()
+            tokens = json.loads(content) if content else {}
+            now = time.time()
+            rows = []
+            for token, data in tokens.items():
+                try:
+                    expires_at = datetime.fromisoformat(data['expires_at']).timestamp()
+                    created_at = datetime.fromisoformat(data['created_at']).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if expires_at > now:
+                    rows.append((token, data['email'], created_at, expires_at))
+            conn.executemany('INSERT OR IGNORE INTO reset_tokens VALUES (?, ?, ?, ?)', rows)
+            os.replace(self.legacy_file, f'{self.legacy_file}.migrated')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        print(f"Migrated {len(rows)} of {len(tokens)} reset tokens from {self.legacy_file}")
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._counters[name] += n
+
+    def create(self, email):
+        """Store a new token for `email` and return it"""
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        self._connect().execute('INSERT INTO reset_tokens VALUES (?, ?, ?, ?)',
+                                (token, email, now, now + self.ttl))
+        self._count('created')
+        return token
+
+    def lookup(self, token):
+        """Return the email for an unexpired token, else None"""
+        row = self._connect().execute('SELECT email FROM reset_tokens WHERE token = ? AND expires_at > ?',
+                                      (token, time.time())).fetchone()
+        return row[0] if row else None
+
+    def consume(self, token):
+        """Delete an unexpired token and return its email; None if another request got it first"""
+        row = self._connect().execute('DELETE FROM reset_tokens WHERE token = ? AND expires_at > ? RETURNING email',
+                                      (token, time.time())).fetchone()
+        if row is None:
+            return None
+        self._count('consumed')
+        return row[0]
+
+    def revoke(self, email):
+        """Delete every token issued to `email`"""
+        removed = self._connect().execute('DELETE FROM reset_tokens WHERE email = ?', (email,)).rowcount
+        self._count('revoked', removed)
+        return removed
+
+    # ------------------------------------------------------------------------
+    # Sweeper
+    # ------------------------------------------------------------------------
+
+    def sweep(self):
+        """Purge expired tokens in batches and return how many were removed"""
+        conn = self._connect()
+        now = time.time()
+        removed = 0
+        while True:
+            batch = conn.execute(
+                'DELETE FROM reset_tokens WHERE token IN '
+                '(SELECT token FROM reset_tokens WHERE expires_at <= ? ORDER BY expires_at LIMIT ?)',
+                (now, self.batch_size)).rowcount
+            removed += batch
+            if batch < self.batch_size:
+                break
+            # Let request writes in between batches
+            time.sleep(0.01)
+        self._count('swept', removed)
+        return removed
+
+    def start(self):
+        """Start the sweeper thread for this process (no-op if running)"""
+        if self.sweep_interval <= 0 or self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            threading.Thread(target=self._sweep_loop, name='reset-token-sweeper', daemon=True).start()
+            self._started_pid = os.getpid()
+
+    def _sweep_loop(self):
+        while True:
+            # Jittered so workers started together don't all sweep at once
+            time.sleep(self.sweep_interval * random.uniform(0.5, 1.5))
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[ERROR] Reset token sweep failed: {e}")
+
+    # ------------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------------
+
+    def counters(self):
+        """Tokens created, consumed, revoked and swept by this process"""
+        with self._stats_lock:
+            return dict(self._counters)
@@ -0,0 +1,227 @@
+# Brain Games - Player Search
+# In-memory display-name index answering prefix queries with one-typo
+# tolerance, plus the opaque public ids players are exposed under
+
+import base64
+import bisect
+import hashlib
+import heapq
+import hmac
+import threading
+import unicodedata
+
+SEP = '\x00'
+
+def normalize_name(name):
+    """Casefold, strip accents and collapse whitespace"""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c) and c != SEP)
+    return ' '.join(stripped.casefold().split())
+
+def _word_suffixes(normalized):
+    """The name from the start of each word, so 'ada lovelace' is found by 'lov'"""
+    suffixes = [normalized]
+    for i, c in enumerate(normalized):
+        if c == ' ':
+            suffixes.append(normalized[i + 1:])
+    return suffixes
+
+# ============================================================================
+# INDEX
+# ============================================================================
+
+class UserSearchIndex:
+    """Display-name search over every user, kept in this process.
+
+    The index is one sorted list of '<name from a word start>\\0<public id>'
+    strings, which works like a compacted trie: all names under a prefix are
+    a contiguous run found by bisect, and the distinct next characters under
+    a prefix can be enumerated by jumping from run to run. That keeps it to
+    one string per indexed word (a node-per-character trie in Python would
+    be several times larger) with lookups in O(log n + k).
+
+    When nothing starts with the query itself, queries of at least
+    `typo_min_length` characters also try every variant one edit away
+    (deletion, transposition, and substitution or insertion of a character
+    that actually occurs at that position in the index, except at the first
+    position).
+
+    build() loads everything from `load()` -> {user_id: record}. Changes
+    arrive as invalidate(user_id) from the invalidation bus and are applied
+    in one batch through `fetch(user_ids)` -> {user_id: record or None} on
+    the next search.
+    """
+
+    def __init__(self, secret, load, fetch, typo_min_length=3):
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.typo_min_length = typo_min_length
+        self._load = load
+        self._fetch = fetch
+        self._keys = None
+        self._users = {}
+        self._stale = set()
+        self._lock = threading.RLock()
+
+    def public_id(self, user_id):
+        """Stable opaque id for a user; reveals nothing about the email"""
+        digest = hmac.new(self.secret, user_id.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:12]).decode()
+
+    def resolve(self, public_id):
+        """Return (user_id, display_name) for a public id, or None"""
+        with self._lock:
+            self._ensure_current()
+            return self._users.get(public_id)
+
+    def build(self):
+        users = self._load()
+        keys = []
+        entries = {}
+        for user_id, record in users.items():
+            public_id = self.public_id(user_id)
+            entries[public_id] = (user_id, record['display_name'])
+            keys.extend(f'{suffix}{SEP}{public_id}' for suffix in _word_suffixes(normalize_name(record['display_name'])))
+        keys.sort()
+        with self._lock:
+            self._keys = keys
+            self._users = entries
+            self._stale = set()
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._stale.add(user_id)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._keys = None
+
+    def __len__(self):
+        return len(self._users)
+
+    def _ensure_current(self):
+        if self._keys is None:
+            self.build()
+        if not self._stale:
+            return
+        stale, self._stale = self._stale, set()
+        for user_id, record in self._fetch(stale).items():
+            public_id = self.public_id(user_id)
+            old = self._users.pop(public_id, None)
+            if old is not None:
+                for suffix in _word_suffixes(normalize_name(old[1])):
+                    i = bisect.bisect_left(self._keys, f'{suffix}{SEP}{public_id}')
+                    if i < len(self._keys) and self._keys[i] == f'{suffix}{SEP}{public_id}':
+                        del self._keys[i]
+            if record is not None:
+                self._users[public_id] = (user_id, record['display_name'])
+                for suffix in _word_suffixes(normalize_name(record['display_name'])):
+                    bisect.insort(self._keys, f'{suffix}{SEP}{public_id}')
+
+    # ------------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------------
+
+    def _prefix(self, prefix, found, limit):
+        keys = self._keys
+        i = bisect.bisect_left(keys, prefix)
+        while i < len(keys) and len(found) < limit and keys[i].startswith(prefix):
+            found.setdefault(keys[i].rpartition(SEP)[2], keys[i])
+            i += 1
+
+    def _next_chars(self, prefix):
+        """Characters that follow `prefix` somewhere in the index"""
+        keys = self._keys
+        depth = len(prefix)
+        i = bisect.bisect_left(keys, prefix)
+        chars = []
+        while i < len(keys) and keys[i].startswith(prefix):
+            c = keys[i][depth]
+            if c != SEP:
+                chars.append(c)
+            # Skip to the first key after every key continuing with c
+            i = bisect.bisect_left(keys, prefix + chr(ord(c) + 1), i)
+        return chars
+
+    def _matched_length(self, query):
+        """Length of the longest prefix of `query` that some key starts with"""
+        keys = self._keys
+        i = bisect.bisect_left(keys, query)
+        best = 0
+        for key in keys[max(0, i - 1):i + 1]:
+            n = 0
+            while n < len(query) and n < len(key) and query[n] == key[n]:
+                n += 1
+            best = max(best, n)
+        return best
+
+    def _variants(self, query):
+        seen = {query}
+        # An edit after the first unmatched character leaves that character
+        # in place, so it can't produce a match; only earlier edits are tried
+        for i in range(min(len(query), self._matched_length(query) + 1)):
+            candidates = [query[:i] + query[i + 1:]]
+            if i + 1 < len(query):
+                candidates.append(query[:i] + query[i + 1] + query[i] + query[i + 2:])
+            # A wrong or missing first letter is rare and would try every
+            # letter of the alphabet, so those edits start at the second
+            if i > 0:
+                for c in self._next_chars(query[:i]):
+                    candidates.append(query[:i] + c + query[i + 1:])
+                    candidates.append(query[:i] + c + query[i:])
+            for variant in candidates:
+                if variant and variant not in seen:
+                    seen.add(variant)
+                    yield variant
+
+    def matches(self, query, limit):
+        """Return (up to `limit` [key, public_id, display_name] in key order, typo).
+
+        Prefix matches, or if there are none, matches one edit away (typo).
+        The key is the index entry matched, so matches from several indexes
+        (one per shard) combine in order with merge_pages().
+        """
+        query = normalize_name(query)
+        if not query:
+            return [], False
+        with self._lock:
+            self._ensure_current()
+            found = {}
+            self._prefix(query, found, limit)
+            typo = not found
+            if typo and len(query) >= self.typo_min_length:
+                for variant in self._variants(query):
+                    self._prefix(variant, found, limit)
+                    if len(found) >= limit:
+                        break
+            matches = sorted([key, public_id, self._users[public_id][1]] for public_id, key in found.items())
+        return matches, typo
+
+    def search(self, query, offset=0, limit=20):
+        """Return ([{'id', 'display_name', 'typo'}], has_more).
+
+        Prefix matches in name order, or if there are none, matches one
+        edit away (flagged 'typo').
+        """
+        return merge_pages([self.matches(query, offset + limit + 1)], offset, limit)
+
+def merge_pages(results, offset, limit):
+    """One page of search() results from several indexes' (matches, typo).
+
+    Each index must have returned at least offset + limit + 1 matches (or
+    all it has). Typo matches only count when no index found the query as
+    a prefix, as in a single index.
+    """
+    prefix = [matches for matches, typo in results if not typo and matches]
+    typo = not prefix
+    lists = [matches for matches, t in results if t] if typo else prefix
+    page = []
+    seen = set()
+    for _, public_id, display_name in heapq.merge(*lists):
+        # A user mid-rebalance can be on two nodes for a moment
+        if public_id in seen:
+            continue
+        seen.add(public_id)
+        if len(page) == offset + limit + 1:
+            break
+        page.append({'id': public_id, 'display_name': display_name, 'typo': typo})
+    return page[offset:offset + limit], len(page) > offset + limit
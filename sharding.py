@@ -0,0 +1,240 @@
+# Brain Games - User Sharding
+# Consistent-hash placement of users on app nodes, request forwarding and
+# scatter-gather helpers
+
+import hashlib
+import heapq
+import hmac
+import json
+import urllib.error
+import urllib.request
+from bisect import bisect_right, insort
+from concurrent.futures import ThreadPoolExecutor
+
+from email_index import normalize_email
+
+# Hop-by-hop headers are never copied between the client and the owning node
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+               'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length'}
+
+# ============================================================================
+# HASH RING
+# ============================================================================
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+def shard_key(user_id):
+    """Ring key for a user: the normalized email, so any casing of it finds the same node"""
+    return normalize_email(user_id)
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Each node owns `vnodes` points on the ring, so adding or removing one
+    node moves only about 1/N of the keys and spreads them across all the
+    remaining nodes instead of dumping them on a single neighbour.
+    """
+
+    def __init__(self, nodes=(), vnodes=64):
+        self.vnodes = vnodes
+        self._points = []
+        self._owners = {}
+        self.nodes = set()
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash(f'{node}#{i}')
+            self._owners[point] = node
+            insort(self._points, point)
+
+    def remove_node(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self._points = [p for p in self._points if self._owners[p] != node]
+        self._owners = {p: self._owners[p] for p in self._points}
+
+    def node_for(self, key):
+        if not self._points:
+            raise LookupError('Hash ring has no nodes')
+        i = bisect_right(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[i]]
+
+def plan_rebalance(old_ring, new_ring, user_ids):
+    """Map each user id whose owner changes to (old_node, new_node)"""
+    moves = {}
+    for user_id in user_ids:
+        key = shard_key(user_id)
+        src, dst = old_ring.node_for(key), new_ring.node_for(key)
+        if src != dst:
+            moves[user_id] = (src, dst)
+    return moves
+
+def parse_nodes(spec):
+    """Parse SHARD_NODES, e.g. 'a=http://10.0.0.1:8080,b=http://10.0.0.2:8080'"""
+    nodes = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, url = item.partition('=')
+        nodes[name.strip()] = url.strip().rstrip('/')
+    return nodes
+
+# ============================================================================
+# ROUTER
+# ============================================================================
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Redirects are relayed to the browser, not followed by the forwarder
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+class ShardRouter:
+    """Knows which node owns each user and talks to the other nodes.
+
+    Nodes authenticate each other with a shared secret. There is no default:
+    a node that is part of a ring refuses to start without one, and the
+    peer API is closed unless sharding is on and a secret is set.
+    """
+
+    def __init__(self, self_node, nodes, secret, vnodes=64, timeout=10):
+        self.self_node = self_node
+        self.secret = secret or None
+        self.vnodes = vnodes
+        self.timeout = timeout
+        self.set_nodes(nodes)
+        if self.enabled and not self.secret:
+            raise ValueError('Sharding needs a shared secret (SHARD_SECRET)')
+
+    def set_nodes(self, nodes):
+        self.nodes = dict(nodes)
+        self.ring = HashRing(self.nodes, self.vnodes)
+
+    @property
+    def enabled(self):
+        return len(self.nodes) > 1 and self.self_node in self.nodes
+
+    def owner(self, user_id):
+        return self.ring.node_for(shard_key(user_id))
+
+    @property
+    def accepts_peers(self):
+        return self.enabled and bool(self.secret)
+
+    def is_peer(self, secret):
+        """True if `secret` (the X-Shard-Secret header) authenticates another node"""
+        if not self.accepts_peers or not secret:
+            return False
+        return hmac.compare_digest(secret.encode(), self.secret.encode())
+
+    def is_local(self, user_id):
+        return not self.enabled or self.owner(user_id) == self.self_node
+
+    def peers(self):
+        return [node for node in self.nodes if node != self.self_node]
+
+    def _headers(self, extra=None):
+        headers = dict(extra or {})
+        headers['X-Shard-Secret'] = self.secret
+        if self.self_node:
+            headers['X-Shard-Forwarded'] = self.self_node
+        return headers
+
+    def forward(self, node, method, full_path, headers, body):
+        """Replay a client request on the owning node.
+
+        Returns (status, headers, body) where headers is a list of pairs so
+        repeated Set-Cookie headers survive.
+        """
+        out_headers = {k: v for k, v in headers if k.lower() not in HOP_HEADERS}
+        req = urllib.request.Request(self.nodes[node] + full_path, data=body or None,
+                                     headers=self._headers(out_headers), method=method)
+        try:
+            resp = _opener.open(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            resp = e
+        with resp:
+            # The local server adds its own Server and Date headers
+            resp_headers = [(k, v) for k, v in resp.headers.items()
+                            if k.lower() not in HOP_HEADERS and k.lower() not in ('server', 'date')]
+            return resp.status, resp_headers, resp.read()
+
+    def call(self, node, path, payload=None):
+        """JSON call to another node's /internal API"""
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(self.nodes[node] + path, data=data,
+                                     headers=self._headers({'Content-Type': 'application/json'}),
+                                     method='POST' if data is not None else 'GET')
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read() or b'null')
+
+    def scatter(self, path, local):
+        """Call `path` on every peer and `local()` here; return all results"""
+        peers = self.peers()
+        with ThreadPoolExecutor(max_workers=max(1, len(peers))) as pool:
+            futures = [pool.submit(self.call, node, path) for node in peers]
+            results = [local()]
+            for node, future in zip(peers, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"[ERROR] Shard {node} did not answer {path}: {e}")
+        return results
+
+def merge_top(results, limit, key):
+    """Merge per-shard top-N lists into the global top-N"""
+    return heapq.nlargest(limit, (entry for result in results for entry in result), key=key)
+
+# ============================================================================
+# REBALANCING
+# ============================================================================
+
+def rebalance(router, new_nodes):
+    """Move users whose owner changes when the node set becomes `new_nodes`.
+
+    Users are copied to their new owner, the nodes in the new ring switch to
+    it, and only then are the old copies deleted, so a user is never
+    missing. Nodes leaving the ring switch last: a node outside the ring
+    closes its peer API, so it must still be answering for the deletes.
+    Writes made to a moving user between the copy and the switch are lost,
+    so run this during a quiet period.
+
+    Nodes only answer the peer API while sharding is on, so to grow from a
+    single node, first restart it and the new nodes with the full ring in
+    SHARD_NODES (the new nodes still empty), then rebalance.
+    """
+    if not router.secret:
+        raise ValueError('Rebalancing needs the shared secret (SHARD_SECRET)')
+    old_nodes = dict(router.nodes)
+    all_nodes = {**old_nodes, **new_nodes}
+    old_ring = HashRing(old_nodes, router.vnodes)
+    new_ring = HashRing(new_nodes, router.vnodes)
+    admin = ShardRouter(None, all_nodes, router.secret, router.vnodes, router.timeout)
+
+    moved = []
+    for node in old_nodes:
+        user_ids = admin.call(node, '/internal/users')
+        for user_id, (src, dst) in plan_rebalance(old_ring, new_ring, user_ids).items():
+            if src != node:
+                # Stray copy left by an interrupted run; the owner's copy wins
+                continue
+            record = admin.call(src, f'/internal/users/export?user_id={urllib.request.quote(user_id)}')
+            admin.call(dst, '/internal/users/import', record)
+            moved.append((user_id, src, dst))
+
+    for node in new_nodes:
+        admin.call(node, '/internal/ring', {'nodes': new_nodes})
+
+    for user_id, src, _ in moved:
+        admin.call(src, '/internal/users/delete', {'user_id': user_id})
+
+    for node in old_nodes:
+        if node not in new_nodes:
+            admin.call(node, '/internal/ring', {'nodes': new_nodes})
+    return moved
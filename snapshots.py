@@ -0,0 +1,231 @@
+# Brain Games - Leaderboard Snapshots
+# Compact binary per-game rankings, written atomically and read through mmap
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b'BGLB'
+FORMAT_VERSION = 1
+
+# magic, format version, game count, generated_at, strings offset, strings size
+HEADER = struct.Struct('<4sHHdII')
+# game name, entry count, rankings offset, user index offset
+GAME_DIR = struct.Struct('<16sIII')
+# user_id offset, display_name offset, user_id length, display_name length, best, games played
+RECORD = struct.Struct('<IIHHdI')
+INDEX = struct.Struct('<I')
+
+# ============================================================================
+# WRITER
+# ============================================================================
+
+def write_snapshot(path, rankings, generated_at=None):
+    """Serialize {game: [entry, ...]} (entries already sorted best-first).
+
+    Each entry needs user_id, display_name, score and games_played. The file
+    is written next to `path` and renamed over it, so readers see either the
+    old snapshot or the new one, never a mix.
+    """
+    strings = bytearray()
+    offsets = {}
+
+    def intern(text):
+        data = text.encode('utf-8')[:65535]
+        if data not in offsets:
+            offsets[data] = len(strings)
+            strings.extend(data)
+        return offsets[data], len(data)
+
+    games = list(rankings)
+    body = bytearray()
+    directory = []
+    base = HEADER.size + GAME_DIR.size * len(games)
+    for game in games:
+        entries = rankings[game]
+        ranking_offset = base + len(body)
+        uids = []
+        for entry in entries:
+            uid_off, uid_len = intern(entry['user_id'])
+            name_off, name_len = intern(entry['display_name'] or '')
+            uids.append(entry['user_id'].encode('utf-8')[:65535])
+            body.extend(RECORD.pack(uid_off, name_off, uid_len, name_len, float(entry['score'] or 0), entry['games_played']))
+        index_offset = base + len(body)
+        for rank in sorted(range(len(entries)), key=lambda i: uids[i]):
+            body.extend(INDEX.pack(rank))
+        directory.append(GAME_DIR.pack(game.encode()[:16], len(entries), ranking_offset, index_offset))
+
+    strings_offset = base + len(body)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(games), generated_at or time.time(), strings_offset, len(strings))
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for entry in directory:
+            f.write(entry)
+        f.write(body)
+        f.write(strings)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# ============================================================================
+# READER
+# ============================================================================
+
+class LeaderboardSnapshot:
+    """Read-only view over a mapped snapshot file.
+
+    Pages are shared by every process mapping the same file, and only the
+    records a caller asks for are decoded.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, game_count, self.generated_at, self._strings, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a leaderboard snapshot')
+        self._games = {}
+        for i in range(game_count):
+            name, count, ranking_offset, index_offset = GAME_DIR.unpack_from(self._mm, HEADER.size + i * GAME_DIR.size)
+            self._games[name.rstrip(b'\0').decode()] = (count, ranking_offset, index_offset)
+
+    def _string(self, offset, length):
+        start = self._strings + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def _record(self, game, rank):
+        count, ranking_offset, _ = self._games[game]
+        uid_off, name_off, uid_len, name_len, best, games_played = RECORD.unpack_from(self._mm, ranking_offset + rank * RECORD.size)
+        return {
+            'user_id': self._string(uid_off, uid_len),
+            'display_name': self._string(name_off, name_len),
+            'score': int(best) if best.is_integer() else best,
+            'games_played': games_played
+        }
+
+    def count(self, game):
+        return self._games.get(game, (0, 0, 0))[0]
+
+    def top(self, game, limit=10):
+        if game not in self._games:
+            return []
+        return [self._record(game, rank) for rank in range(min(limit, self.count(game)))]
+
+    def rank(self, game, user_id):
+        """Return (1-based rank, entry) for a user, or None if unranked"""
+        if game not in self._games:
+            return None
+        count, ranking_offset, index_offset = self._games[game]
+        target = user_id.encode('utf-8')
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            rank = INDEX.unpack_from(self._mm, index_offset + mid * INDEX.size)[0]
+            uid_off, _, uid_len, _, _, _ = RECORD.unpack_from(self._mm, ranking_offset + rank * RECORD.size)
+            start = self._strings + uid_off
+            uid = self._mm[start:start + uid_len]
+            if uid == target:
+                return rank + 1, self._record(game, rank)
+            if uid < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+class SnapshotReader:
+    """Hands out the current snapshot, remapping when the file is replaced"""
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            self._checked_at = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._snapshot = None
+                return None
+            current = self._snapshot
+            if current is None or (st.st_ino, st.st_mtime_ns) != (current.stat.st_ino, current.stat.st_mtime_ns):
+                try:
+                    # The old mapping is released once no reader holds it
+                    self._snapshot = LeaderboardSnapshot(self.path)
+                except Exception as e:
+                    print(f"[ERROR] Failed to map leaderboard snapshot: {e}")
+            return self._snapshot
+
+# ============================================================================
+# PERIODIC WRITER
+# ============================================================================
+
+class SnapshotWriter:
+    """Rewrites the snapshot every `interval` seconds while data is dirty.
+
+    Every worker runs the thread, but only the one holding an exclusive lock
+    on `<path>.lock` writes, so N workers cost one rebuild per interval. The
+    snapshot is also rewritten once it is `max_age` old, so readers can tell
+    a live snapshot from one abandoned by a stopped writer.
+    """
+
+    def __init__(self, path, build, interval=5.0, max_age=60.0):
+        self.path = path
+        self.build = build
+        self.interval = interval
+        self.max_age = max_age
+        self._dirty = threading.Event()
+        self._dirty.set()
+        self._started_pid = None
+        self._lock_file = None
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def write_now(self):
+        write_snapshot(self.path, self.build())
+
+    def start(self):
+        if self._started_pid == os.getpid():
+            return
+        self._started_pid = os.getpid()
+        threading.Thread(target=self._run, name='snapshot-writer', daemon=True).start()
+
+    def _is_leader(self):
+        if self._lock_file is None:
+            self._lock_file = open(f'{self.path}.lock', 'a')
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                self._lock_file = None
+                return False
+        return True
+
+    def _expired(self):
+        try:
+            return time.time() - os.stat(self.path).st_mtime > self.max_age / 2
+        except FileNotFoundError:
+            return True
+
+    def _run(self):
+        while True:
+            if self._is_leader() and (self._dirty.is_set() or self._expired()):
+                self._dirty.clear()
+                try:
+                    self.write_now()
+                except Exception as e:
+                    self._dirty.set()
+                    print(f"[ERROR] Failed to write leaderboard snapshot: {e}")
+            time.sleep(self.interval)
@@ -0,0 +1,29 @@
+# Brain Games - SQLite Connections
+# Per-thread WAL connections to the small SQLite files shared by every worker
+
+import os
+import sqlite3
+import threading
+
+class LocalConnection:
+    """Calling it returns the calling thread's connection to `path`.
+
+    sqlite3 connections may not be shared between threads or carried over
+    a fork, so each thread opens its own, and opens it again in a forked
+    worker. Connections are in autocommit mode (transactions are explicit
+    BEGINs) and use WAL, so readers never wait for the writer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
@@ -0,0 +1,214 @@
+# Brain Games - SQLite Work Queue
+# What the durable queues (background jobs, email outbox) have in common:
+# claiming in an immediate transaction, retries with backoff, dead rows,
+# worker threads per process and their metrics
+
+import os
+import random
+import threading
+import time
+
+from sqlite_conn import LocalConnection
+
+# ============================================================================
+# QUEUE
+# ============================================================================
+
+class SQLiteQueue:
+    """A queue table shared by every process pointing at the same file.
+
+    Subclasses set `table`, `schema` and the payload `columns`, and implement
+    process(items), which returns one entry per claimed item: None if it
+    succeeded, else the exception that stopped it.
+
+    enqueue is a single INSERT. Worker threads claim up to `batch_size` ready
+    rows in one immediate transaction, so several gunicorn workers can drain
+    the same table without processing a row twice. Done rows are deleted;
+    failed ones are retried with exponential backoff and end up as 'dead'
+    after max_attempts, or at once for one of `permanent_errors`. Rows
+    claimed more than stale_after seconds ago (their worker died) are
+    claimed again.
+    """
+
+    table = None
+    schema = None
+    columns = ()
+    label = 'queue'             # in thread names and log lines
+    claimed_status = 'running'
+    done_counter = 'succeeded'
+    extra_counters = ()
+    permanent_errors = ()
+
+    def __init__(self, path, workers, batch_size, max_attempts, base_backoff, max_backoff,
+                 poll_interval, stale_after):
+        self.path = path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._connect = LocalConnection(path)
+        self._wakeup = threading.Event()
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._counters = dict.fromkeys(('enqueued', self.done_counter, 'retried', 'dead') + self.extra_counters, 0)
+        self._init_schema()
+
+    def _init_schema(self):
+        try:
+            self._connect().executescript(self.schema)
+        except Exception as e:
+            print(f"[ERROR] Failed to initialize {self.label} queue: {e}")
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._counters[name] += n
+
+    def _insert(self, kind, values, delay=0):
+        """INSERT a pending row; returns its id, or None if that failed"""
+        now = time.time()
+        names = ['kind'] + list(values) + ['enqueued_at', 'run_at']
+        try:
+            cur = self._connect().execute(
+                f"INSERT INTO {self.table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                [kind] + list(values.values()) + [now, now + delay])
+        except Exception as e:
+            print(f"[ERROR] Failed to enqueue {kind} {self.label}: {e}")
+            return None
+        self._count('enqueued')
+        self.start()
+        self._wakeup.set()
+        return cur.lastrowid
+
+    def process(self, items):
+        raise NotImplementedError
+
+    # ------------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------------
+
+    def start(self):
+        """Start the worker threads for this process (no-op if running)"""
+        if self.workers <= 0 or self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            # Threads do not survive fork, so each worker process starts its own
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f'{self.label}-worker-{i}', daemon=True).start()
+            self._started_pid = os.getpid()
+
+    def _claim(self):
+        """Claim up to batch_size ready rows; `attempts` includes this one"""
+        columns = ('id', 'kind') + tuple(self.columns) + ('attempts', 'enqueued_at', 'run_at')
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(columns)} FROM {self.table} "
+                f"WHERE (status = 'pending' AND run_at <= ?) "
+                f"OR (status = '{self.claimed_status}' AND started_at < ?) "
+                f"ORDER BY run_at LIMIT ?",
+                (now, now - self.stale_after, self.batch_size)).fetchall()
+            conn.executemany(
+                f"UPDATE {self.table} SET status = '{self.claimed_status}', attempts = attempts + 1, "
+                f"started_at = ? WHERE id = ?",
+                [(now, row[0]) for row in rows])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        items = [dict(zip(columns, row)) for row in rows]
+        for item in items:
+            item['attempts'] += 1
+        return items
+
+    def _backoff(self, attempts):
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def process_batch(self):
+        """Claim and process one batch. Returns the number of rows claimed."""
+        items = self._claim()
+        if not items:
+            return 0
+        try:
+            results = self.process(items)
+        except Exception as e:
+            results = [e] * len(items)
+        conn = self._connect()
+        now = time.time()
+        for item, error in zip(items, results):
+            if error is None:
+                conn.execute(f'DELETE FROM {self.table} WHERE id = ?', (item['id'],))
+                self._count(self.done_counter)
+                continue
+            message = f'{type(error).__name__}: {error}'
+            if isinstance(error, self.permanent_errors) or item['attempts'] >= self.max_attempts:
+                conn.execute(f"UPDATE {self.table} SET status = 'dead', last_error = ? WHERE id = ?",
+                             (message, item['id']))
+                print(f"[ERROR] {self.label.capitalize()} {item['id']} ({item['kind']}) failed permanently: {message}")
+                self._count('dead')
+            else:
+                conn.execute(
+                    f"UPDATE {self.table} SET status = 'pending', run_at = ?, last_error = ? WHERE id = ?",
+                    (now + self._backoff(item['attempts']), message, item['id']))
+                self._count('retried')
+        return len(items)
+
+    def drain(self, limit=None):
+        """Process ready rows on the calling thread until none are left or
+        `limit` have been claimed (CLI, tests). Returns the number claimed."""
+        claimed = 0
+        while limit is None or claimed < limit:
+            n = self.process_batch()
+            if not n:
+                break
+            claimed += n
+        return claimed
+
+    def _work(self):
+        while True:
+            try:
+                if self.process_batch():
+                    continue
+            except Exception as e:
+                print(f"[ERROR] {self.label.capitalize()} worker error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    # ------------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------------
+
+    def depth(self):
+        rows = self._connect().execute(f'SELECT status, COUNT(*) FROM {self.table} GROUP BY status').fetchall()
+        depth = {'pending': 0, self.claimed_status: 0, 'dead': 0}
+        depth.update(dict(rows))
+        return depth
+
+    def oldest_pending_age(self):
+        oldest = self._connect().execute(
+            f"SELECT MIN(enqueued_at) FROM {self.table} WHERE status = 'pending'").fetchone()[0]
+        return round(time.time() - oldest, 3) if oldest else 0
+
+    def counters(self):
+        """Outcome counters for this process"""
+        with self._stats_lock:
+            return dict(self._counters)
+
+def summarize(samples):
+    """count/p50/p95/max of a sorted list of durations"""
+    if not samples:
+        return {'count': 0, 'p50': 0, 'p95': 0, 'max': 0}
+    return {
+        'count': len(samples),
+        'p50': round(samples[len(samples) // 2], 4),
+        'p95': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        'max': round(samples[-1], 4),
+    }
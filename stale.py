@@ -0,0 +1,97 @@
+# Brain Games - Stale-While-Revalidate
+# Bounded-latency reads that fall back to the last good result while a slow
+# computation finishes in the background
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# ============================================================================
+# FALLBACK CACHE
+# ============================================================================
+
+class StaleWhileRevalidate:
+    """Remembers the last good value per key and serves it when a fresh one is late.
+
+    get() starts (or joins) a computation for the key and waits until the
+    deadline. If the result is not ready by then and a last good value no
+    older than `max_stale` exists, that value is returned with its age and
+    the computation carries on in the background to replace it. With nothing
+    to fall back on, the caller waits for the computation like before.
+    """
+
+    def __init__(self, workers=4, max_entries=10000, max_stale=300.0):
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self._pool = None
+        self._pool_pid = None
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._last_good = OrderedDict()
+        self._inflight = {}
+        self.served_fresh = 0
+        self.served_stale = 0
+
+    def _executor(self):
+        # Threads do not survive fork, so each worker process gets its own pool
+        if self._pool_pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='stale-refresh')
+            self._pool_pid = os.getpid()
+            # Refreshes started before the fork will never finish here
+            self._inflight.clear()
+        return self._pool
+
+    def _store(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        try:
+            value = future.result()
+        except Exception as e:
+            print(f"[ERROR] Background refresh of {key!r} failed: {e}")
+            return
+        self.remember(key, value)
+
+    def remember(self, key, value):
+        """Record a value the caller obtained without going through get()"""
+        with self._lock:
+            self._last_good[key] = (value, time.time())
+            self._last_good.move_to_end(key)
+            while len(self._last_good) > self.max_entries:
+                self._last_good.popitem(last=False)
+
+    def get(self, key, compute, deadline):
+        """Return (value, age_seconds); age is 0 for a fresh value.
+
+        `deadline` is a time.monotonic() value shared by every lookup made for
+        one request, so a page reading several keys stays within one budget.
+        """
+        started = False
+        with self._lock:
+            pool = self._executor()
+            future = self._inflight.get(key)
+            if future is None:
+                future = pool.submit(compute)
+                self._inflight[key] = future
+                started = True
+            last_good = self._last_good.get(key)
+        if started:
+            # Outside the lock: a callback on an already finished future runs here
+            future.add_done_callback(lambda f: self._store(key, f))
+
+        if last_good is not None and time.time() - last_good[1] <= self.max_stale:
+            try:
+                value = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                self.served_stale += 1
+                return last_good[0], time.time() - last_good[1]
+            except Exception:
+                # The refresh failed outright; the last good value beats an error page
+                self.served_stale += 1
+                return last_good[0], time.time() - last_good[1]
+        else:
+            value = future.result()
+        self.served_fresh += 1
+        return value, 0
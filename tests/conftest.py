@@ -0,0 +1,55 @@
+# Brain Games - Test Fixtures
+# The app reads its configuration at import time, so the environment is set
+# here, before any test module imports it
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA_DIR = tempfile.mkdtemp(prefix='brain-games-tests-')
+os.environ.update(
+    DATA_DIR=DATA_DIR,
+    RATE_LIMIT_FILE=os.path.join(DATA_DIR, 'ratelimit'),
+    METRICS_DIR='',
+    JOB_WORKERS='0',
+    EMAIL_SENDERS='0',
+    PASSWORD_HASH_WORKERS='0',
+    SCRYPT_N='1024',
+    SEED_ON_STARTUP='0',
+    SNAPSHOT_INTERVAL='3600',
+    ADMIN_EMAILS='admin@example.com',
+    METRICS_TOKEN='test-metrics-token',
+)
+for name in ('SHARD_NODES', 'SHARD_SELF', 'SHARD_SECRET', 'PRELOAD_DATA', 'PUBLIC_BASE_URL',
+             'TRUSTED_PROXIES'):
+    os.environ.pop(name, None)
+
+PASSWORD = 'password1'
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    app.app.config['TESTING'] = True
+    return app
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+@pytest.fixture
+def signup(app_module):
+    """Create an account and return a client logged in as it"""
+    counter = iter(range(10 ** 6))
+
+    def make(email=None, display_name='Test Player'):
+        email = email or f'player{next(counter)}-{os.urandom(3).hex()}@example.com'
+        client = app_module.app.test_client()
+        resp = client.post('/signup', data={'email': email, 'password': PASSWORD, 'display_name': display_name})
+        assert resp.status_code == 302, resp.get_data(as_text=True)[:200]
+        return client, email
+    return make
@@ -0,0 +1,72 @@
+# Badge engine: incremental rule evaluation against aggregates
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from badges import BADGE_ENGINE, BADGE_RULES, BadgeEngine, aggregate_value, rule_key
+
+def aggregates(total=0, streak=0, **games):
+    return {'total_games': total, 'streak': streak,
+            'games': {game: {'count': count, 'best': best} for game, (count, best) in games.items()}}
+
+def test_rule_keys():
+    assert rule_key({'type': 'game_count', 'count': 10}) == ('total_games', 10)
+    assert rule_key({'type': 'game_milestone', 'game': 'memory', 'count': 25}) == ('games.memory.count', 25)
+    assert rule_key({'type': 'score_threshold', 'game': 'memory', 'score': 10}) == ('games.memory.best', 10)
+    assert rule_key({'type': 'streak', 'days': 3}) == ('streak', 3)
+    with pytest.raises(ValueError):
+        rule_key({'type': 'karma'})
+
+def test_aggregate_value():
+    agg = aggregates(total=3, memory=(3, 7))
+    assert aggregate_value(agg, 'games.memory.best') == 7
+    assert aggregate_value(agg, 'games.stroop_test.best') is None
+    assert aggregate_value(agg, 'total_games.count') is None
+
+def test_every_threshold_reached_is_awarded_once():
+    agg = aggregates(total=50, memory=(50, 4))
+    assert BADGE_ENGINE.evaluate(agg, ['total_games'], {}) == ['first_game', 'ten_games', 'fifty_games']
+    assert BADGE_ENGINE.evaluate(agg, ['total_games'], {'first_game': 'x', 'ten_games': 'x'}) == ['fifty_games']
+    assert BADGE_ENGINE.evaluate(agg, ['total_games'] * 2, {}) == ['first_game', 'ten_games', 'fifty_games']
+
+def test_only_changed_keys_are_evaluated():
+    agg = aggregates(total=1, streak=3, memory=(1, 12))
+    assert BADGE_ENGINE.evaluate(agg, ['games.memory.best'], {}) == ['memory_10']
+    assert BADGE_ENGINE.evaluate(agg, ['games.memory.count'], {}) == []
+    assert set(BADGE_ENGINE.evaluate(agg, ['total_games', 'streak', 'unwatched.key'], {})) == {'first_game', 'streak_3'}
+
+def test_below_threshold_earns_nothing():
+    agg = aggregates(total=9, streak=2, stroop_test=(9, 99))
+    assert BADGE_ENGINE.evaluate(agg, ['total_games', 'streak', 'games.stroop_test.best'], {'first_game': 'x'}) == []
+
+def test_watched_keys_cover_every_rule():
+    assert BADGE_ENGINE.watched_keys() == {rule_key(rule)[0] for rule in BADGE_RULES}
+    engine = BadgeEngine([{'id': 'b', 'name': 'B', 'type': 'streak', 'days': 2}])
+    assert engine.watched_keys() == {'streak'}
+
+# ============================================================================
+# APP
+# ============================================================================
+
+def test_badges_are_awarded_after_the_roll_up(app_module, signup):
+    player, user_id = signup()
+    yesterday = datetime.now() - timedelta(days=1)
+    # Played yesterday and the day before, already rolled up
+    with app_module.aggregates_lock.write():
+        stored = app_module.load_aggregates()
+        stored[user_id] = {**aggregates(total=9, streak=2, stroop_test=(9, 90)),
+                           'last_played': yesterday.date().isoformat(), 'version': 9}
+        app_module.save_aggregates(stored)
+    app_module.publish_changes(f'scores:{user_id}')
+    app_module.invalidation_bus.sync()
+
+    app_module.add_score(user_id, 'stroop_test', 100, 'medium')
+    app_module.job_queue.run_pending()
+    earned = [badge['id'] for badge in player.get('/api/badges').json['badges']]
+    assert set(earned) == {'first_game', 'ten_games', 'stroop_test_100', 'streak_3'}
+
+    # Nothing new on the next score
+    app_module.add_score(user_id, 'stroop_test', 100, 'medium')
+    app_module.job_queue.run_pending()
+    assert len(player.get('/api/badges').json['badges']) == 4
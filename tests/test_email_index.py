@@ -0,0 +1,112 @@
+# Normalized email index: atomic claims and index-first user lookups
+
+import os
+import threading
+
+from email_index import EmailIndex, normalize_email
+
+def test_normalize():
+    assert normalize_email('  Bob@Example.COM ') == 'bob@example.com'
+    assert normalize_email(None) == ''
+
+def test_claim_keeps_the_first_owner(tmp_path):
+    index = EmailIndex(str(tmp_path / 'index.sqlite3'))
+    assert index.claim('Bob@example.com', 'Bob@example.com') == 'Bob@example.com'
+    assert index.claim('bob@EXAMPLE.com', 'bob@EXAMPLE.com') == 'Bob@example.com'
+    assert index.lookup('BOB@example.com') == 'Bob@example.com'
+    # release only drops the entry for its owner
+    index.release('bob@EXAMPLE.com')
+    assert index.lookup('bob@example.com') == 'Bob@example.com'
+    index.release('Bob@example.com')
+    assert index.lookup('bob@example.com') is None
+
+def test_one_claim_wins_across_threads_and_processes(tmp_path):
+    path = str(tmp_path / 'index.sqlite3')
+    EmailIndex(path)
+    spellings = ['race@example.com', 'Race@example.com', 'RACE@example.com', 'race@Example.com']
+    results = os.pipe()
+    start = tmp_path / 'go'
+
+    def claim_all(index):
+        # Each claimant has its own user id, as separate signups would
+        won = []
+        barrier = threading.Barrier(len(spellings))
+
+        def claim(email):
+            barrier.wait()
+            user_id = f'{os.getpid()}/{email}'
+            if index.claim(email, user_id) == user_id:
+                won.append(user_id)
+        threads = [threading.Thread(target=claim, args=(email,)) for email in spellings]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return won
+
+    children = []
+    for _ in range(3):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                while not start.exists():
+                    pass
+                won = claim_all(EmailIndex(path))
+                os.write(results[1], (','.join(won) + '\n').encode())
+            finally:
+                os._exit(0)
+        children.append(pid)
+    start.touch()
+    won = claim_all(EmailIndex(path))
+    for pid in children:
+        os.waitpid(pid, 0)
+    os.close(results[1])
+    with os.fdopen(results[0]) as f:
+        for line in f:
+            won += [user_id for user_id in line.strip().split(',') if user_id]
+    assert won == [EmailIndex(path).lookup('race@example.com')]
+
+def test_rebuild_reports_collisions(tmp_path):
+    index = EmailIndex(str(tmp_path / 'index.sqlite3'))
+    collisions = index.rebuild({
+        'Ann@example.com': {'created_at': '2025-02-01 00:00:00'},
+        'ann@example.com': {'created_at': '2025-01-01 00:00:00'},
+        'cy@example.com': {'created_at': '2025-01-01 00:00:00'},
+    })
+    assert collisions == {'ann@example.com': ['ann@example.com', 'Ann@example.com']}
+    assert index.lookup('ANN@example.com') == 'ann@example.com'
+
+# ============================================================================
+# find_user
+# ============================================================================
+
+def count_loads(app_module, monkeypatch):
+    loads = []
+    load_users = app_module.load_users
+    monkeypatch.setattr(app_module, 'load_users', lambda: loads.append(1) or load_users())
+    monkeypatch.setattr(app_module.user_directory, '_load', app_module.load_users)
+    return loads
+
+def test_find_user_ignores_case_with_one_read(app_module, signup, monkeypatch):
+    _, email = signup()
+    loads = count_loads(app_module, monkeypatch)
+    user_id, record = app_module.find_user(email.upper())
+    assert user_id == email and record['display_name'] == 'Test Player'
+    assert len(loads) <= 1
+
+def test_unknown_email_skips_the_user_store(app_module, monkeypatch):
+    loads = count_loads(app_module, monkeypatch)
+    assert app_module.find_user('nobody-at-all@example.com') == (None, None)
+    assert app_module.find_user('') == (None, None)
+    assert loads == []
+
+def test_case_collision_losers_keep_their_exact_id(app_module, signup):
+    _, winner = signup(email='Casey@example.com')
+    # An older account differing only in case, as left by imports before the index
+    with app_module.users_lock.write():
+        users = app_module.load_users()
+        users['casey@example.com'] = dict(users[winner], display_name='Loser')
+        app_module.save_users(users)
+    app_module.publish_changes('user:casey@example.com')
+    assert app_module.find_user('casey@example.com')[1]['display_name'] == 'Loser'
+    assert app_module.find_user('CASEY@example.com')[0] == winner
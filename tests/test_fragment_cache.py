@@ -0,0 +1,120 @@
+# Template fragment cache: the {% cache %} tag, its LRU, and the dashboard
+
+from jinja2 import DictLoader, Environment
+
+from fragment_cache import FragmentCache, FragmentCacheExtension
+
+# Blocks are told apart by template name and line
+TEMPLATES = {
+    'page.html': '{% cache key, version %}[{{ render() }}]{% endcache %}',
+    'other.html': '<{% cache key, version %}{{ render() }}{% endcache %}>',
+}
+
+def make_env(max_bytes=10_000):
+    env = Environment(loader=DictLoader(TEMPLATES), extensions=[FragmentCacheExtension])
+    env.fragment_cache = FragmentCache('test', max_bytes)
+    return env
+
+class Body:
+    """Counts renders of a block and returns what it should show"""
+
+    def __init__(self, text='body'):
+        self.text = text
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.text
+
+def render(env, key, version, body, template='page.html'):
+    return env.get_template(template).render(key=key, version=version, render=body)
+
+def test_hit_skips_the_body():
+    env, body = make_env(), Body()
+    assert render(env, 'a', 1, body) == '[body]'
+    body.text = 'changed'
+    assert render(env, 'a', 1, body) == '[body]'
+    assert body.calls == 1
+    assert (env.fragment_cache.hits, env.fragment_cache.misses) == (1, 1)
+
+def test_new_version_re_renders_and_replaces():
+    env, body = make_env(), Body('v1')
+    render(env, 'a', 1, body)
+    body.text = 'v2'
+    assert render(env, 'a', 2, body) == '[v2]'
+    assert len(env.fragment_cache) == 1
+    assert render(env, 'a', 2, body) == '[v2]' and body.calls == 2
+
+def test_keys_and_blocks_are_isolated():
+    env = make_env()
+    alice, bob = Body('alice'), Body('bob')
+    assert render(env, 'alice', 1, alice) == '[alice]'
+    assert render(env, 'bob', 1, bob) == '[bob]'
+    # Another template's block under the same key and version
+    assert render(env, 'alice', 1, Body('other'), 'other.html') == '<other>'
+    assert render(env, 'alice', 1, alice) == '[alice]' and alice.calls == 1
+
+def test_invalidate_drops_every_block_of_that_key_only():
+    env = make_env()
+    alice, alice_other, bob = Body('alice'), Body('alice2'), Body('bob')
+    render(env, 'alice', 1, alice)
+    render(env, 'alice', 1, alice_other, 'other.html')
+    render(env, 'bob', 1, bob)
+    env.fragment_cache.invalidate('alice')
+    render(env, 'alice', 1, alice)
+    render(env, 'alice', 1, alice_other, 'other.html')
+    render(env, 'bob', 1, bob)
+    assert (alice.calls, alice_other.calls, bob.calls) == (2, 2, 1)
+
+def test_render_racing_an_invalidation_is_not_stored():
+    cache = FragmentCache('test', 10_000)
+    html, token = cache.get('slot', 'a', 1)
+    cache.invalidate('b')
+    cache.put('slot', 'a', 1, 'stale', token)
+    assert cache.get('slot', 'a', 1)[0] is None
+
+def test_bypass_keeps_a_render_out():
+    env, body = make_env(), Body()
+    env.fragment_cache_bypass = lambda: True
+    render(env, 'a', 1, body)
+    render(env, 'a', 1, body)
+    assert body.calls == 2 and len(env.fragment_cache) == 0
+
+def test_least_recently_used_is_evicted_over_the_byte_bound():
+    text = 'x' * 1000
+    cache = FragmentCache('test', 2500)
+    for key in 'abc':
+        cache.put('slot', key, 1, text, cache.get('slot', key, 1)[1])
+        if key == 'b':
+            cache.get('slot', 'a', 1)  # a is now more recent than b
+    assert cache.size <= 2500 and cache.evictions == 1
+    assert cache.get('slot', 'b', 1)[0] is None
+    assert cache.get('slot', 'a', 1)[0] == text and cache.get('slot', 'c', 1)[0] == text
+
+def test_without_a_cache_the_body_always_renders():
+    env, body = Environment(loader=DictLoader(TEMPLATES), extensions=[FragmentCacheExtension]), Body()
+    render(env, 'a', 1, body)
+    render(env, 'a', 1, body)
+    assert body.calls == 2
+
+# ============================================================================
+# DASHBOARD
+# ============================================================================
+
+def test_dashboard_stats_follow_new_scores(app_module, signup):
+    client, user_id = signup()
+    best = b'color: var(--primary);">42</p>'
+    assert best not in client.get('/dashboard').data
+    hits = app_module.fragment_cache.hits
+    client.get('/dashboard')
+    assert app_module.fragment_cache.hits == hits + 1
+
+    # Shown once the score is saved, and still after its roll-up bumps the version
+    app_module.add_score(user_id, 'memory', 42, 'medium')
+    app_module.invalidation_bus.sync()
+    assert best in client.get('/dashboard').data
+    version = app_module.stats_version(user_id)
+    app_module.job_queue.run_pending()
+    app_module.invalidation_bus.sync()
+    assert app_module.stats_version(user_id) != version
+    assert best in client.get('/dashboard').data
@@ -0,0 +1,63 @@
+# Game pages: shared fingerprinted shells plus the per-player stats endpoint
+
+import pytest
+
+@pytest.mark.parametrize('game_type,path', [('memory', '/games/memory'), ('stroop_test', '/games/stroop-test')])
+def test_shell_is_the_same_for_every_visitor(app_module, signup, client, game_type, path):
+    player, _ = signup(display_name='Shell Player')
+    anonymous = client.get(path)
+    logged_in = player.get(path)
+    assert anonymous.status_code == logged_in.status_code == 200
+    assert anonymous.data == logged_in.data
+    assert b'Shell Player' not in logged_in.data
+    # Public responses never carry (or refresh) the session cookie
+    assert 'Set-Cookie' not in logged_in.headers
+    fingerprint = app_module.game_shell(game_type)[0]
+    assert logged_in.headers['ETag'] == f'"{fingerprint}"'
+    assert logged_in.headers['Cache-Control'] == 'public, no-cache'
+
+def test_plain_url_revalidates_against_the_fingerprint(client):
+    etag = client.get('/games/memory').headers['ETag']
+    resp = client.get('/games/memory', headers={'If-None-Match': etag})
+    assert resp.status_code == 304 and resp.data == b''
+    assert client.get('/games/memory', headers={'If-None-Match': '"old-deploy"'}).status_code == 200
+
+def test_fingerprinted_url_is_immutable(app_module, client):
+    with app_module.app.test_request_context():
+        url = app_module.game_url('tbi_memory')
+    fingerprint = app_module.game_shell('tbi_memory')[0]
+    assert url == f'/games/tbi-memory/{fingerprint}'
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert resp.data == client.get('/games/tbi-memory').data
+
+def test_old_fingerprint_redirects_to_the_current_shell(client):
+    resp = client.get('/games/problem-solving/0123456789abcdef')
+    assert resp.status_code == 302
+    assert resp.headers['Location'].endswith('/games/problem-solving')
+    assert client.get('/games/no-such-game/0123456789abcdef').status_code == 404
+
+def test_pages_link_to_fingerprinted_shells(app_module, signup):
+    player, _ = signup()
+    fingerprint = app_module.game_shell('memory')[0]
+    assert f'/games/memory/{fingerprint}'.encode() in player.get('/').data
+
+def test_stats_endpoint_is_per_player(app_module, signup, client):
+    player, user_id = signup(display_name='Stats Player')
+    app_module.add_score(user_id, 'memory', 9, 'medium')
+    app_module.invalidation_bus.sync()
+    resp = player.get('/api/stats/memory')
+    assert resp.json['best_score'] == 9 and resp.json['total_games'] == 1
+    assert resp.json['user']['display_name'] == 'Stats Player'
+    assert resp.headers['Cache-Control'] == 'private, no-cache'
+    assert player.get('/api/stats/memory', headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+    app_module.add_score(user_id, 'memory', 11, 'medium')
+    app_module.invalidation_bus.sync()
+    changed = player.get('/api/stats/memory', headers={'If-None-Match': resp.headers['ETag']})
+    assert changed.status_code == 200 and changed.json['best_score'] == 11
+
+    anonymous = client.get('/api/stats/memory').json
+    assert anonymous['user'] is None and anonymous['best_score'] == 0
+    assert client.get('/api/stats/chess').status_code == 404
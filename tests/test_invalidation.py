@@ -0,0 +1,105 @@
+# Cross-worker invalidation bus and the keyed cache it drives
+
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from conftest import ROOT
+from invalidation import ALL_KEYS, InvalidationBus, KeyedCache
+
+# ============================================================================
+# KEYED CACHE
+# ============================================================================
+
+def test_get_computes_once_then_hits():
+    cache = KeyedCache('t')
+    calls = []
+    assert cache.get('a', lambda: calls.append(1) or 'A') == 'A'
+    assert cache.get('a', lambda: calls.append(1) or 'B') == 'A'
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_value_computed_across_an_invalidation_is_not_stored():
+    cache = KeyedCache('t')
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'stale'
+
+    worker = threading.Thread(target=cache.get, args=('a', slow))
+    worker.start()
+    started.wait(5)
+    cache.invalidate('a')
+    release.set()
+    worker.join(5)
+    assert cache.peek('a') is None
+    assert cache.get('a', lambda: 'fresh') == 'fresh'
+
+def test_clear_during_compute_discards_the_value():
+    cache = KeyedCache('t')
+    assert cache.get('a', lambda: cache.clear() or 'stale') == 'stale'
+    assert cache.peek('a') is None
+
+def test_no_bookkeeping_outlives_a_computation():
+    cache = KeyedCache('t')
+    for i in range(100):
+        cache.get(i, lambda: i)
+        cache.invalidate(i)
+    with pytest.raises(ZeroDivisionError):
+        cache.get('boom', lambda: 1 / 0)
+    cache.invalidate('never-cached')
+    assert cache._pending == {}
+    assert len(cache) == 0
+
+def test_max_entries_evicts_least_recently_used():
+    cache = KeyedCache('t', max_entries=3)
+    for key in 'abc':
+        cache.get(key, lambda: key)
+    cache.get('a', lambda: 'unused')  # a is now the most recent
+    cache.get('d', lambda: 'd')
+    assert len(cache) == 3
+    assert cache.peek('b') is None
+    assert cache.peek('a') == 'a'
+    assert cache.evictions == 1
+
+# ============================================================================
+# BUS
+# ============================================================================
+
+def publish_from_other_process(path, *keys):
+    code = f"from invalidation import InvalidationBus; InvalidationBus({path!r}).publish(*{keys!r})"
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+
+@pytest.fixture
+def bus(tmp_path):
+    bus = InvalidationBus(str(tmp_path / 'bus.sqlite3'))
+    received = []
+    bus.subscribe(received.append)
+    bus.received = received
+    return bus
+
+def test_local_publish_dispatches_immediately(bus):
+    bus.publish('scores:a', 'user:a')
+    assert bus.received == [{'scores:a', 'user:a'}]
+    # and is not dispatched a second time when read back
+    assert bus.sync() == set()
+
+def test_sync_applies_other_processes_keys(bus):
+    assert bus.sync() == set()
+    publish_from_other_process(bus.path, 'scores:x', 'leaderboard:memory')
+    assert bus.sync() == {'scores:x', 'leaderboard:memory'}
+    assert bus.received == [{'scores:x', 'leaderboard:memory'}]
+    assert bus.sync() == set()
+
+def test_pruned_changes_dispatch_all_keys(bus):
+    publish_from_other_process(bus.path, 'scores:1')
+    publish_from_other_process(bus.path, 'scores:2')
+    # Rows this process never read are pruned away
+    with sqlite3.connect(bus.path) as conn:
+        conn.execute("DELETE FROM changes WHERE key = 'scores:1'")
+    assert bus.sync() == {'scores:2', ALL_KEYS}
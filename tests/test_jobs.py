@@ -0,0 +1,153 @@
+# Background jobs: retries with backoff, dead jobs, and the score roll-up
+
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+from jobs import JobQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), workers=0, max_attempts=3, base_backoff=0.0)
+
+def status(queue, job_id):
+    row = queue._connect().execute('SELECT status, attempts, last_error, run_at FROM jobs WHERE id = ?',
+                                   (job_id,)).fetchone()
+    return row and dict(zip(('status', 'attempts', 'last_error', 'run_at'), row))
+
+def flaky(queue, failures):
+    """Register a 'flaky' handler failing `failures` times; returns its calls"""
+    calls = []
+
+    @queue.register('flaky')
+    def handler(n):
+        calls.append(n)
+        if len(calls) <= failures:
+            raise RuntimeError(f'failure {len(calls)}')
+    return calls
+
+def test_done_jobs_are_deleted(queue):
+    calls = flaky(queue, 0)
+    job_id = queue.enqueue('flaky', {'n': 7})
+    assert queue.run_pending() == 1
+    assert calls == [7]
+    assert status(queue, job_id) is None
+    assert queue.counters()['succeeded'] == 1
+
+def test_failed_job_is_retried(queue):
+    calls = flaky(queue, 1)
+    job_id = queue.enqueue('flaky', {'n': 1})
+    assert queue.run_one()
+    row = status(queue, job_id)
+    assert row['status'] == 'pending' and row['attempts'] == 1
+    assert row['last_error'] == 'RuntimeError: failure 1'
+    assert queue.run_one()
+    assert status(queue, job_id) is None
+    assert calls == [1, 1]
+    assert queue.counters()['retried'] == 1
+
+def test_retry_backs_off_exponentially(queue):
+    queue.base_backoff = 10.0
+    flaky(queue, 10)
+    job_id = queue.enqueue('flaky', {'n': 1})
+    delays = []
+    for _ in range(2):
+        before = time.time()
+        queue.run_one()
+        delays.append(status(queue, job_id)['run_at'] - before)
+        # Not ready until the backoff has passed
+        assert not queue.run_one()
+        queue._connect().execute('UPDATE jobs SET run_at = 0 WHERE id = ?', (job_id,))
+    # Jittered into [0.5, 1] of 10s, then of 20s
+    assert 5 <= delays[0] <= 11
+    assert 10 <= delays[1] <= 21
+
+def test_backoff_is_capped(queue):
+    queue.base_backoff, queue.max_backoff = 1.0, 4.0
+    assert all(queue._backoff(attempts) <= 4.0 for attempts in range(1, 20))
+
+def test_job_is_dead_after_max_attempts(queue):
+    calls = flaky(queue, 10)
+    job_id = queue.enqueue('flaky', {'n': 1})
+    assert queue.run_pending() == 3
+    assert len(calls) == 3
+    row = status(queue, job_id)
+    assert row['status'] == 'dead' and row['attempts'] == 3
+    assert row['last_error'] == 'RuntimeError: failure 3'
+    assert queue.depth() == {'pending': 0, 'running': 0, 'dead': 1}
+    assert queue.counters() == {'enqueued': 1, 'succeeded': 0, 'retried': 2, 'dead': 1}
+    assert queue.run_pending() == 0
+
+def test_unknown_kind_is_retried_then_dead(queue):
+    job_id = queue.enqueue('nobody', {})
+    assert queue.run_pending() == 3
+    assert status(queue, job_id)['last_error'] == "LookupError: No handler registered for job kind 'nobody'"
+
+def test_stale_running_job_is_claimed_again(queue):
+    calls = flaky(queue, 0)
+    job_id = queue.enqueue('flaky', {'n': 1})
+    assert len(queue._claim()) == 1  # its worker dies here
+    assert not queue.run_one()
+    queue.stale_after = 0
+    assert queue.run_one()
+    assert calls == [1]
+    assert status(queue, job_id) is None
+
+def test_metrics_report_latency(queue):
+    flaky(queue, 0)
+    queue.enqueue('flaky', {'n': 1})
+    queue.run_pending()
+    metrics = queue.metrics()
+    assert metrics['counters']['succeeded'] == 1
+    assert metrics['run_time']['count'] == metrics['queue_wait']['count'] == 1
+
+# ============================================================================
+# SCORE ROLL-UP
+# ============================================================================
+
+def aggregates(app_module, user_id):
+    return app_module.load_aggregates().get(user_id)
+
+def test_score_roll_up_runs_in_the_background(app_module, signup):
+    _, user_id = signup()
+    app_module.add_score(user_id, 'memory', 12, 'medium')
+    assert aggregates(app_module, user_id) is None
+    assert app_module.get_user_badges(user_id) == []
+
+    app_module.job_queue.run_pending()
+    agg = aggregates(app_module, user_id)
+    assert agg['total_games'] == 1 and agg['games']['memory'] == {'count': 1, 'best': 12}
+    assert {badge['id'] for badge in app_module.get_user_badges(user_id)} == {'first_game', 'memory_10'}
+
+def test_roll_up_job_is_safe_to_re_run(app_module, signup):
+    _, user_id = signup()
+    app_module.add_score(user_id, 'memory', 3, 'medium')
+    app_module.job_queue.run_pending()
+    agg = aggregates(app_module, user_id)
+    score_id = agg['rolled_up'][-1]
+    app_module.roll_up_score(user_id, 'memory', 3, datetime.now().isoformat(), score_id)
+    assert aggregates(app_module, user_id) == agg
+
+def test_seeded_history_is_not_counted_twice(app_module, signup):
+    _, user_id = signup()
+    app_module.add_score(user_id, 'memory', 3, 'medium')
+    app_module.add_score(user_id, 'memory', 5, 'medium')
+    # The first score is from an earlier second than the second one
+    scores = app_module.load_scores()
+    scores[user_id]['memory'][0]['date'] = '2020-01-01 00:00:00'
+    app_module.save_scores(scores)
+    conn = app_module.job_queue._connect()
+    jobs = [(job_id, json.loads(payload)) for job_id, payload in conn.execute(
+        "SELECT id, payload FROM jobs WHERE kind = 'roll_up_score' ORDER BY id").fetchall()
+        if json.loads(payload)['user_id'] == user_id]
+    jobs[0][1]['played_at'] = datetime(2020, 1, 1).isoformat()
+
+    # Rolled up in reverse order: the later job seeds from the earlier score,
+    # so the earlier job must not count it again
+    for job_id, payload in reversed(jobs):
+        app_module.roll_up_score(**payload)
+        conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+    agg = aggregates(app_module, user_id)
+    assert agg['total_games'] == 2 and agg['games']['memory'] == {'count': 2, 'best': 5}
@@ -0,0 +1,24 @@
+# Cached leaderboards stay correct for every ?limit= served
+
+def board(client, game, limit):
+    resp = client.get(f'/api/leaderboards/{game}?limit={limit}')
+    assert resp.status_code == 200
+    return [entry['score'] for entry in resp.json['leaderboard']]
+
+def test_score_below_the_top_ten_updates_longer_boards(app_module, signup, client):
+    game = 'tbi_memory'
+    players = [signup()[1] for _ in range(17)]
+    for i, user_id in enumerate(players[:16]):
+        app_module.add_score(user_id, game, 1000 - i, 'medium')
+    top15 = board(client, game, 15)
+    assert top15[:15] == list(range(1000, 985, -1))
+    assert board(client, game, 10) == top15[:10]
+
+    # Beats #11-#15 but not #10
+    app_module.add_score(players[16], game, 989, 'medium')
+    assert board(client, game, 15) == [1000, 999, 998, 997, 996, 995, 994, 993, 992, 991, 990, 989, 989, 988, 987]
+    assert board(client, game, 10) == top15[:10]
+
+def test_limit_is_clamped(client):
+    assert len(board(client, 'memory', 1000)) <= 100
+    assert len(board(client, 'memory', -5)) <= 1
@@ -0,0 +1,33 @@
+# The live leaderboard stream is only served where it can't pin a worker
+
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+def gunicorn_env(worker_class):
+    """LEADERBOARD_STREAM as gunicorn.conf.py leaves it for a worker class"""
+    env = {k: v for k, v in os.environ.items() if k not in ('LEADERBOARD_STREAM', 'SSE_STREAM_SECONDS')}
+    env['GUNICORN_WORKER_CLASS'] = worker_class
+    code = ("import os, runpy; runpy.run_path('gunicorn.conf.py'); "
+            "print(os.environ['LEADERBOARD_STREAM'])")
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return out.stdout.strip()
+
+def test_stream_only_enabled_for_gevent():
+    assert gunicorn_env('gevent') == '1'
+    assert gunicorn_env('sync') == '0'
+    assert gunicorn_env('gthread') == '0'
+
+def test_disabled_stream_returns_204(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'LEADERBOARD_STREAM', False)
+    resp = client.get('/api/leaderboards/stream')
+    assert resp.status_code == 204
+    assert resp.data == b''
+
+def test_page_skips_event_source_when_disabled(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'LEADERBOARD_STREAM', False)
+    assert 'window.EventSource && false' in client.get('/leaderboards').get_data(as_text=True)
+    monkeypatch.setattr(app_module, 'LEADERBOARD_STREAM', True)
+    assert 'window.EventSource && true' in client.get('/leaderboards').get_data(as_text=True)
@@ -0,0 +1,193 @@
+# Reader/writer locks for the JSON stores, across threads and processes
+
+import os
+import threading
+import time
+
+import pytest
+
+from locking import ReadWriteLock, StoreLock
+
+def started(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+# ============================================================================
+# IN-PROCESS
+# ============================================================================
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(3, timeout=5)
+
+    def reader():
+        lock.acquire_read()
+        inside.wait()  # all three hold the read lock at once
+        lock.release_read()
+
+    threads = [started(reader) for _ in range(2)]
+    reader()
+    for thread in threads:
+        thread.join(5)
+
+def test_writer_excludes_readers():
+    lock = ReadWriteLock()
+    lock.acquire_write()
+    got = threading.Event()
+
+    def reader():
+        lock.acquire_read()
+        got.set()
+        lock.release_read()
+
+    thread = started(reader)
+    assert not got.wait(0.1)
+    lock.release_write()
+    assert got.wait(5)
+    thread.join(5)
+
+def test_waiting_writer_blocks_new_readers():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    order = []
+
+    def writer():
+        lock.acquire_write()
+        order.append('write')
+        lock.release_write()
+
+    def reader():
+        lock.acquire_read()
+        order.append('read')
+        lock.release_read()
+
+    w = started(writer)
+    while not lock._writers_waiting:
+        time.sleep(0.001)
+    r = started(reader)
+    time.sleep(0.05)
+    assert order == []
+    lock.release_read()
+    w.join(5)
+    r.join(5)
+    assert order == ['write', 'read']
+
+def test_reentrant():
+    lock = ReadWriteLock()
+    lock.acquire_write()
+    lock.acquire_write()
+    lock.acquire_read()
+    assert lock.owned()
+    lock.release_read()
+    lock.release_write()
+    lock.release_write()
+    assert not lock.owned()
+
+    # A reader can read again while a writer waits without deadlocking
+    lock.acquire_read()
+    w = started(lambda: (lock.acquire_write(), lock.release_write()))
+    while not lock._writers_waiting:
+        time.sleep(0.001)
+    lock.acquire_read()
+    lock.release_read()
+    lock.release_read()
+    w.join(5)
+    assert not w.is_alive()
+
+def test_upgrade_raises():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    with pytest.raises(RuntimeError):
+        lock.acquire_write()
+    lock.release_read()
+    lock.acquire_write()
+    lock.release_write()
+
+# ============================================================================
+# ACROSS PROCESSES
+# ============================================================================
+
+def bump(path, lock, times):
+    for _ in range(times):
+        with lock.write():
+            with open(path) as f:
+                value = int(f.read())
+            with lock.read():  # nested sections reuse the outer lock
+                pass
+            with open(path, 'w') as f:
+                f.write(str(value + 1))
+
+def test_writes_are_serialized_across_processes_and_threads(tmp_path):
+    path = str(tmp_path / 'counter')
+    with open(path, 'w') as f:
+        f.write('0')
+    lock = StoreLock(path)
+
+    def worker():
+        threads = [started(lambda: bump(path, lock, 50)) for _ in range(4)]
+        for thread in threads:
+            thread.join(30)
+
+    children = []
+    for _ in range(3):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                worker()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    worker()
+    for pid in children:
+        os.waitpid(pid, 0)
+    with open(path) as f:
+        assert int(f.read()) == 4 * 4 * 50
+
+def hold_in_child(lock, mode):
+    """Fork a child that holds the lock in `mode` until told to let go"""
+    ready_r, ready_w = os.pipe()
+    done_r, done_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        with getattr(lock, mode)():
+            os.write(ready_w, b'x')
+            os.read(done_r, 1)
+        os._exit(0)
+    os.read(ready_r, 1)
+
+    def let_go():
+        os.write(done_w, b'x')
+        os.waitpid(pid, 0)
+        for fd in (ready_r, ready_w, done_r, done_w):
+            os.close(fd)
+    return let_go
+
+def test_other_process_writer_blocks(tmp_path):
+    lock = StoreLock(str(tmp_path / 'store.json'))
+    let_go = hold_in_child(lock, 'write')
+    got = threading.Event()
+
+    def reader():
+        with lock.read():
+            got.set()
+
+    thread = started(reader)
+    assert not got.wait(0.1)
+    let_go()
+    assert got.wait(5)
+    thread.join(5)
+
+def test_other_process_readers_share(tmp_path):
+    lock = StoreLock(str(tmp_path / 'store.json'))
+    let_go = hold_in_child(lock, 'read')
+    got = threading.Event()
+
+    def reader():
+        with lock.read():
+            got.set()
+
+    thread = started(reader)
+    assert got.wait(5)
+    thread.join(5)
+    let_go()
@@ -0,0 +1,98 @@
+# Prometheus metrics: text exposition, and merging per-process files
+
+import json
+import os
+import subprocess
+import sys
+
+from metrics import Metrics
+
+def lines(text):
+    return text.splitlines()
+
+def test_counter_and_gauge_exposition():
+    metrics = Metrics()
+    requests = metrics.counter('app_requests_total', 'Requests', ('route', 'status'))
+    inflight = metrics.gauge('app_inflight', 'In flight')
+    requests.inc('/a', '200')
+    requests.inc('/a', '200', amount=2)
+    requests.inc('/b "quoted"\n', '500')
+    inflight.inc()
+    inflight.dec(amount=0.5)
+    assert lines(metrics.render()) == [
+        '# HELP app_requests_total Requests',
+        '# TYPE app_requests_total counter',
+        'app_requests_total{route="/a",status="200"} 3',
+        'app_requests_total{route="/b \\"quoted\\"\\n",status="500"} 1',
+        '# HELP app_inflight In flight',
+        '# TYPE app_inflight gauge',
+        'app_inflight 0.5',
+    ]
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    latency = metrics.histogram('app_seconds', 'Latency', ('op',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, 'load')
+    assert lines(metrics.render())[2:] == [
+        'app_seconds_bucket{op="load",le="0.1"} 2',
+        'app_seconds_bucket{op="load",le="1"} 3',
+        'app_seconds_bucket{op="load",le="+Inf"} 4',
+        'app_seconds_sum{op="load"} 3.65',
+        'app_seconds_count{op="load"} 4',
+    ]
+
+def test_callback_is_read_at_render_time():
+    metrics = Metrics()
+    hits = {'stats': 1}
+    metrics.callback('app_cache_hits_total', 'Hits', 'counter', ('cache',),
+                     lambda: {(name,): n for name, n in hits.items()})
+    hits['stats'] = 7
+    assert 'app_cache_hits_total{cache="stats"} 7' in lines(metrics.render())
+
+def exited_pid():
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+def write_process_file(directory, pid, values):
+    with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+        json.dump({name: [[list(k), v] for k, v in samples.items()] for name, samples in values.items()}, f)
+
+def test_processes_are_merged(tmp_path):
+    directory = str(tmp_path)
+    metrics = Metrics(directory)
+    requests = metrics.counter('app_requests_total', 'Requests', ('route',))
+    inflight = metrics.gauge('app_inflight', 'In flight')
+    latency = metrics.histogram('app_seconds', 'Latency', buckets=(1.0,))
+    requests.inc('/a')
+    inflight.inc()
+    latency.observe(0.5)
+
+    # A live sibling worker and one that has exited
+    write_process_file(directory, os.getppid(), {'app_requests_total': {('/a',): 2}, 'app_inflight': {(): 4},
+                                                 'app_seconds': {(): [[1, 0], 0.25]}})
+    dead = exited_pid()
+    write_process_file(directory, dead, {'app_requests_total': {('/a',): 10, ('/b',): 1}, 'app_inflight': {(): 100}})
+
+    rendered = lines(metrics.render())
+    assert 'app_requests_total{route="/a"} 13' in rendered
+    assert 'app_requests_total{route="/b"} 1' in rendered
+    # Gauges only count live processes
+    assert 'app_inflight 5' in rendered
+    assert 'app_seconds_count 2' in rendered and 'app_seconds_sum 0.75' in rendered
+
+    # The dead worker's counters live on in the archive
+    assert not os.path.exists(os.path.join(directory, f'{dead}.json'))
+    assert os.path.exists(os.path.join(directory, 'archive.json'))
+    assert lines(metrics.render()) == rendered
+
+def test_metrics_endpoint(app_module, client):
+    assert client.get('/metrics').status_code == 401
+    client.get('/leaderboards')
+    resp = client.get('/metrics', headers={'Authorization': 'Bearer test-metrics-token'})
+    assert resp.status_code == 200 and resp.mimetype == 'text/plain'
+    text = resp.get_data(as_text=True)
+    assert '# TYPE brain_games_requests_total counter' in text
+    assert 'brain_games_requests_total{route="/leaderboards",method="GET",status="200"}' in text
+    assert 'brain_games_request_duration_seconds_bucket{route="/leaderboards",method="GET",le="+Inf"}' in text
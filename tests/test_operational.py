@@ -0,0 +1,35 @@
+# Operational endpoints are for admins and the metrics scraper only
+
+import pytest
+
+from conftest import PASSWORD
+
+ENDPOINTS = ['/api/jobs/metrics', '/api/outbox/metrics']
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+def test_anonymous_gets_404(client, path):
+    assert client.get(path).status_code == 404
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+def test_signed_in_player_gets_404(signup, path):
+    player, _ = signup()
+    assert player.get(path).status_code == 404
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+def test_wrong_token_gets_404(client, path):
+    assert client.get(path, headers={'Authorization': 'Bearer nope'}).status_code == 404
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+def test_metrics_token_is_accepted(client, path):
+    resp = client.get(path, headers={'Authorization': 'Bearer test-metrics-token'})
+    assert resp.status_code == 200
+    assert resp.is_json
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+def test_admin_is_accepted(app_module, path):
+    admin = app_module.app.test_client()
+    if not app_module.find_user('admin@example.com')[0]:
+        admin.post('/signup', data={'email': 'admin@example.com', 'password': PASSWORD, 'display_name': 'Admin'})
+    else:
+        admin.post('/login', data={'email': 'admin@example.com', 'password': PASSWORD})
+    assert admin.get(path).status_code == 200
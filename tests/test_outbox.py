@@ -0,0 +1,100 @@
+# Email outbox: delivery, retries with backoff and dead-lettering
+
+import time
+
+import pytest
+
+from outbox import EmailOutbox, PermanentError
+
+class FakeTransport:
+    name = 'fake'
+
+    def __init__(self):
+        self.results = {}  # recipient -> list of outcomes, consumed in order
+        self.sent = []
+
+    def send_batch(self, messages):
+        results = []
+        for message in messages:
+            outcomes = self.results.get(message['recipient']) or [None]
+            outcome = outcomes.pop(0) if len(outcomes) > 1 else outcomes[0]
+            if outcome is None:
+                self.sent.append(message['recipient'])
+            results.append(outcome)
+        return results
+
+@pytest.fixture
+def transport():
+    return FakeTransport()
+
+@pytest.fixture
+def outbox(tmp_path, transport):
+    return EmailOutbox(str(tmp_path / 'outbox.sqlite3'), transport, senders=0, max_attempts=3, base_backoff=0.0)
+
+def status(outbox, message_id):
+    row = outbox._connect().execute('SELECT status, attempts, last_error, run_at FROM outbox WHERE id = ?',
+                                    (message_id,)).fetchone()
+    return row and dict(zip(('status', 'attempts', 'last_error', 'run_at'), row))
+
+def test_sent_messages_are_deleted(outbox, transport):
+    message_id = outbox.enqueue('test', 'a@example.com', 'Hi', 'body')
+    assert outbox.send_pending() == 1
+    assert transport.sent == ['a@example.com']
+    assert status(outbox, message_id) is None
+    assert outbox.counters()['sent'] == 1
+
+def test_transient_failure_is_retried_then_sent(outbox, transport):
+    transport.results['a@example.com'] = [OSError('down'), None]
+    message_id = outbox.enqueue('test', 'a@example.com', 'Hi', 'body')
+    assert outbox.send_one_batch() == 1
+    row = status(outbox, message_id)
+    assert row['status'] == 'pending' and row['attempts'] == 1
+    assert 'OSError: down' in row['last_error']
+    assert outbox.send_one_batch() == 1
+    assert status(outbox, message_id) is None
+    assert outbox.counters()['retried'] == 1
+
+def test_backoff_delays_the_retry(tmp_path, transport):
+    outbox = EmailOutbox(str(tmp_path / 'o.sqlite3'), transport, senders=0, base_backoff=60.0)
+    transport.results['a@example.com'] = [OSError('down'), None]
+    message_id = outbox.enqueue('test', 'a@example.com', 'Hi', 'body')
+    before = time.time()
+    outbox.send_one_batch()
+    assert status(outbox, message_id)['run_at'] >= before + 30
+    assert outbox.send_one_batch() == 0
+
+def test_dead_after_max_attempts(outbox, transport):
+    transport.results['a@example.com'] = [OSError('down')]
+    message_id = outbox.enqueue('test', 'a@example.com', 'Hi', 'body')
+    assert outbox.send_pending() == 3
+    row = status(outbox, message_id)
+    assert row['status'] == 'dead' and row['attempts'] == 3
+    assert outbox.depth() == {'pending': 0, 'sending': 0, 'dead': 1}
+    assert outbox.send_pending() == 0
+
+def test_permanent_error_is_dead_at_once(outbox, transport):
+    transport.results['bad@example.com'] = [PermanentError('no such mailbox')]
+    bad = outbox.enqueue('test', 'bad@example.com', 'Hi', 'body')
+    good = outbox.enqueue('test', 'good@example.com', 'Hi', 'body')
+    assert outbox.send_one_batch() == 2
+    assert status(outbox, bad)['status'] == 'dead'
+    assert status(outbox, good) is None
+    assert transport.sent == ['good@example.com']
+
+def test_transport_crash_retries_the_whole_batch(outbox, transport):
+    def crash(messages):
+        raise ConnectionError('refused')
+    transport.send_batch = crash
+    ids = [outbox.enqueue('test', f'{i}@example.com', 'Hi', 'body') for i in range(3)]
+    assert outbox.send_one_batch() == 3
+    assert {status(outbox, i)['status'] for i in ids} == {'pending'}
+
+def test_stale_sending_is_reclaimed(tmp_path, transport):
+    outbox = EmailOutbox(str(tmp_path / 'o.sqlite3'), transport, senders=0, stale_after=0.0)
+    message_id = outbox.enqueue('test', 'a@example.com', 'Hi', 'body')
+    # A sender died after claiming the message
+    assert len(outbox._claim()) == 1
+    assert status(outbox, message_id)['status'] == 'sending'
+    time.sleep(0.01)
+    assert outbox.send_one_batch() == 1
+    assert status(outbox, message_id) is None
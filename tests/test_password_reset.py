@@ -0,0 +1,57 @@
+# Forgot-password: where the link points, and how often it can be sent
+
+import sqlite3
+
+import pytest
+
+def reset_emails(app_module, recipient):
+    with sqlite3.connect(app_module.OUTBOX_DB) as conn:
+        rows = conn.execute("SELECT text_body FROM outbox WHERE kind = 'reset_password' AND recipient = ?",
+                            (recipient,)).fetchall()
+    return [row[0] for row in rows]
+
+@pytest.fixture
+def request_reset(app_module):
+    addresses = iter(range(1, 250))
+
+    def request_reset(email, remote_addr=None, **headers):
+        client = app_module.app.test_client()
+        remote_addr = remote_addr or f'10.0.0.{next(addresses)}'
+        return client.post('/forgot-password', data={'email': email}, headers=headers,
+                           environ_base={'REMOTE_ADDR': remote_addr})
+    return request_reset
+
+def test_link_uses_public_base_url_not_host(app_module, signup, request_reset, monkeypatch):
+    monkeypatch.setattr(app_module, 'PUBLIC_BASE_URL', 'https://braingames.example')
+    _, email = signup()
+    resp = request_reset(email, Host='evil.example')
+    assert resp.status_code == 200
+    [body] = reset_emails(app_module, email)
+    assert 'https://braingames.example/reset-password/' in body
+    assert 'evil.example' not in body
+
+def test_no_email_without_a_public_address(app_module, signup, request_reset, monkeypatch):
+    monkeypatch.setattr(app_module, 'PUBLIC_BASE_URL', '')
+    _, email = signup()
+    resp = request_reset(email, Host='evil.example')
+    assert resp.status_code == 200
+    assert reset_emails(app_module, email) == []
+
+def test_limited_per_email(app_module, signup, request_reset, monkeypatch):
+    monkeypatch.setattr(app_module, 'PUBLIC_BASE_URL', 'https://braingames.example')
+    _, email = signup()
+    limit = int(app_module.RESET_EMAILS_PER_HOUR)
+    for _ in range(limit):
+        assert request_reset(email).status_code == 200
+    # A different address, and a differently written email, are still limited
+    resp = request_reset(email.upper())
+    assert resp.status_code == 429
+    assert int(resp.headers['Retry-After']) > 0
+    assert len(reset_emails(app_module, email)) == limit
+
+def test_limited_per_client_address(app_module, request_reset):
+    limit = int(app_module.RESET_REQUESTS_PER_HOUR_PER_IP)
+    for i in range(limit):
+        assert request_reset(f'nobody{i}@example.com', remote_addr='10.1.1.1').status_code == 200
+    assert request_reset('nobody-else@example.com', remote_addr='10.1.1.1').status_code == 429
+    assert request_reset('nobody-else@example.com', remote_addr='10.1.1.2').status_code == 200
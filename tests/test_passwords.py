@@ -0,0 +1,120 @@
+# Password hashing: scrypt format, legacy upgrades, the bounded gevent pool
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PASSWORD, ROOT
+from passwords import PasswordHasher
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(n=1024, workers=0)
+    stored = hasher.hash('hunter22')
+    assert stored.startswith('scrypt$1024$8$1$')
+    assert hasher.verify('hunter22', stored) == (True, False)
+    assert hasher.verify('hunter23', stored) == (False, False)
+    assert hasher.hash('hunter22') != stored  # salted
+    # Other cost parameters still verify, and ask for a rehash
+    assert PasswordHasher(n=2048, workers=0).verify('hunter22', stored) == (True, True)
+    assert hasher.verify('x', '') == (False, False)
+    assert hasher.verify('x', 'bcrypt$1$2$3$4$5') == (False, False)
+
+def test_process_pool():
+    hasher = PasswordHasher(n=1024, workers=1)
+    stored = hasher.hash('pooled')
+    assert hasher.verify('pooled', stored) == (True, False)
+
+GEVENT_SCRIPT = '''
+from gevent import monkey
+monkey.patch_all()
+import json, os, threading
+import gevent
+import passwords
+
+real_sleep = monkey.get_original('time', 'sleep')
+lock = monkey.get_original('_thread', 'allocate_lock')()
+state = {'now': 0, 'max': 0, 'nice': set()}
+derive = passwords._derive
+
+def slow(*args):
+    with lock:
+        state['now'] += 1
+        state['max'] = max(state['max'], state['now'])
+        state['nice'].add(os.getpriority(os.PRIO_PROCESS, threading.get_native_id()))
+    real_sleep(0.05)
+    with lock:
+        state['now'] -= 1
+    return derive(*args)
+
+passwords._derive = slow
+hasher = passwords.PasswordHasher(n=1024, workers=2, niceness=5)
+ticks = [0]
+
+def tick():
+    while True:
+        ticks[0] += 1
+        gevent.sleep(0.005)
+
+gevent.spawn(tick)
+jobs = [gevent.spawn(hasher.hash, f'pw{i}') for i in range(8)]
+gevent.joinall(jobs)
+print(json.dumps({'max': state['max'], 'nice': sorted(state['nice']), 'base': os.getpriority(os.PRIO_PROCESS, 0),
+                  'ticks': ticks[0], 'ok': all(hasher.verify(f'pw{i}', job.value)[0] for i, job in enumerate(jobs))}))
+'''
+
+def test_gevent_hashing_is_bounded_and_niced():
+    pytest.importorskip('gevent')
+    out = subprocess.run([sys.executable, '-c', GEVENT_SCRIPT], cwd=ROOT, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    assert result['ok']
+    assert result['max'] == 2  # PASSWORD_HASH_WORKERS, not the hub's pool size
+    assert all(nice >= result['base'] + 5 for nice in result['nice'])
+    # Greenlets kept running while hashes were in flight (8 x 50 ms on 2 threads)
+    assert result['ticks'] >= 20
+
+# ============================================================================
+# UPGRADES IN THE APP
+# ============================================================================
+
+def stored_hash(app_module, user_id):
+    return app_module.load_users()[user_id]['password']
+
+def set_hash(app_module, user_id, stored):
+    with app_module.users_lock.write():
+        users = app_module.load_users()
+        users[user_id]['password'] = stored
+        app_module.save_users(users)
+    app_module.publish_changes(f'user:{user_id}')
+
+def test_legacy_sha256_is_upgraded_at_login(app_module, signup):
+    import hashlib
+    _, email = signup()
+    set_hash(app_module, email, hashlib.sha256(PASSWORD.encode()).hexdigest())
+
+    client = app_module.app.test_client()
+    resp = client.post('/login', data={'email': email, 'password': 'wrong'})
+    assert len(stored_hash(app_module, email)) == 64
+    resp = client.post('/login', data={'email': email, 'password': PASSWORD})
+    assert resp.status_code == 302
+    upgraded = stored_hash(app_module, email)
+    assert upgraded.startswith('scrypt$')
+    assert app_module.check_password(PASSWORD, upgraded) == (True, False)
+    # And the upgraded hash logs in too
+    assert app_module.app.test_client().post('/login', data={'email': email, 'password': PASSWORD}).status_code == 302
+
+def test_change_password(app_module, signup):
+    client, email = signup()
+    before = stored_hash(app_module, email)
+    resp = client.post('/api/change-password', json={'current_password': 'nope', 'new_password': 'newpass1'})
+    assert resp.json['success'] is False
+    assert stored_hash(app_module, email) == before
+    resp = client.post('/api/change-password', json={'current_password': PASSWORD, 'new_password': 'newpass1'})
+    assert resp.json['success'] is True
+    after = stored_hash(app_module, email)
+    assert after.startswith('scrypt$') and after != before
+    fresh = app_module.app.test_client()
+    assert fresh.post('/login', data={'email': email, 'password': PASSWORD}).status_code != 302
+    assert fresh.post('/login', data={'email': email, 'password': 'newpass1'}).status_code == 302
@@ -0,0 +1,112 @@
+# Preloaded read-mostly stores: shared base, per-key refresh, full reloads
+
+import threading
+
+from preload import PreloadedStore
+
+class Source:
+    def __init__(self, data):
+        self.data = data
+        self.loads = 0
+        self.during_load = None
+
+    def __call__(self):
+        self.loads += 1
+        snapshot = {key: dict(value) for key, value in self.data.items()}
+        if self.during_load:
+            hook, self.during_load = self.during_load, None
+            hook()
+        return snapshot
+
+def make(data=None, enabled=True):
+    source = Source(data if data is not None else {'a': {'n': 1}, 'b': {'n': 2}})
+    store = PreloadedStore('test', source, enabled=enabled)
+    store.preload()
+    return store, source
+
+def test_reads_come_from_the_preloaded_copy():
+    store, source = make()
+    assert store.get('a') == {'n': 1} and 'b' in store and 'c' not in store
+    assert store.get('c', 'missing') == 'missing'
+    assert source.loads == 1
+
+def test_invalidated_keys_are_reloaded_once_into_the_delta():
+    store, source = make()
+    source.data['a'] = {'n': 10}
+    source.data['c'] = {'n': 3}
+    del source.data['b']
+    for key in ('a', 'b', 'c'):
+        store.invalidate(key)
+    assert store.get('a') == {'n': 10}
+    assert store.get('b') is None and 'b' not in store
+    assert store.get('c') == {'n': 3}
+    assert source.loads == 2 and store.reloads == 1
+    assert store.delta_size == 3
+
+def test_uninvalidated_keys_keep_the_preloaded_value():
+    store, source = make()
+    source.data['b'] = {'n': 20}
+    store.invalidate('a')
+    assert store.get('b') == {'n': 2}
+
+def test_invalidate_all_reloads_everything():
+    store, source = make()
+    source.data['b'] = {'n': 20}
+    store.invalidate_all()
+    assert store.get('b') == {'n': 20}
+    assert store.delta_size == 0
+
+def test_invalidate_all_during_a_refresh():
+    store, source = make()
+    store.invalidate('a')
+    source.data['a'] = {'n': 10}
+    # The bus thread drops everything while this read is re-parsing the file
+    source.during_load = store.invalidate_all
+    assert store.get('b') == {'n': 2}
+    assert store.get('a') == {'n': 10}
+
+def test_concurrent_reads_and_invalidations():
+    store, source = make({str(i): {'n': i} for i in range(50)})
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        try:
+            while not stop.is_set():
+                for i in range(50):
+                    assert store.get(str(i)) == {'n': i}
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for i in range(300):
+        store.invalidate(str(i % 50)) if i % 3 else store.invalidate_all()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert errors == []
+
+def test_disabled_store_reads_the_file_each_time():
+    store, source = make(enabled=False)
+    assert source.loads == 0
+    source.data['a'] = {'n': 5}
+    assert store.get('a') == {'n': 5}
+    assert store.get('b') == {'n': 2}
+    assert source.loads == 2
+
+def test_app_user_directory_follows_profile_edits(app_module, signup, monkeypatch):
+    """PRELOAD_DATA mode: bus invalidations reach the preloaded user directory"""
+    client, email = signup(display_name='Before Edit')
+    store = PreloadedStore('users', app_module.load_users)
+    store.preload()
+    monkeypatch.setattr(app_module, 'user_directory', store)
+    monkeypatch.setattr(app_module, 'PRELOAD_DATA', True)
+    assert store.get(email)['display_name'] == 'Before Edit'
+    assert client.post('/api/update-profile', json={'display_name': 'After Edit'}).json['success']
+    app_module.invalidation_bus.sync()
+    assert store.get(email)['display_name'] == 'After Edit'
+    assert store.delta_size >= 1
+    assert app_module.find_user(email.upper())[1]['display_name'] == 'After Edit'
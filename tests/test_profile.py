@@ -0,0 +1,77 @@
+# Display names and public profiles: length limits, what reaches the session
+# cookie, per-fragment invalidation and conditional requests
+
+def test_signup_rejects_long_display_name(app_module, client):
+    name = 'x' * (app_module.DISPLAY_NAME_MAX_LENGTH + 1)
+    resp = client.post('/signup', data={'email': 'long-name@example.com', 'password': 'password1',
+                                        'display_name': name})
+    assert resp.status_code == 200
+    assert b'at most' in resp.data
+    assert app_module.find_user('long-name@example.com')[0] is None
+
+def test_update_profile_limits(app_module, signup):
+    client, email = signup()
+    longest = 'y' * app_module.DISPLAY_NAME_MAX_LENGTH
+    assert client.post('/api/update-profile', json={'display_name': longest + 'y'}).json['success'] is False
+    assert client.post('/api/update-profile', json={'display_name': 'y'}).json['success'] is False
+    assert client.post('/api/update-profile', json={'display_name': longest}).json['success'] is True
+    assert app_module.user_directory.get(email)['display_name'] == longest
+
+def test_session_snapshot_caps_legacy_names(app_module, signup):
+    client, email = signup()
+    # Saved before the limit existed
+    with app_module.users_lock.write():
+        users = app_module.load_users()
+        users[email]['display_name'] = 'z' * 5000
+        app_module.save_users(users)
+    app_module.publish_changes(f'user:{email}')
+    app_module.bump_user_version(email)
+    resp = client.get('/dashboard')
+    assert resp.status_code == 200
+    with client.session_transaction() as session:
+        assert session['user_snapshot']['name'] == 'z' * app_module.DISPLAY_NAME_MAX_LENGTH
+    cookie = resp.headers.get('Set-Cookie', '')
+    assert len(cookie) < 1024
+
+def test_public_profile_renders_and_fragments_are_bounded(app_module, signup, client):
+    _, email = signup(display_name='Pat Public')
+    resp = client.get(f'/profile/{app_module.user_search.public_id(email)}')
+    assert resp.status_code == 200 and b'Pat Public' in resp.data
+    assert client.get('/profile/not-a-player').status_code == 404
+    assert app_module.profile_fragments.max_entries
+
+def profile_url(app_module, email):
+    return f'/profile/{app_module.user_search.public_id(email)}'
+
+def test_name_change_re_renders_only_that_header(app_module, signup, client):
+    renamed, email = signup(display_name='Old Name')
+    _, other = signup(display_name='Other Player')
+    for user_id in (email, other):
+        assert client.get(profile_url(app_module, user_id)).status_code == 200
+    fragments = app_module.profile_fragments
+    assert fragments.peek((email, 'header')) is not None
+
+    assert renamed.post('/api/update-profile', json={'display_name': 'New Name'}).json['success'] is True
+    app_module.invalidation_bus.sync()
+    assert fragments.peek((email, 'header')) is None
+    assert fragments.peek((other, 'header')) is not None
+    for name in ('stats', 'recent', 'badges'):
+        assert fragments.peek((email, name)) is not None
+
+    resp = client.get(profile_url(app_module, email))
+    assert b'New Name' in resp.data and b'Old Name' not in resp.data
+
+def test_unchanged_profile_is_not_modified(app_module, signup, client):
+    renamed, email = signup(display_name='Etag Player')
+    first = client.get(profile_url(app_module, email))
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    again = client.get(profile_url(app_module, email), headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+    assert again.headers['ETag'] == etag
+
+    renamed.post('/api/update-profile', json={'display_name': 'Renamed Player'})
+    changed = client.get(profile_url(app_module, email), headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and b'Renamed Player' in changed.data
+    assert changed.headers['ETag'] != etag
@@ -0,0 +1,38 @@
+# Request profiles are saved by route, so URL secrets never reach disk
+
+import os
+
+from profiling import RequestProfiler
+
+def test_profiles_record_the_route_not_the_path(app_module, client, monkeypatch, tmp_path):
+    profiler = RequestProfiler(str(tmp_path), sample_rate=1.0)
+    monkeypatch.setattr(app_module, 'request_profiler', profiler)
+    token = 'live-reset-token-0123456789'
+    client.get(f'/reset-password/{token}')
+    client.get('/no/such/page')
+
+    saved = profiler.list()
+    assert sorted(result['route'] for _, result in saved) == ['/reset-password/<token>', 'unmatched']
+    for name in os.listdir(tmp_path):
+        assert token not in name
+        with open(tmp_path / name) as f:
+            assert token not in f.read()
+    _, result = next(item for item in saved if item[1]['route'] != 'unmatched')
+    assert result['method'] == 'GET' and result['status'] == 400
+    assert result['reason'] == 'sampled' and result['functions']
+
+def test_slow_requests_are_saved_with_stacks(tmp_path):
+    import time
+    profiler = RequestProfiler(str(tmp_path), slow_ms=20, sample_interval=0.002)
+    profiler.begin('GET', '/slow/<thing>')
+    profiler.record_storage('users', 'load', 0.01, 1234)
+    time.sleep(0.08)
+    profiler.end(200, 'someone@example.com')
+    profiler.begin('GET', '/fast')
+    profiler.end(200)
+    [(name, result)] = profiler.list()
+    assert name.endswith('-slow_thing.json')
+    assert result['reason'] == 'slow' and result['duration_ms'] >= 80
+    assert result['storage'] == {'users.load': {'calls': 1, 'ms': 10.0, 'bytes': 1234}}
+    assert result['stacks'] and 'test_slow_requests_are_saved_with_stacks' in result['stacks'][0]['stack']
+    assert profiler.load('../etc/passwd') is None
@@ -0,0 +1,113 @@
+# Write admission: token buckets and the per-pid in-flight slots
+
+import os
+
+import pytest
+
+from ratelimit import PROCESS_SLOTS, WriteAdmission, reset
+
+@pytest.fixture
+def make(tmp_path):
+    def make(**kwargs):
+        options = dict(user_burst=1000, global_burst=100000, global_rate=0.0, max_inflight=1000)
+        options.update(kwargs)
+        return WriteAdmission(str(tmp_path / 'ratelimit'), **options)
+    return make
+
+def in_child(fn):
+    """Run fn in a forked process and return its exit status"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(fn())
+        except BaseException:
+            os._exit(99)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+def test_user_burst_then_429(make):
+    admission = make(user_burst=3, user_rate=0.001)
+    for _ in range(3):
+        assert admission.admit('a') == (None, 0)
+        admission.release()
+    status, retry_after = admission.admit('a')
+    assert status == 429 and retry_after > 0
+    # Other users have their own bucket
+    assert admission.admit('b') == (None, 0)
+    admission.release()
+
+def test_global_bucket_is_shared(make):
+    admission = make(global_burst=2, global_rate=0.001)
+    for user in ('a', 'b'):
+        assert admission.admit(user) == (None, 0)
+        admission.release()
+    assert admission.admit('c')[0] == 429
+
+def test_max_inflight_then_503(make):
+    admission = make(max_inflight=2)
+    assert admission.admit('a') == (None, 0)
+    assert admission.admit('b') == (None, 0)
+    assert admission.admit('c')[0] == 503
+    admission.release()
+    assert admission.admit('c') == (None, 0)
+
+def test_more_pids_than_slots_do_not_exhaust_the_table(make):
+    admission = make()
+
+    def write_once():
+        status, _ = admission.admit(f'user-{os.getpid()}')
+        if status:
+            return status % 256
+        admission.release()
+        return 0
+
+    # Every finished pid gives its slot back, so pids beyond the table size
+    # (worker restarts over a deployment's life) are still admitted
+    for _ in range(PROCESS_SLOTS + 8):
+        assert in_child(write_once) == 0
+    assert admission.admit('parent') == (None, 0)
+    admission.release()
+
+def test_slots_of_dead_pids_are_reclaimed(make):
+    admission = make()
+
+    def crash_mid_write():
+        status, _ = admission.admit(f'user-{os.getpid()}')
+        return status % 256 if status else 0
+
+    # Workers killed mid-write leave their slots held; with the table full,
+    # the next writer prunes them instead of getting 503 forever
+    for _ in range(PROCESS_SLOTS):
+        assert in_child(crash_mid_write) == 0
+    assert admission.admit('parent') == (None, 0)
+    admission.release()
+    total, _ = admission._inflight(admission._map())
+    assert total == 0
+
+def test_reset_clears_state(make, tmp_path):
+    admission = make(user_burst=1, user_rate=0.001)
+    assert in_child(lambda: 0 if admission.admit('a') == (None, 0) else 1) == 0
+    reset(str(tmp_path / 'ratelimit'))
+    reset(str(tmp_path / 'ratelimit'))
+    assert admission.admit('a') == (None, 0)
+
+# ============================================================================
+# write_limited
+# ============================================================================
+
+WRITES = ['/api/save-score', '/api/upload-avatar', '/api/update-profile']
+
+@pytest.mark.parametrize('path', WRITES)
+def test_anonymous_writes_are_rejected_before_admission(app_module, client, monkeypatch, path):
+    def admit(user_key):
+        raise AssertionError('anonymous request reached admission')
+    monkeypatch.setattr(app_module.write_admission, 'admit', admit)
+    assert client.post(path, json={}).status_code == 401
+
+def test_signed_in_writes_are_admitted(app_module, signup, monkeypatch):
+    client, email = signup()
+    keys = []
+    admit = app_module.write_admission.admit
+    monkeypatch.setattr(app_module.write_admission, 'admit', lambda key: keys.append(key) or admit(key))
+    resp = client.post('/api/save-score', json={'game_type': 'memory', 'score': 5})
+    assert resp.status_code == 200
+    assert keys == [email]
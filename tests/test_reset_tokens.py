@@ -0,0 +1,77 @@
+# Reset token store: expiry, single use, revocation, sweeping and migration
+
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from reset_tokens import ResetTokenStore
+
+@pytest.fixture
+def store(tmp_path):
+    return ResetTokenStore(str(tmp_path / 'tokens.sqlite3'), ttl=60, sweep_interval=0, batch_size=3)
+
+def rows(store):
+    return store._connect().execute('SELECT COUNT(*) FROM reset_tokens').fetchone()[0]
+
+def expire(store, token):
+    store._connect().execute('UPDATE reset_tokens SET expires_at = ? WHERE token = ?', (time.time() - 1, token))
+
+def test_token_is_single_use(store):
+    token = store.create('a@example.com')
+    assert store.lookup(token) == 'a@example.com'
+    assert store.consume(token) == 'a@example.com'
+    assert store.consume(token) is None and store.lookup(token) is None
+    assert store.lookup('made-up') is None
+
+def test_expired_token_is_dead_before_it_is_swept(store):
+    token = store.create('a@example.com')
+    expire(store, token)
+    assert store.lookup(token) is None
+    assert store.consume(token) is None
+    assert rows(store) == 1
+
+def test_revoke_drops_every_token_for_the_email(store):
+    tokens = [store.create('a@example.com') for _ in range(2)]
+    other = store.create('b@example.com')
+    assert store.revoke('a@example.com') == 2
+    assert all(store.lookup(token) is None for token in tokens)
+    assert store.lookup(other) == 'b@example.com'
+
+def test_sweep_removes_only_expired_tokens_in_batches(store):
+    expired = [store.create(f'{i}@example.com') for i in range(7)]
+    live = store.create('live@example.com')
+    for token in expired:
+        expire(store, token)
+    # 7 rows at batch_size 3: three DELETEs
+    assert store.sweep() == 7
+    assert rows(store) == 1 and store.lookup(live) == 'live@example.com'
+    assert store.sweep() == 0
+    assert store.counters()['swept'] == 7
+
+def test_sweeper_thread_purges_on_its_own(tmp_path):
+    store = ResetTokenStore(str(tmp_path / 'tokens.sqlite3'), ttl=0.05, sweep_interval=0.05)
+    store.create('a@example.com')
+    store.start()
+    for _ in range(100):
+        if not rows(store):
+            break
+        time.sleep(0.02)
+    assert rows(store) == 0
+
+def test_legacy_json_is_migrated_once(tmp_path):
+    legacy = tmp_path / 'reset_tokens.json'
+    now = datetime.now()
+    legacy.write_text(json.dumps({
+        'live': {'email': 'a@example.com', 'created_at': now.isoformat(),
+                 'expires_at': (now + timedelta(hours=1)).isoformat()},
+        'expired': {'email': 'b@example.com', 'created_at': (now - timedelta(days=2)).isoformat(),
+                    'expires_at': (now - timedelta(days=1)).isoformat()},
+        'broken': {'email': 'c@example.com'},
+    }))
+    store = ResetTokenStore(str(tmp_path / 'tokens.sqlite3'), legacy_file=str(legacy))
+    assert store.lookup('live') == 'a@example.com'
+    assert store.lookup('expired') is None and rows(store) == 1
+    assert not legacy.exists() and os.path.exists(f'{legacy}.migrated')
@@ -0,0 +1,91 @@
+# Display-name search: the sorted-key trie, typo tolerance, paging and
+# merging per-shard results
+
+import pytest
+
+from search import UserSearchIndex, merge_pages, normalize_name
+
+NAMES = {
+    'ada@example.com': 'Ada Lovelace',
+    'alan@example.com': 'Alan Turing',
+    'alana@example.com': 'Alana Smith',
+    'grace@example.com': 'Grace Hopper',
+    'edsger@example.com': 'Edsger Dijkstra',
+    'zoe@example.com': 'Zoë Ångström',
+}
+
+def make_index(names=NAMES):
+    users = {user_id: {'display_name': name} for user_id, name in names.items()}
+    index = UserSearchIndex('secret', lambda: dict(users),
+                            lambda ids: {user_id: users.get(user_id) for user_id in ids})
+    return index, users
+
+def names(results):
+    return [result['display_name'] for result in results]
+
+def test_normalize_name():
+    assert normalize_name('  Zoë   ÅNGSTRÖM ') == 'zoe angstrom'
+
+def test_prefix_matches_any_word_start():
+    index, _ = make_index()
+    assert names(index.search('ala')[0]) == ['Alan Turing', 'Alana Smith']
+    assert names(index.search('lov')[0]) == ['Ada Lovelace']
+    assert names(index.search('ANGS')[0]) == ['Zoë Ångström']
+    assert index.search('')[0] == [] and index.search('xyz')[0] == []
+
+def test_typos_one_edit_away():
+    index, _ = make_index()
+    for query in ('grcae', 'grae', 'gruce', 'hoppper', 'dijsktra'):
+        results, _ = index.search(query)
+        assert results and all(r['typo'] for r in results), query
+    # Prefix matches win over typo matches
+    assert not any(r['typo'] for r in index.search('alan')[0])
+    # Too short for typo matching
+    assert index.search('qz')[0] == []
+
+def test_paging():
+    index, _ = make_index({f'p{i}@example.com': f'Player {i:02d}' for i in range(25)})
+    first, more = index.search('player', 0, 10)
+    second, _ = index.search('player', 10, 10)
+    last, no_more = index.search('player', 20, 10)
+    assert more and not no_more
+    assert names(first + second + last) == [f'Player {i:02d}' for i in range(25)]
+
+def test_invalidations_are_applied():
+    index, users = make_index()
+    assert index.search('grace')[0]
+    users['grace@example.com'] = {'display_name': 'Amazing Grace'}
+    users['new@example.com'] = {'display_name': 'Barbara Liskov'}
+    del users['ada@example.com']
+    for user_id in ('grace@example.com', 'new@example.com', 'ada@example.com'):
+        index.invalidate(user_id)
+    assert names(index.search('amaz')[0]) == ['Amazing Grace']
+    assert names(index.search('lisk')[0]) == ['Barbara Liskov']
+    assert index.search('lovelace')[0] == []
+    assert index.resolve(index.public_id('new@example.com')) == ('new@example.com', 'Barbara Liskov')
+
+def test_public_ids_are_stable_and_opaque():
+    index, _ = make_index()
+    public_id = index.public_id('ada@example.com')
+    assert public_id == make_index()[0].public_id('ada@example.com')
+    assert 'ada' not in public_id
+    assert UserSearchIndex('other', dict, dict).public_id('ada@example.com') != public_id
+
+@pytest.mark.parametrize('query', ['a', 'al', 'player', 'grcae', 'zz'])
+@pytest.mark.parametrize('offset,limit', [(0, 3), (2, 3), (0, 50)])
+def test_merged_shards_match_one_index(query, offset, limit):
+    everyone = dict(NAMES, **{f'p{i}@example.com': f'Player {i}' for i in range(12)},
+                    **{f'a{i}@example.com': f'Al {i}' for i in range(7)})
+    whole, _ = make_index(everyone)
+    ids = sorted(everyone)
+    shards = [make_index({u: everyone[u] for u in ids[i::3]})[0] for i in range(3)]
+    wanted = offset + limit + 1
+    merged = merge_pages([shard.matches(query, wanted) for shard in shards], offset, limit)
+    assert merged == whole.search(query, offset, limit)
+
+def test_typo_matches_are_dropped_when_another_shard_has_prefix_matches():
+    exact, _ = make_index({'grace@example.com': 'Grace Hopper'})
+    near, _ = make_index({'grice@example.com': 'Grice Smith'})
+    assert near.matches('grace', 10)[1] is True
+    results, _ = merge_pages([near.matches('grace', 10), exact.matches('grace', 10)], 0, 10)
+    assert names(results) == ['Grace Hopper'] and not results[0]['typo']
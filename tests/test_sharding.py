@@ -0,0 +1,247 @@
+# Hash ring placement and the peer-only /internal API
+
+import pytest
+
+from sharding import HashRing, ShardRouter, plan_rebalance, rebalance
+
+KEYS = [f'user{i}@example.com' for i in range(5000)]
+
+# ============================================================================
+# HASH RING
+# ============================================================================
+
+def test_placement_is_deterministic():
+    a, b = HashRing(['a', 'b', 'c']), HashRing(['c', 'b', 'a'])
+    assert all(a.node_for(k) == b.node_for(k) for k in KEYS)
+
+def test_keys_spread_over_all_nodes():
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    counts = {}
+    for key in KEYS:
+        counts[ring.node_for(key)] = counts.get(ring.node_for(key), 0) + 1
+    assert set(counts) == {'a', 'b', 'c', 'd'}
+    assert min(counts.values()) > len(KEYS) / 4 * 0.5
+
+def test_adding_a_node_only_moves_keys_to_it():
+    old, new = HashRing(['a', 'b', 'c']), HashRing(['a', 'b', 'c', 'd'])
+    moves = plan_rebalance(old, new, KEYS)
+    assert moves and all(dst == 'd' for _, dst in moves.values())
+    # About a quarter of the keys move, not most of them
+    assert len(moves) < len(KEYS) * 0.4
+
+def test_removing_a_node_only_moves_its_keys():
+    old, new = HashRing(['a', 'b', 'c']), HashRing(['a', 'b'])
+    moves = plan_rebalance(old, new, KEYS)
+    assert {src for src, _ in moves.values()} == {'c'}
+    assert len(moves) == sum(1 for k in KEYS if old.node_for(k) == 'c')
+
+def test_remove_node_matches_a_fresh_ring():
+    ring = HashRing(['a', 'b', 'c'])
+    ring.remove_node('b')
+    fresh = HashRing(['a', 'c'])
+    assert all(ring.node_for(k) == fresh.node_for(k) for k in KEYS)
+
+def test_empty_ring_raises():
+    with pytest.raises(LookupError):
+        HashRing().node_for('x')
+
+# ============================================================================
+# ROUTER
+# ============================================================================
+
+NODES = {'a': 'http://a.invalid', 'b': 'http://b.invalid'}
+
+def test_sharded_router_requires_a_secret():
+    with pytest.raises(ValueError):
+        ShardRouter('a', NODES, None)
+    with pytest.raises(ValueError):
+        ShardRouter('a', NODES, '')
+
+def test_unsharded_router_accepts_no_peers():
+    router = ShardRouter(None, {}, None)
+    assert not router.enabled and not router.accepts_peers
+    assert not router.is_peer('anything')
+    # Even a configured secret doesn't open the peer API without a ring
+    assert not ShardRouter(None, {}, 's3cret').is_peer('s3cret')
+
+def test_is_peer_checks_the_secret():
+    router = ShardRouter('a', NODES, 's3cret')
+    assert router.is_peer('s3cret')
+    assert not router.is_peer('s3cre')
+    assert not router.is_peer('')
+    assert not router.is_peer(None)
+
+def test_rebalance_requires_a_secret():
+    with pytest.raises(ValueError):
+        rebalance(ShardRouter(None, NODES, None), NODES)
+
+# ============================================================================
+# /internal GATING
+# ============================================================================
+
+INTERNAL = [
+    ('GET', '/internal/users', None),
+    ('GET', '/internal/users/export?user_id=x@example.com', None),
+    ('GET', '/internal/leaderboard/memory', None),
+    ('POST', '/internal/users/import', {'user_id': 'x@example.com'}),
+    ('POST', '/internal/users/delete', {'user_id': 'x@example.com'}),
+    ('POST', '/internal/ring', {'nodes': {}}),
+    ('POST', '/internal/invalidate', {'keys': []}),
+]
+
+@pytest.mark.parametrize('method,path,body', INTERNAL)
+def test_internal_is_404_when_unsharded(app_module, client, method, path, body):
+    assert not app_module.shard_router.enabled
+    for secret in (None, app_module.app.secret_key, ''):
+        headers = {'X-Shard-Secret': secret} if secret is not None else {}
+        resp = client.open(path, method=method, json=body, headers=headers)
+        assert resp.status_code == 404, (path, secret)
+
+@pytest.fixture
+def sharded(app_module, monkeypatch):
+    router = ShardRouter('a', NODES, 's3cret')
+    # Every test user hashes to this node, so nothing is forwarded
+    monkeypatch.setattr(router, 'is_local', lambda user_id: True)
+    monkeypatch.setattr(app_module, 'shard_router', router)
+    return router
+
+def test_internal_needs_the_shard_secret(sharded, client, app_module):
+    for secret in (None, app_module.app.secret_key, 'wrong'):
+        headers = {'X-Shard-Secret': secret} if secret else {}
+        assert client.get('/internal/users', headers=headers).status_code == 404
+    resp = client.get('/internal/users', headers={'X-Shard-Secret': 's3cret'})
+    assert resp.status_code == 200
+    assert isinstance(resp.json, list)
+
+def test_owner_ignores_email_case():
+    router = ShardRouter('a', {**NODES, 'c': 'http://c.invalid'}, 's3cret')
+    for key in KEYS[:500]:
+        assert router.owner(key.upper()) == router.owner(f'  {key} ') == router.owner(key)
+    moves = plan_rebalance(HashRing(['a', 'b']), HashRing(['a', 'b', 'c']), [k.upper() for k in KEYS])
+    assert set(moves) == {k.upper() for k in plan_rebalance(HashRing(['a', 'b']), HashRing(['a', 'b', 'c']), KEYS)}
+
+def test_search_merges_every_node(sharded, signup, client, monkeypatch):
+    from urllib.parse import parse_qs, urlsplit
+
+    from search import UserSearchIndex
+
+    signup(display_name='Quentin Local')
+    peer_users = {'q@elsewhere.example': {'display_name': 'Quentin Remote'}}
+    peer = UserSearchIndex('s', lambda: peer_users, lambda ids: {i: peer_users.get(i) for i in ids})
+    paths = []
+
+    def call(node, path, payload=None):
+        paths.append((node, path))
+        args = parse_qs(urlsplit(path).query)
+        return list(peer.matches(args['q'][0], int(args['limit'][0])))
+    monkeypatch.setattr(sharded, 'call', call)
+
+    resp = client.get('/api/users/search?q=quentin')
+    assert [r['display_name'] for r in resp.json['results']] == ['Quentin Local', 'Quentin Remote']
+    assert [node for node, _ in paths] == ['b']
+    assert paths[0][1].startswith('/internal/users/search?')
+
+def test_internal_search_answers_peers(sharded, signup, client):
+    signup(display_name='Wilhelmina Peer')
+    resp = client.get('/internal/users/search?q=wilhel&limit=5', headers={'X-Shard-Secret': 's3cret'})
+    matches, typo = resp.json
+    assert not typo and [m[2] for m in matches] == ['Wilhelmina Peer']
+
+def test_profile_of_a_user_on_another_node(sharded, client, monkeypatch):
+    remote = ['Remote Rita', {'header': [3, '<h1>Rita header</h1>'], 'stats': [1, '<p>Rita stats</p>'],
+                              'recent': [1, ''], 'badges': [0, '']}]
+    paths = []
+
+    def call(node, path, payload=None):
+        paths.append(path)
+        return remote if path == '/internal/profile/rita-id' else None
+    monkeypatch.setattr(sharded, 'call', call)
+
+    resp = client.get('/profile/rita-id')
+    assert resp.status_code == 200
+    assert b'Rita header' in resp.data and b'Rita stats' in resp.data
+    assert client.get('/profile/nobody-id').status_code == 404
+    assert paths == ['/internal/profile/rita-id', '/internal/profile/nobody-id']
+
+def test_internal_profile_answers_only_for_local_users(sharded, signup, client, app_module):
+    _, email = signup(display_name='Local Lou')
+    public_id = app_module.user_search.public_id(email)
+    headers = {'X-Shard-Secret': 's3cret'}
+    display_name, fragments = client.get(f'/internal/profile/{public_id}', headers=headers).json
+    assert display_name == 'Local Lou' and 'Local Lou' in fragments['header'][1]
+    assert client.get('/internal/profile/unknown', headers=headers).json is None
+
+# ============================================================================
+# REBALANCING
+# ============================================================================
+
+class FakeCluster:
+    """Nodes answering the peer API in memory, closed like the app's when outside the ring"""
+
+    def __init__(self, nodes, users):
+        self.routers = {name: ShardRouter(name, nodes, 's3cret') for name in nodes}
+        ring = HashRing(nodes)
+        self.users = {name: set() for name in nodes}
+        for user_id in users:
+            self.users[ring.node_for(user_id)].add(user_id)
+
+    def add(self, name, nodes):
+        self.routers[name] = ShardRouter(name, nodes, 's3cret')
+        self.users[name] = set()
+
+    def call(self, router, node, path, payload=None):
+        from urllib.error import HTTPError
+        if not self.routers[node].is_peer(router.secret):
+            raise HTTPError(path, 404, 'Not Found', {}, None)
+        users = self.users[node]
+        if path == '/internal/users':
+            return sorted(users)
+        if path.startswith('/internal/users/export'):
+            from urllib.parse import parse_qs, urlsplit
+            return {'user_id': parse_qs(urlsplit(path).query)['user_id'][0]}
+        if path == '/internal/users/import':
+            users.add(payload['user_id'])
+        elif path == '/internal/users/delete':
+            users.discard(payload['user_id'])
+        elif path == '/internal/ring':
+            self.routers[node].set_nodes(payload['nodes'])
+        return {'success': True}
+
+    def placement_errors(self, nodes):
+        ring = HashRing(nodes)
+        held = [(name, user_id) for name, users in self.users.items() for user_id in users]
+        return [(name, user_id) for name, user_id in held if name not in nodes or ring.node_for(user_id) != name]
+
+@pytest.fixture
+def cluster(monkeypatch):
+    nodes = {name: f'http://{name}.invalid' for name in 'abc'}
+    cluster = FakeCluster(nodes, KEYS[:600])
+    monkeypatch.setattr(ShardRouter, 'call', lambda router, node, path, payload=None:
+                        cluster.call(router, node, path, payload))
+    return cluster, nodes
+
+def test_rebalance_onto_a_new_node(cluster):
+    cluster, nodes = cluster
+    grown = {**nodes, 'd': 'http://d.invalid'}
+    cluster.add('d', grown)
+    moved = rebalance(ShardRouter(None, nodes, 's3cret'), grown)
+    assert moved and {dst for _, _, dst in moved} == {'d'}
+    assert cluster.placement_errors(grown) == []
+    assert sum(map(len, cluster.users.values())) == 600
+
+def test_rebalance_removing_a_node(cluster):
+    cluster, nodes = cluster
+    shrunk = {name: url for name, url in nodes.items() if name != 'b'}
+    held_by_b = set(cluster.users['b'])
+    moved = rebalance(ShardRouter(None, nodes, 's3cret'), shrunk)
+    assert {user_id for user_id, _, _ in moved} == held_by_b
+    assert cluster.users['b'] == set()
+    assert cluster.placement_errors(shrunk) == []
+    assert sum(map(len, cluster.users.values())) == 600
+    # The removed node has left the ring and closed its peer API
+    assert not cluster.routers['b'].accepts_peers
+
+def test_rebalance_down_to_one_node(cluster):
+    cluster, nodes = cluster
+    rebalance(ShardRouter(None, nodes, 's3cret'), {'a': nodes['a']})
+    assert cluster.users['a'] == set(KEYS[:600])
@@ -0,0 +1,85 @@
+# Leaderboard snapshots: binary round trip, rank lookups and remapping
+
+import os
+import time
+
+import pytest
+
+from snapshots import LeaderboardSnapshot, SnapshotReader, SnapshotWriter, write_snapshot
+
+def entry(user_id, score, name=None, games_played=1):
+    return {'user_id': user_id, 'display_name': name or user_id.split('@')[0], 'score': score,
+            'games_played': games_played}
+
+RANKINGS = {
+    'memory': [entry('zed@example.com', 12), entry('amy@example.com', 9.5, 'Amélie'), entry('bob@example.com', 9)],
+    'stroop_test': [entry('amy@example.com', 100, 'Amélie', games_played=40)],
+    'tbi_memory': [],
+}
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'leaderboards.bin')
+    write_snapshot(path, RANKINGS, generated_at=1234.5)
+    return path
+
+def test_round_trip(path):
+    snapshot = LeaderboardSnapshot(path)
+    assert snapshot.generated_at == 1234.5
+    assert snapshot.top('memory', 10) == RANKINGS['memory']
+    assert snapshot.top('memory', 2) == RANKINGS['memory'][:2]
+    assert snapshot.top('stroop_test') == RANKINGS['stroop_test']
+    assert snapshot.top('tbi_memory') == [] and snapshot.top('chess') == []
+    assert snapshot.count('memory') == 3 and snapshot.count('chess') == 0
+    # Names shared across games are stored once
+    assert open(path, 'rb').read().count('Amélie'.encode()) == 1
+
+def test_rank_lookup(path):
+    snapshot = LeaderboardSnapshot(path)
+    assert snapshot.rank('memory', 'zed@example.com') == (1, RANKINGS['memory'][0])
+    assert snapshot.rank('memory', 'bob@example.com') == (3, RANKINGS['memory'][2])
+    assert snapshot.rank('memory', 'nobody@example.com') is None
+    assert snapshot.rank('tbi_memory', 'bob@example.com') is None
+    assert snapshot.rank('chess', 'bob@example.com') is None
+
+def test_not_a_snapshot(tmp_path):
+    bogus = tmp_path / 'bogus.bin'
+    bogus.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        LeaderboardSnapshot(str(bogus))
+
+def test_reader_remaps_a_replaced_file(path):
+    reader = SnapshotReader(path, check_interval=0)
+    first = reader.get()
+    assert reader.get() is first
+    write_snapshot(path, {'memory': [entry('new@example.com', 50)]})
+    second = reader.get()
+    assert second is not first
+    assert second.top('memory') == [entry('new@example.com', 50)]
+    # The old mapping stays valid for whoever still holds it
+    assert first.top('memory') == RANKINGS['memory']
+    os.remove(path)
+    assert reader.get() is None
+
+def test_only_one_writer_holds_the_lock(path):
+    writers = [SnapshotWriter(path, lambda: RANKINGS) for _ in range(2)]
+    assert writers[0]._is_leader()
+    assert not writers[1]._is_leader()
+
+def test_app_reads_a_fresh_snapshot_only(app_module, client):
+    path = app_module.snapshot_writer.path
+    ghost = {'stroop_test': [entry('ghost@example.com', 10 ** 6, 'Snapshot Ghost')]}
+
+    def top_names(generated_at):
+        write_snapshot(path, ghost, generated_at=generated_at)
+        app_module.snapshot_reader._checked_at = 0
+        board = client.get('/api/leaderboards/stroop_test?limit=1').json['leaderboard']
+        return [row['display_name'] for row in board]
+
+    try:
+        assert top_names(time.time()) == ['Snapshot Ghost']
+        # Abandoned by its writer: computed live instead
+        assert top_names(time.time() - 2 * app_module.snapshot_writer.max_age) != ['Snapshot Ghost']
+    finally:
+        os.remove(path)
+        app_module.snapshot_reader._checked_at = 0
@@ -0,0 +1,99 @@
+# Stale-while-revalidate: bounded waits, fallback to the last good value
+
+import threading
+import time
+
+import pytest
+
+from stale import StaleWhileRevalidate
+
+def deadline(seconds=0.05):
+    return time.monotonic() + seconds
+
+class Slow:
+    """A computation that finishes only once released"""
+
+    def __init__(self, value):
+        self.value = value
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        assert self.release.wait(5)
+        return self.value
+
+@pytest.fixture
+def swr():
+    return StaleWhileRevalidate(workers=2, max_stale=60)
+
+def test_fresh_value_within_the_deadline(swr):
+    assert swr.get('k', lambda: 1, deadline()) == (1, 0)
+    assert swr.served_fresh == 1 and swr.served_stale == 0
+
+def test_late_value_falls_back_then_replaces_it(swr):
+    swr.get('k', lambda: 'old', deadline())
+    slow = Slow('new')
+    value, age = swr.get('k', slow, deadline())
+    assert value == 'old' and age > 0
+    assert swr.served_stale == 1
+
+    # Later lookups join the refresh already running instead of starting another
+    assert swr.get('k', Slow('other'), deadline())[0] == 'old'
+    slow.release.set()
+    for _ in range(100):
+        if swr._last_good['k'][0] == 'new':
+            break
+        time.sleep(0.01)
+    assert swr.get('k', lambda: 'newer', deadline()) == ('newer', 0)
+    assert slow.calls == 1
+
+def test_nothing_to_fall_back_on_waits(swr):
+    slow = Slow('first')
+    threading.Timer(0.1, slow.release.set).start()
+    assert swr.get('k', slow, deadline(0.01)) == ('first', 0)
+
+def test_too_old_value_is_not_served(swr):
+    swr.max_stale = 0
+    swr.remember('k', 'old')
+    time.sleep(0.01)
+    slow = Slow('new')
+    threading.Timer(0.1, slow.release.set).start()
+    assert swr.get('k', slow, deadline(0.01)) == ('new', 0)
+
+def test_failed_refresh_serves_the_last_good_value(swr):
+    swr.remember('k', 'old')
+
+    def broken():
+        raise RuntimeError('disk on fire')
+    assert swr.get('k', broken, deadline())[0] == 'old'
+    with pytest.raises(RuntimeError):
+        StaleWhileRevalidate().get('k', broken, deadline())
+
+def test_last_good_values_are_bounded():
+    swr = StaleWhileRevalidate(max_entries=2)
+    for key in 'abc':
+        swr.remember(key, key)
+    assert list(swr._last_good) == ['b', 'c']
+
+# ============================================================================
+# PAGES
+# ============================================================================
+
+def test_slow_leaderboard_renders_from_the_last_good_board(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'STALE_BUDGET', 0.05)
+    app_module.leaderboard_cache.clear()
+    fresh = client.get('/leaderboards')
+    assert fresh.status_code == 200 and 'Age' not in fresh.headers
+
+    # A scores.json rewrite holds up the recompute
+    slow = Slow(None)
+    compute = app_module.get_leaderboard
+    monkeypatch.setattr(app_module, 'get_leaderboard', lambda *args: slow() or compute(*args))
+    app_module.leaderboard_cache.clear()
+    try:
+        stale = client.get('/leaderboards')
+        assert stale.status_code == 200
+        assert int(stale.headers['Age']) >= 0 and stale.headers['Cache-Control'] == 'no-cache'
+    finally:
+        slow.release.set()
@@ -0,0 +1,67 @@
+# Session user snapshots: version counters, avatars, and when the store is read
+
+import base64
+
+from user_session import AvatarStore, UserVersions
+
+PNG = base64.b64encode(b'\x89PNG\r\n\x1a\n' + b'\0' * 16).decode()
+
+def test_versions_are_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'versions.sqlite3')
+    a, b = UserVersions(path), UserVersions(path)
+    assert a.get('u') == 0
+    assert a.bump('u') == 1 and b.bump('u') == 2
+    assert a.get('u') == 2 and a.get('other') == 0
+
+def test_avatars_are_content_addressed(tmp_path):
+    store = AvatarStore(str(tmp_path / 'avatars'))
+    name = store.store(f'data:image/png;base64,{PNG}')
+    assert name.endswith('.png') and (tmp_path / 'avatars' / name).exists()
+    assert store.store(f'data:image/png;base64,{PNG}') == name
+    assert store.store(f'data:image/svg+xml;base64,{PNG}') is None
+    assert store.store('data:image/png;base64,not base64!') is None
+    assert store.store(None) is None
+
+def count_reads(app_module, monkeypatch):
+    reads = []
+    get = app_module.user_directory.get
+
+    def counting(user_id, *args):
+        reads.append(user_id)
+        return get(user_id, *args)
+    monkeypatch.setattr(app_module.user_directory, 'get', counting)
+    return reads
+
+def test_snapshot_spares_the_user_store(app_module, signup, monkeypatch):
+    player, email = signup(display_name='Snap Shot')
+    player.get('/dashboard')
+    reads = count_reads(app_module, monkeypatch)
+    for _ in range(3):
+        resp = player.get('/dashboard')
+        assert b'Snap Shot' in resp.data
+    assert reads == []
+
+def test_version_bump_refreshes_every_session(app_module, signup, monkeypatch):
+    player, email = signup(display_name='Before Rename')
+    other_device = app_module.app.test_client()
+    other_device.post('/login', data={'email': email, 'password': 'password1'})
+    assert b'Before Rename' in other_device.get('/dashboard').data
+
+    assert player.post('/api/update-profile', json={'display_name': 'After Rename'}).json['success']
+    reads = count_reads(app_module, monkeypatch)
+    page = other_device.get('/dashboard').data
+    assert b'After Rename' in page and b'Before Rename' not in page
+    assert reads == [email]
+    with other_device.session_transaction() as session:
+        assert session['user_snapshot']['version'] == app_module.user_versions.get(email)
+
+def test_avatar_in_snapshot_is_served_immutable(app_module, signup):
+    player, email = signup()
+    assert player.post('/api/upload-avatar', json={'avatar': f'data:image/png;base64,{PNG}'}).json['success']
+    player.get('/dashboard')
+    with player.session_transaction() as session:
+        name = session['user_snapshot']['avatar']
+    assert f'/avatar/{name}'.encode() in player.get('/dashboard').data
+    resp = player.get(f'/avatar/{name}')
+    assert resp.status_code == 200 and 'immutable' in resp.headers['Cache-Control']
+    assert 'Set-Cookie' not in resp.headers
@@ -0,0 +1,90 @@
+# Brain Games - Session User Snapshots
+# Per-user version counters and content-addressed avatar files, so pages can
+# render the navbar from a snapshot in the (signed) session cookie instead of
+# reading the user store on every request
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import threading
+
+from sqlite_conn import LocalConnection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_versions (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# No SVG: it can carry script
+AVATAR_TYPES = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/gif': 'gif', 'image/webp': 'webp'}
+DATA_URL = re.compile(r'data:(image/[a-z]+);base64,(.*)', re.S)
+
+# ============================================================================
+# VERSIONS
+# ============================================================================
+
+class UserVersions:
+    """A counter per user, bumped whenever anything a snapshot holds changes.
+
+    Shared by every process pointing at the same file; get() is one
+    primary-key read and bump() one upsert. Users never bumped are at 0.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connect = LocalConnection(path)
+        self._init_schema()
+
+    def _init_schema(self):
+        try:
+            self._connect().executescript(SCHEMA)
+        except Exception as e:
+            print(f"[ERROR] Failed to initialize user versions: {e}")
+
+    def get(self, user_id):
+        row = self._connect().execute('SELECT version FROM user_versions WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, user_id):
+        return self._connect().execute(
+            'INSERT INTO user_versions VALUES (?, 1) '
+            'ON CONFLICT (user_id) DO UPDATE SET version = version + 1 RETURNING version',
+            (user_id,)).fetchone()[0]
+
+# ============================================================================
+# AVATARS
+# ============================================================================
+
+class AvatarStore:
+    """Avatar images written once per distinct image as `<directory>/<digest>.<ext>`.
+
+    Users keep their avatar as the data URL the browser uploaded; store()
+    decodes it to a file named by its content hash, which can then be
+    served with a long-lived cache header.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def store(self, data_url):
+        """Write the image if new and return its '<digest>.<ext>' name, or None if it isn't one"""
+        match = DATA_URL.fullmatch(data_url or '')
+        if not match or match.group(1) not in AVATAR_TYPES:
+            return None
+        try:
+            image = base64.b64decode(match.group(2), validate=True)
+        except (binascii.Error, ValueError):
+            return None
+        name = f'{hashlib.sha256(image).hexdigest()[:20]}.{AVATAR_TYPES[match.group(1)]}'
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f'{path}.tmp.{os.getpid()}.{threading.get_ident()}'
+            with open(tmp_path, 'wb') as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+        return name